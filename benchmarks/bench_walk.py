@@ -0,0 +1,160 @@
+"""
+Benchmark the `os.scandir` tree walker against the old `filecmp.dircmp` recursion.
+
+Builds two synthetic trees that share most of their files and times how long
+each implementation takes to produce the `left`/`right`/`both` report.
+
+Usage:
+    python benchmarks/bench_walk.py --files 2000000 --files-per-dir 10
+"""
+
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import foldercompare  # noqa: E402
+
+
+def legacy_recursive_dircmp(folder1, folder2, prefix1=".", prefix2="."):
+    """
+    The `filecmp.dircmp` based implementation the walker replaced.
+
+    Args:
+        folder1: String with the directory of left folder.
+        folder2: String with the directory of right folder.
+        prefix1: String with the prefix of the directory 1 being searched.
+        prefix2: String with the prefix of the directory 2 being searched.
+
+    Returns:
+        data: Dictionary with the file comparison.
+    """
+
+    comparison = filecmp.dircmp(folder1, folder2)
+
+    data = {
+        "left": ["{}{}{}".format(prefix1, os.sep, i) for i in comparison.left_only],
+        "right": ["{}{}{}".format(prefix2, os.sep, i) for i in comparison.right_only],
+        "both": [
+            "{}{}{}***{}{}{}".format(prefix1, os.sep, i, prefix2, os.sep, i)
+            for i in comparison.common_files
+        ],
+    }
+
+    for datalist in data.values():
+        datalist.sort()
+
+    for folder in comparison.common_dirs:
+        sub_folder1 = os.path.join(folder1, folder)
+        sub_folder2 = os.path.join(folder2, folder)
+        sub_report = legacy_recursive_dircmp(
+            sub_folder1,
+            sub_folder2,
+            os.path.normpath(sub_folder1),
+            os.path.normpath(sub_folder2),
+        )
+        for key, value in sub_report.items():
+            data[key] += value
+
+    return data
+
+
+def make_tree(root, files, files_per_dir, fanout, skip_every=0):
+    """
+    Create a synthetic tree of empty files.
+
+    Args:
+        root: String with the directory to create the tree in.
+        files: Integer with the total number of files.
+        files_per_dir: Integer with the number of files in each directory.
+        fanout: Integer with the number of sub folders per directory.
+        skip_every: Integer, leave out every n-th file to create differences.
+
+    Returns:
+        Nothing.
+    """
+
+    directories = max(1, files // files_per_dir)
+    for index in range(directories):
+        # Lay directories out as a `fanout`-ary tree
+        parts = []
+        node = index
+        while node:
+            parts.append("d{}".format(node % fanout))
+            node //= fanout
+        path = os.path.join(root, *reversed(parts))
+        os.makedirs(path, exist_ok=True)
+        for number in range(files_per_dir):
+            if skip_every and (index * files_per_dir + number) % skip_every == 0:
+                continue
+            open(os.path.join(path, "f{}.dat".format(number)), "w").close()
+
+
+def timed(function, *args):
+    """
+    Run a function and return its result and elapsed wall time in seconds.
+
+    Args:
+        function: Callable to run.
+        *args: Arguments for the callable.
+
+    Returns:
+        Tuple with the result and the elapsed time.
+    """
+
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=200_000)
+    parser.add_argument("--files-per-dir", type=int, default=10)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--workdir", default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="foldercompare-bench-", dir=args.workdir)
+    try:
+        folder1 = os.path.join(workdir, "left")
+        folder2 = os.path.join(workdir, "right")
+        print("Creating {} files per tree in {}".format(args.files, workdir))
+        make_tree(folder1, args.files, args.files_per_dir, args.fanout)
+        make_tree(folder2, args.files, args.files_per_dir, args.fanout, skip_every=97)
+
+        results = {}
+        for name, function, workers in (
+            ("filecmp.dircmp", legacy_recursive_dircmp, None),
+            ("scandir walker", foldercompare._recursive_dircmp, 1),
+            ("parallel walker", foldercompare._recursive_dircmp, args.workers),
+        ):
+            extra = () if workers is None else (workers,)
+            best = None
+            for _ in range(args.repeat):
+                report, elapsed = timed(
+                    function, folder1, folder2, folder1, folder2, *extra
+                )
+                best = elapsed if best is None else min(best, elapsed)
+            results[name] = (report, best)
+            print("{:<16} {:>10.3f} s".format(name, best))
+
+        legacy, walker = results["filecmp.dircmp"][0], results["scandir walker"][0]
+        parallel = results["parallel walker"][0]
+        assert legacy == walker == parallel, "Reports differ between implementations"
+        for name in ("scandir walker", "parallel walker"):
+            speedup = results["filecmp.dircmp"][1] / results[name][1]
+            print("Speedup of {}: {:.2f}x".format(name, speedup))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Benchmark suite timing the traversal, content comparison and report phases.
+
+For every shape of `treegen.SHAPES` a pair of folders is generated and each
+phase is measured on its own: wall and CPU time, read syscalls and bytes read
+(from /proc/self/io, Linux only), directories listed and, in a second run
+under tracemalloc, the peak of Python memory. Content comparison runs in
+process so that its reads are counted. Results are written as JSON so
+they can be compared against a baseline to catch regressions.
+
+Usage:
+    python benchmarks/suite.py --output bench.json
+    python benchmarks/suite.py --shape wide --shape huge --baseline bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import foldercompare
+import treegen
+
+
+def read_io():
+    """
+    Return the I/O counters of the current process.
+
+    Returns:
+        Dictionary with the read syscalls and bytes, empty if unavailable.
+    """
+
+    try:
+        with open("/proc/self/io") as file:
+            counters = dict(line.split(": ") for line in file.read().splitlines())
+    except OSError:
+        return {}
+    return {
+        "read_syscalls": int(counters["syscr"]),
+        "read_bytes": int(counters["rchar"]),
+    }
+
+
+class ScandirCounter:
+    """
+    Count the directories listed with `os.scandir` while active.
+
+    Attributes:
+        calls: Integer with the number of listings.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self._scandir = os.scandir
+
+    def __enter__(self):
+        def counting_scandir(*args, **kwargs):
+            self.calls += 1
+            return self._scandir(*args, **kwargs)
+
+        os.scandir = counting_scandir
+        return self
+
+    def __exit__(self, *exc_info):
+        os.scandir = self._scandir
+
+
+def measure(function, memory=True):
+    """
+    Run a phase and measure it.
+
+    Args:
+        function: Callable running the phase, called twice if `memory`.
+        memory: Boolean to run it again under tracemalloc for its peak memory.
+
+    Returns:
+        Tuple with the result of the first run and a dictionary of metrics.
+    """
+
+    io_before = read_io()
+    with ScandirCounter() as counter:
+        cpu = time.process_time()
+        wall = time.perf_counter()
+        result = function()
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+    io_after = read_io()
+
+    metrics = {"wall_s": wall, "cpu_s": cpu, "scandir_calls": counter.calls}
+    for key, value in io_after.items():
+        metrics[key] = value - io_before[key]
+
+    if memory:
+        tracemalloc.start()
+        function()
+        metrics["peak_python_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result, metrics
+
+
+def run_shape(shape, workdir, args):
+    """
+    Generate the folders of a shape and measure every phase on them.
+
+    Args:
+        shape: String with the name of the shape.
+        workdir: String with the directory to generate the folders in.
+        args: argparse.Namespace with the options of the suite.
+
+    Returns:
+        List of dictionaries, one per phase.
+    """
+
+    root = os.path.join(workdir, shape)
+    folder1, folder2 = treegen.generate(root, shape, args.scale, args.diff)
+    output = os.path.join(root, "report")
+
+    def traversal():
+        return foldercompare.compare_trees(folder1, folder2, workers=args.workers)
+
+    def content():
+        return foldercompare._compare_contents(pairs)
+
+    def report():
+        writers = [
+            foldercompare._PlainTextWriter(folder1, folder2, output),
+            foldercompare._CsvWriter(folder1, folder2, output),
+        ]
+        for entry in result:
+            for writer in writers:
+                writer.add(entry)
+        for writer in writers:
+            writer.finish()
+            writer.close()
+
+    rows = []
+    result, metrics = measure(traversal, args.memory)
+    rows.append(dict(phase="traversal", **metrics))
+
+    # The listing of the common files is not part of the content phase
+    trees = foldercompare._open_tree(folder1), foldercompare._open_tree(folder2)
+    pairs = [
+        pair
+        for _, _, _, common_files, _, _ in foldercompare._walk_trees(*trees)
+        for pair in common_files
+    ]
+    same, metrics = measure(content, args.memory)
+    rows.append(dict(phase="content", **metrics))
+
+    _, metrics = measure(report, args.memory)
+    rows.append(dict(phase="report", **metrics))
+
+    counts = result.counts()
+    for row in rows:
+        row.update(
+            shape=shape,
+            entries=len(result),
+            only_left=counts["left"],
+            only_right=counts["right"],
+            different=same.count(False),
+        )
+    return rows
+
+
+def check_baseline(rows, baseline_path, tolerance):
+    """
+    Compare wall times against a previous run of the suite.
+
+    Args:
+        rows: List of dictionaries of the current run.
+        baseline_path: String with the JSON file of the previous run.
+        tolerance: Float with the allowed relative slowdown.
+
+    Returns:
+        List of strings describing the phases that got slower.
+    """
+
+    with open(baseline_path) as file:
+        baseline = {
+            (row["shape"], row["phase"]): row for row in json.load(file)["results"]
+        }
+
+    regressions = []
+    for row in rows:
+        previous = baseline.get((row["shape"], row["phase"]))
+        if previous and row["wall_s"] > previous["wall_s"] * (1 + tolerance):
+            regressions.append(
+                "{shape}/{phase}: {old:.3f} s -> {new:.3f} s".format(
+                    shape=row["shape"],
+                    phase=row["phase"],
+                    old=previous["wall_s"],
+                    new=row["wall_s"],
+                )
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--shape", action="append", choices=sorted(treegen.SHAPES))
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--diff", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--no-memory", dest="memory", action="store_false")
+    parser.add_argument("--workdir", default=None)
+    parser.add_argument("--output", default=None, help="JSON file, default stdout")
+    parser.add_argument("--baseline", default=None, help="JSON file of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="foldercompare-suite-", dir=args.workdir)
+    try:
+        rows = []
+        for shape in args.shape or sorted(treegen.SHAPES):
+            rows.extend(run_shape(shape, workdir, args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    document = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "scale": args.scale,
+            "diff_percent": args.diff,
+            "workers": args.workers,
+        },
+        "results": rows,
+    }
+    text = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        regressions = check_baseline(rows, args.baseline, args.tolerance)
+        for regression in regressions:
+            print("Slower than baseline: " + regression, file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Generate pairs of synthetic folders to benchmark the comparison engine.
+
+Every shape describes how files are laid out; a given percentage of the files
+is made different between the left and the right folder (a third only in the
+left one, a third only in the right one, a third with the same size but a
+different last byte).
+
+Usage:
+    python benchmarks/treegen.py /tmp/trees --shape deep --scale 10 --diff 5
+"""
+
+import argparse
+import os
+import random
+import zipfile
+
+# branches: top-level folders, multiplied by the scale
+# depth: folders nested in every branch, each one with `files` files
+# sizes: range of file sizes in bytes
+# zip: compare '.zip' files of the folders instead of the folders
+SHAPES = {
+    "wide": {"branches": 500, "depth": 1, "files": 20, "sizes": (0, 4096)},
+    "deep": {"branches": 4, "depth": 250, "files": 10, "sizes": (0, 4096)},
+    "tiny": {"branches": 100, "depth": 2, "files": 100, "sizes": (0, 64)},
+    "huge": {"branches": 1, "depth": 1, "files": 4, "sizes": (32 << 20, 32 << 20)},
+    "zip": {"branches": 50, "depth": 2, "files": 20, "sizes": (0, 4096), "zip": True},
+}
+
+
+def layout(shape, scale=1):
+    """
+    Yield the files of a shape.
+
+    Args:
+        shape: Dictionary with the description of the shape.
+        scale: Number multiplying the number of branches, at least one.
+
+    Yields:
+        String with the path of every file relative to the folder.
+    """
+
+    for branch in range(max(1, round(shape["branches"] * scale))):
+        reldir = "b{}".format(branch)
+        for level in range(shape["depth"]):
+            if level:
+                reldir = os.path.join(reldir, "d{}".format(level))
+            for number in range(shape["files"]):
+                yield os.path.join(reldir, "f{}.dat".format(number))
+
+
+def generate(root, shape="wide", scale=1, diff_percent=1.0, seed=0):
+    """
+    Create the left and right folders of a shape.
+
+    Args:
+        root: String with the directory to create the folders in.
+        shape: String with the name of one of `SHAPES`.
+        scale: Number multiplying the number of branches, at least one.
+        diff_percent: Float with the percentage of files that differ.
+        seed: Integer seeding the file contents and differences.
+
+    Returns:
+        Tuple with the paths of the left and right folders, or '.zip' files.
+    """
+
+    spec = SHAPES[shape]
+    rng = random.Random(seed)
+    folders = [os.path.join(root, "left"), os.path.join(root, "right")]
+    share = diff_percent / 3
+
+    for relpath in layout(spec, scale):
+        content = rng.randbytes(rng.randint(*spec["sizes"]))
+        roll = rng.random() * 100
+        sides = [content, content]
+        if roll < share:
+            sides[1] = None
+        elif roll < 2 * share:
+            sides[0] = None
+        elif roll < 3 * share and content:
+            sides[1] = content[:-1] + bytes([content[-1] ^ 0xFF])
+
+        for folder, data in zip(folders, sides):
+            if data is None:
+                continue
+            path = os.path.join(folder, relpath)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(data)
+
+    if spec.get("zip"):
+        folders = [_zip_folder(folder) for folder in folders]
+
+    return tuple(folders)
+
+
+def _zip_folder(folder):
+    """
+    Store a folder in a '.zip' file next to it.
+
+    Args:
+        folder: String with the directory to store.
+
+    Returns:
+        String with the path of the '.zip' file.
+    """
+
+    archive_path = folder + ".zip"
+    with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for dirpath, _, filenames in os.walk(folder):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                archive.write(path, os.path.relpath(path, folder))
+    return archive_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("root")
+    parser.add_argument("--shape", choices=sorted(SHAPES), default="wide")
+    parser.add_argument("--scale", type=float, default=1)
+    parser.add_argument("--diff", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for path in generate(args.root, args.shape, args.scale, args.diff, args.seed):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
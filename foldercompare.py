@@ -1,256 +1,5620 @@
 """Compare the content of two folders and create report(s) of result."""
 
+import argparse
+import array
+import asyncio
+import concurrent.futures
+import contextlib
+import cProfile
 import csv
+import datetime
 import filecmp
+import fnmatch
+import functools
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import lzma
 import os
+import pickle
+import re
+import signal
+import sqlite3
+import stat
+import struct
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import tracemalloc
 import zipfile
-import shutil
+import zlib
 
 
-def compare(folder1, folder2, output, output_txt=False, output_csv=False):
+# Names skipped while walking, the same defaults `filecmp.dircmp` uses
+IGNORED_NAMES = frozenset(filecmp.DEFAULT_IGNORES)
+
+# Bytes hashed from the start and from the end of a file for the partial hash
+PARTIAL_HASH_SIZE = 16 * 1024
+
+# Default limit for the size of the HashCache database
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+# Cache hits whose last use is written to the HashCache at once
+CACHE_FLUSH_SIZE = 10_000
+
+# Common files whose content is compared at once
+CONTENT_BATCH_SIZE = 4096
+
+# Smallest and largest block read by `_compare_files`, it grows in between
+# while larger reads make the storage faster
+COMPARE_MIN_BLOCK_SIZE = 1024 * 1024
+COMPARE_MAX_BLOCK_SIZE = 16 * 1024 * 1024
+
+# Report rows kept in memory by a writer before spilling them to disk
+SPILL_BUFFER_SIZE = 10_000
+
+# Rows of a row group of the '.parquet' report
+PARQUET_ROW_GROUP_SIZE = 100_000
+
+# First line of a manifest, followed by the JSON header
+MANIFEST_MAGIC = b"FOLDERCOMPARE-MANIFEST 1\n"
+
+# Extension of the manifest files, they are recognized by their magic though
+MANIFEST_SUFFIX = ".fcm"
+
+# Names of the files looked into like folders with `archives`, in lower case
+ARCHIVE_SUFFIXES = (
+    ".zip",
+    ".tar",
+    ".tar.gz",
+    ".tgz",
+    ".tar.bz2",
+    ".tbz2",
+    ".tar.xz",
+    ".txz",
+)
+
+# FIEMAP ioctl of Linux listing the extents of a file, flushed first so that
+# pending writes are mapped, the most extents compared for clones, and the
+# flags of extents whose physical offset does not tell where the content is:
+# unknown, delayed allocation, encoded (compressed or encrypted), not aligned
+# and inline
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP_FLAG_SYNC = 0x1
+FIEMAP_MAX_EXTENTS = 256
+FIEMAP_EXTENT_LAST = 0x1
+FIEMAP_EXTENT_UNSAFE = 0x2 | 0x4 | 0x8 | 0x100 | 0x200
+
+# Minimum seconds between two calls of a progress callback
+PROGRESS_INTERVAL = 0.1
+
+# Entries `compare_async` holds for a consumer falling behind
+ASYNC_MAX_PENDING = 1000
+
+# Errors of a comparison that cannot be completed: missing or unreadable
+# folders, corrupt archives or manifests, an unusable cache
+COMPARISON_ERRORS = (
+    OSError,
+    ValueError,
+    EOFError,
+    sqlite3.Error,
+    zipfile.BadZipFile,
+    tarfile.TarError,
+    zlib.error,
+    lzma.LZMAError,
+)
+
+# Statuses of an Entry, their index is the code stored by ComparisonResult
+STATUSES = ("left", "right", "both", "identical", "different", "moved")
+
+# Columns of the reports with one row per entry
+ENTRY_COLUMNS = (
+    "status",
+    "path",
+    "type",
+    "size1",
+    "size2",
+    "mtime1",
+    "mtime2",
+    "target",
+    "offset",
+)
+
+
+def compare(
+    folder1,
+    folder2,
+    output,
+    output_txt=False,
+    output_csv=False,
+    workers=1,
+    compare_content=False,
+    hash_workers=None,
+    cache=None,
+    progress=None,
+    cancel=None,
+    detect_moves=False,
+    prune=False,
+    filter=None,
+    stats=None,
+    archives=False,
+    executor=None,
+    delta=False,
+    output_entries=False,
+    output_sqlite=False,
+    output_parquet=False,
+    result=None,
+):
+    """
+    Compare contents of two folders and write a report of the results.
+
+    Args:
+        folder1: String with the directory or '.zip' file of left folder.
+        folder2: String with the directory or '.zip' file of right folder.
+        output: Description of parameter `output`.
+        output_txt: Boolean variable to create an '.txt' file.
+        output_csv: Boolean variable to create an '.csv' file.
+        workers: Integer with the number of threads listing directories, use
+            more than one for trees on network shares.
+        compare_content: Boolean to tell identical and different files apart
+            among the files present in both folders.
+        hash_workers: Integer with the number of processes hashing files,
+            defaults to the number of CPUs.
+        cache: HashCache or string with the path of its database, to reuse the
+            digests of files that did not change since a previous run.
+        progress: Optional callable receiving a Progress while comparing.
+        cancel: Optional threading.Event to stop the comparison from another
+            thread.
+        detect_moves: Boolean to report files only in one folder that have
+            the same content as a file only in the other one as moved.
+        prune: Boolean to report common sub folders with the same Merkle
+            digest on both sides as identical without walking them, for
+            '.zip' files and manifests.
+        filter: Optional Filter with the rules selecting the entries to
+            compare, applied while walking.
+        stats: Optional Stats filled with the timings and counters of the
+            comparison, writing the reports included.
+        archives: Boolean to compare the '.zip' and '.tar' files present in
+            both folders like sub folders, archives inside them included.
+        executor: Optional concurrent.futures.Executor hashing files, shared
+            with other comparisons, `hash_workers` is not used with it.
+        delta: Boolean to save the results in `output` + '.state' and write
+            the changes since the previous run saved there to an '.delta.txt'
+            file.
+        output_entries: Boolean to create an '.entries.csv' file with one row
+            per entry.
+        output_sqlite: Boolean to create an '.sqlite' database with one row
+            per entry, indexed by path and status.
+        output_parquet: Boolean to create a '.parquet' file with one row per
+            entry, needs pyarrow.
+        result: Optional ComparisonResult the entries are appended to as they
+            are found, for a viewer reading it from another thread.
+
+    Raises:
+        Cancelled: If `cancel` was set, the partial reports are removed.
+
+    Returns:
+        The Stats given as `stats`, None without it.
+    """
+
+    # Make filepath names for output OS-agnostic
+    folder1 = os.path.normpath(folder1)
+    folder2 = os.path.normpath(folder2)
+
+    own_cache = isinstance(cache, str)
+    if own_cache:
+        cache = HashCache(cache)
+
+    writers = []
+    finished = False
+    if stats is not None:
+        stats.start(cache)
+        stats._switch("report")
+    try:
+        for enabled, writer_class in (
+            (output_txt, _PlainTextWriter),
+            (output_csv, _CsvWriter),
+        ):
+            if enabled:
+                writers.append(
+                    writer_class(
+                        folder1, folder2, output, compare_content, detect_moves
+                    )
+                )
+        for enabled, writer_class in (
+            (delta, _DeltaWriter),
+            (output_entries, _EntryCsvWriter),
+            (output_sqlite, _SqliteWriter),
+            (output_parquet, _ParquetWriter),
+        ):
+            if enabled:
+                writers.append(writer_class(folder1, folder2, output))
+
+        results = _iter_comparison(
+            folder1,
+            folder2,
+            workers,
+            compare_content=compare_content,
+            hash_workers=hash_workers,
+            cache=cache,
+            progress=progress,
+            cancel=cancel,
+            detect_moves=detect_moves,
+            prune=prune,
+            filter=filter,
+            stats=stats,
+            archives=archives,
+            executor=executor,
+        )
+        for entry in results:
+            for writer in writers:
+                writer.add(entry)
+            if result is not None:
+                result.append(entry)
+
+        for writer in writers:
+            writer.finish()
+        finished = True
+    finally:
+        for writer in writers:
+            writer.close()
+            # Do not leave a truncated report behind a cancelled or failed run
+            if not finished:
+                os.remove(writer.path)
+        if stats is not None:
+            stats.stop(cache)
+        if own_cache:
+            cache.close()
+
+    return stats
+
+
+class HashCache:
+    """
+    On-disk cache of file digests, reused while a file's stat does not change.
+
+    Digests are stored in a SQLite database, one row per absolute path along
+    with the size, mtime_ns and inode they were computed for. A row whose stat
+    no longer matches the file is ignored and overwritten. When the database
+    grows over `max_size` bytes the least recently used rows are evicted.
+
+    Args:
+        path: String with the path of the SQLite database file.
+        max_size: Integer with the maximum size of the database in bytes.
+        pending: Optional _PendingHashes shared with the caches of comparisons
+            running at the same time, so a file they all read is hashed once.
+
+    Attributes:
+        hits: Integer with the number of digests found in the cache.
+        misses: Integer with the number of digests not found in the cache.
+    """
+
+    def __init__(self, path, max_size=DEFAULT_CACHE_SIZE, pending=None):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._pending = pending
+        self._used = []
+        self._run = time.time_ns()
+        # Opened by one thread, possibly used by the one of `compare_async`
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS digests (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                partial BLOB,
+                full BLOB,
+                used INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS digests_used ON digests (used);
+            """
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get(self, path, stat):
+        """
+        Return the cached digests of a file if its stat did not change.
+
+        Args:
+            path: String with the path of the file.
+            stat: os.stat_result of the file.
+
+        Returns:
+            Tuple with the partial and full digests, None for the missing ones.
+        """
+
+        path = os.path.abspath(path)
+        row = self._connection.execute(
+            "SELECT partial, full FROM digests"
+            " WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+            (path, stat.st_size, stat.st_mtime_ns, stat.st_ino),
+        ).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None, None
+
+        self.hits += 1
+        self._used.append((self._run, path))
+        if len(self._used) >= CACHE_FLUSH_SIZE:
+            self._flush()
+        return row
+
+    def put_many(self, items):
+        """
+        Store digests of files, keeping the other digest if the stat matches.
+
+        Args:
+            items: Iterable of tuples with the path, os.stat_result, partial
+                digest and full digest of a file (None for unknown digests).
+
+        Returns:
+            Nothing.
+        """
+
+        with self._connection:
+            self._connection.executemany(
+                """
+                INSERT INTO digests VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET
+                    partial = CASE WHEN size = excluded.size
+                        AND mtime_ns = excluded.mtime_ns AND inode = excluded.inode
+                        THEN coalesce(excluded.partial, partial)
+                        ELSE excluded.partial END,
+                    full = CASE WHEN size = excluded.size
+                        AND mtime_ns = excluded.mtime_ns AND inode = excluded.inode
+                        THEN coalesce(excluded.full, full)
+                        ELSE excluded.full END,
+                    size = excluded.size,
+                    mtime_ns = excluded.mtime_ns,
+                    inode = excluded.inode,
+                    used = excluded.used
+                """,
+                (
+                    (
+                        os.path.abspath(path),
+                        stat.st_size,
+                        stat.st_mtime_ns,
+                        stat.st_ino,
+                        partial,
+                        full,
+                        self._run,
+                    )
+                    for path, stat, partial, full in items
+                ),
+            )
+
+    def claim(self, files, partial):
+        """
+        Split files in the ones to hash and the ones already hashed elsewhere.
+
+        Without a shared `pending`, every file is to hash.
+
+        Args:
+            files: List of tuples with the path and os.stat_result of a file.
+            partial: Boolean for the partial digests instead of the full ones.
+
+        Returns:
+            Tuple with the list of the files to hash, to `release` afterwards,
+            and a dictionary mapping the paths of the other files to a
+            concurrent.futures.Future of their digest.
+        """
+
+        if self._pending is None:
+            return files, {}
+        return self._pending.claim(files, partial)
+
+    def release(self, files, partial, digests):
+        """
+        Hand the digests of claimed files to the comparisons waiting for them.
+
+        Args:
+            files: List of tuples with the path and os.stat_result of the
+                files returned by `claim`.
+            partial: Boolean given to `claim`.
+            digests: List of the digests of the files, None for the ones that
+                could not be hashed.
+
+        Returns:
+            Nothing.
+        """
+
+        if self._pending is not None:
+            self._pending.release(files, partial, digests)
+
+    def invalidate(self, folder):
+        """
+        Drop the cached digests of every file under a folder.
+
+        Args:
+            folder: String with the directory to forget.
+
+        Returns:
+            Nothing.
+        """
+
+        prefix = os.path.join(os.path.abspath(folder), "")
+        with self._connection:
+            self._connection.execute(
+                "DELETE FROM digests WHERE substr(path, 1, ?) = ?",
+                (len(prefix), prefix),
+            )
+
+    def clear(self):
+        """
+        Drop every cached digest.
+
+        Returns:
+            Nothing.
+        """
+
+        with self._connection:
+            self._connection.execute("DELETE FROM digests")
+        self._connection.execute("VACUUM")
+
+    def evict(self):
+        """
+        Drop the least recently used digests until the cache fits `max_size`.
+
+        Returns:
+            Nothing.
+        """
+
+        while self._size() > self.max_size:
+            with self._connection:
+                deleted = self._connection.execute(
+                    "DELETE FROM digests WHERE path IN (SELECT path FROM digests"
+                    " ORDER BY used LIMIT max(1, (SELECT count(*) FROM digests) / 10))"
+                ).rowcount
+            if not deleted:
+                break
+
+    def close(self):
+        """
+        Record which digests were used, evict old ones and close the database.
+
+        Returns:
+            Nothing.
+        """
+
+        self._flush()
+        self.evict()
+        self._connection.close()
+
+    def _flush(self):
+        """
+        Write the last use of the digests found since the previous flush.
+
+        Returns:
+            Nothing.
+        """
+
+        with self._connection:
+            self._connection.executemany(
+                "UPDATE digests SET used = ? WHERE path = ?", self._used
+            )
+        self._used = []
+
+    def _size(self):
+        """
+        Return the bytes used by the rows of the database.
+
+        Returns:
+            Integer with the size in bytes, free pages excluded.
+        """
+
+        pages, free, page_size = (
+            self._connection.execute(f"PRAGMA {pragma}").fetchone()[0]
+            for pragma in ("page_count", "freelist_count", "page_size")
+        )
+        return (pages - free) * page_size
+
+
+class _PendingHashes:
+    """
+    Digests of files being hashed, shared by the HashCache of concurrent pairs.
+
+    Pairs look their files up in the cache before any of them stored a digest,
+    so the first pair claiming a file hashes it and the other ones wait for
+    its digest. Digests are kept for the lifetime of the object, a pair
+    claiming a file after it was hashed gets its digest right away.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def claim(self, files, partial):
+        """
+        Split files in the ones to hash and the ones claimed by another pair.
+
+        Args:
+            files: List of tuples with the path and os.stat_result of a file.
+            partial: Boolean for the partial digests instead of the full ones.
+
+        Returns:
+            Tuple with the list of the files to hash and a dictionary mapping
+            the paths of the other files to a Future of their digest.
+        """
+
+        claimed = []
+        waiting = {}
+        with self._lock:
+            for path, file_stat in files:
+                key = self._key(path, file_stat, partial)
+                if key in self._futures:
+                    waiting[path] = self._futures[key]
+                else:
+                    self._futures[key] = concurrent.futures.Future()
+                    claimed.append((path, file_stat))
+        return claimed, waiting
+
+    def release(self, files, partial, digests):
+        """
+        Set the digests of claimed files.
+
+        A file that could not be hashed is forgotten and its waiting pairs get
+        None, to hash it themselves.
+
+        Args:
+            files: List of tuples with the path and os.stat_result of the
+                claimed files.
+            partial: Boolean given to `claim`.
+            digests: List of the digests of the files, None if unknown.
+
+        Returns:
+            Nothing.
+        """
+
+        with self._lock:
+            futures = []
+            for (path, file_stat), digest in zip(files, digests):
+                key = self._key(path, file_stat, partial)
+                if digest is None:
+                    futures.append(self._futures.pop(key))
+                else:
+                    futures.append(self._futures[key])
+        for future, digest in zip(futures, digests):
+            future.set_result(digest)
+
+    @staticmethod
+    def _key(path, file_stat, partial):
+        return (
+            os.path.abspath(path),
+            file_stat.st_size,
+            file_stat.st_mtime_ns,
+            file_stat.st_ino,
+            partial,
+        )
+
+
+class Filter:
+    """
+    Rules selecting the entries to compare, applied while the folders are walked.
+
+    Patterns follow the `.gitignore` syntax: a pattern without a slash matches
+    a name at any depth, a leading or inner slash anchors it to the root, a
+    trailing slash only matches directories, `*` and `?` do not cross slashes,
+    `**` does, and a later `!pattern` includes again what an earlier one
+    excluded. Blank lines and lines starting with `#` are skipped, so the
+    lines of a '.gitignore' file can be passed as they are. All patterns are
+    compiled once; an excluded directory is never listed, nor is anything
+    inside it.
+
+    Args:
+        exclude: Iterable of strings with the patterns of entries to skip.
+        include: Iterable of strings with patterns, files matching none of them
+            are skipped. Directories are walked unless excluded.
+        min_size: Integer with the size in bytes below which files are skipped.
+        max_size: Integer with the size in bytes above which files are skipped.
+        newer_than: Float with a timestamp, files modified before are skipped.
+        older_than: Float with a timestamp, files modified after are skipped.
+
+    Raises:
+        ValueError: If a pattern cannot be compiled.
+    """
+
+    def __init__(
+        self,
+        exclude=(),
+        include=(),
+        min_size=None,
+        max_size=None,
+        newer_than=None,
+        older_than=None,
+    ):
+        self._rules = [_compile_pattern(pattern) for pattern in exclude]
+        self._rules = [rule for rule in self._rules if rule is not None]
+        self._negated = any(negate for _, negate, _ in self._rules)
+        # One regular expression per kind of entry, the rules are only looked
+        # at one by one to honour negations when it matches
+        self._exclude_files = _join_patterns(
+            regex for regex, _, dir_only in self._rules if not dir_only
+        )
+        self._exclude_dirs = _join_patterns(regex for regex, _, _ in self._rules)
+        rules = [_compile_pattern(pattern) for pattern in include]
+        self._include = _join_patterns(
+            regex for regex, _, dir_only in filter(None, rules) if not dir_only
+        )
+
+        self._min_size = min_size
+        self._max_size = max_size
+        self._newer_than = None if newer_than is None else int(newer_than * 1e9)
+        self._older_than = None if older_than is None else int(older_than * 1e9)
+        self._stat = any(
+            bound is not None for bound in (min_size, max_size, newer_than, older_than)
+        )
+
+    def apply(self, reldir, entries):
+        """
+        Keep the entries of a directory listing that pass the rules.
+
+        Args:
+            reldir: String with the directory relative to the root.
+            entries: List of os.DirEntry, _ZipEntry or _ManifestEntry.
+
+        Returns:
+            List of the entries kept, in the same order.
+        """
+
+        prefix = reldir.replace(os.sep, "/") + "/" if reldir else ""
+        kept = []
+        for entry in entries:
+            is_dir = entry.is_dir()
+            path = prefix + entry.name
+            if self._excluded(path, is_dir):
+                continue
+            if not is_dir:
+                if self._include is not None and not self._include.fullmatch(path):
+                    continue
+                if self._stat and not self._in_bounds(entry):
+                    continue
+            kept.append(entry)
+        return kept
+
+    def _excluded(self, path, is_dir):
+        """
+        Tell if the last exclude rule matching a path excludes it.
+
+        Args:
+            path: String with the path relative to the root, with slashes.
+            is_dir: Boolean, True for directories.
+
+        Returns:
+            Boolean, True if the entry is excluded.
+        """
+
+        regex = self._exclude_dirs if is_dir else self._exclude_files
+        if regex is None or not regex.fullmatch(path):
+            return False
+        if not self._negated:
+            return True
+        for regex, negate, dir_only in reversed(self._rules):
+            if (is_dir or not dir_only) and regex.fullmatch(path):
+                return not negate
+        return False
+
+    def _in_bounds(self, entry):
+        """
+        Tell if the size and mtime of a file are within the bounds.
+
+        Args:
+            entry: os.DirEntry, _ZipEntry or _ManifestEntry of a file.
+
+        Returns:
+            Boolean, True if the file is kept. Files that cannot be stat'ed
+            are kept, for the walk to report them.
+        """
+
+        try:
+            entry_stat = entry.stat()
+        except OSError:
+            return True
+        size, mtime = entry_stat.st_size, entry_stat.st_mtime_ns
+        return not (
+            (self._min_size is not None and size < self._min_size)
+            or (self._max_size is not None and size > self._max_size)
+            or (self._newer_than is not None and mtime < self._newer_than)
+            or (self._older_than is not None and mtime > self._older_than)
+        )
+
+
+class _FilteredTree:
+    """
+    Tree source listing the entries of another tree that pass a Filter.
+
+    Args:
+        tree: Tree source of the folder.
+        filter: Filter applied to every listing.
+
+    Attributes:
+        merkle: Dictionary with the Merkle digest of directories of `tree`,
+            None if it has none.
+    """
+
+    def __init__(self, tree, filter):
+        self.root = tree.root
+        self.merkle = getattr(tree, "merkle", None)
+        self._tree = tree
+        self._filter = filter
+        if hasattr(tree, "mount"):
+            self.mount = tree.mount
+
+    def list(self, reldir):
+        """
+        List a directory of the tree, skipping the entries filtered out.
+
+        Args:
+            reldir: String with the directory relative to the root.
+
+        Returns:
+            List of entries sorted by name.
+        """
+
+        return self._filter.apply(reldir, self._tree.list(reldir))
+
+
+def _compile_pattern(pattern):
+    """
+    Compile a `.gitignore` pattern into a regular expression.
+
+    Args:
+        pattern: String with the pattern.
+
+    Raises:
+        ValueError: If the pattern cannot be compiled.
+
+    Returns:
+        Tuple with the compiled regular expression for paths relative to the
+        root, with slashes, a boolean True for negated patterns and a boolean
+        True for patterns only matching directories. None for blank lines and
+        comments.
+    """
+
+    pattern = pattern.rstrip("\n").rstrip(" ")
+    if not pattern or pattern.startswith("#"):
+        return None
+    negate = pattern.startswith("!")
+    if negate:
+        pattern = pattern[1:]
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    if not pattern:
+        return None
+
+    parts = [] if anchored else ["(?:.*/)?"]
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        index += 1
+        if char == "*":
+            if pattern.startswith("*/", index):
+                parts.append("(?:.*/)?")
+                index += 2
+            elif pattern.startswith("*", index):
+                parts.append(".*")
+                index += 1
+            else:
+                parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "[" and "]" in pattern[index + 1 :]:
+            end = pattern.index("]", index + 1)
+            chars = pattern[index:end].replace("\\", "\\\\")
+            if chars[0] in "!^":
+                chars = "^" + chars[1:]
+            parts.append("[{}]".format(chars))
+            index = end + 1
+        elif char == "\\" and index < len(pattern):
+            parts.append(re.escape(pattern[index]))
+            index += 1
+        else:
+            parts.append(re.escape(char))
+
+    # Match names the way the walk does, case-insensitively on Windows
+    flags = re.IGNORECASE if os.path.normcase("A") == "a" else 0
+    try:
+        regex = re.compile("".join(parts), flags)
+    except re.error as error:
+        raise ValueError("Invalid pattern {!r}: {}".format(pattern, error))
+    return regex, negate, dir_only
+
+
+def _join_patterns(regexes):
+    """
+    Join compiled regular expressions into one matching any of them.
+
+    Args:
+        regexes: Iterable of compiled regular expressions.
+
+    Returns:
+        Compiled regular expression, None if there were none.
+    """
+
+    regexes = list(regexes)
+    if not regexes:
+        return None
+    return re.compile(
+        "|".join("(?:{})".format(regex.pattern) for regex in regexes),
+        regexes[0].flags,
+    )
+
+
+class Cancelled(Exception):
+    """Raised by a comparison whose cancel event was set."""
+
+
+class Progress:
+    """
+    Counters of a running comparison, passed to progress callbacks.
+
+    Args:
+        dirs: Integer with the number of directories listed in both folders.
+        dirs_queued: Integer with the directories found but not listed yet.
+        files: Integer with the number of entries compared.
+        bytes: Integer with the size of the entries compared.
+        elapsed: Float with the seconds since the comparison started.
+        done: Boolean, True for the last call once the comparison finished.
+    """
+
+    __slots__ = ("dirs", "dirs_queued", "files", "bytes", "elapsed", "done")
+
+    def __init__(self, dirs, dirs_queued, files, bytes, elapsed, done=False):
+        self.dirs = dirs
+        self.dirs_queued = dirs_queued
+        self.files = files
+        self.bytes = bytes
+        self.elapsed = elapsed
+        self.done = done
+
+    @property
+    def fraction(self):
+        """Float with the part of the known directories already listed."""
+
+        if self.done:
+            return 1.0
+        return self.dirs / ((self.dirs + self.dirs_queued) or 1)
+
+    @property
+    def eta(self):
+        """Float with the estimated seconds left, None before any listing."""
+
+        if self.done:
+            return 0.0
+        if not self.dirs:
+            return None
+        return self.elapsed * self.dirs_queued / self.dirs
+
+
+class _ProgressTracker:
+    """
+    Count the progress of a comparison and check its cancel event.
+
+    Args:
+        callback: Optional callable receiving a Progress.
+        cancel: Optional threading.Event to stop the comparison.
+    """
+
+    def __init__(self, callback=None, cancel=None):
+        self.callback = callback
+        self.cancel = cancel
+        self.dirs = 0
+        self.dirs_queued = 1
+        self.files = 0
+        self.bytes = 0
+        self._start = self._last = time.perf_counter()
+
+    def update(self, force=False):
+        """
+        Check the cancel event and call the callback if it is time to.
+
+        Args:
+            force: Boolean to call the callback now, marking the end.
+
+        Raises:
+            Cancelled: If the cancel event is set.
+
+        Returns:
+            Nothing.
+        """
+
+        _check_cancel(self.cancel)
+        if self.callback is None:
+            return
+
+        now = time.perf_counter()
+        if force or now - self._last >= PROGRESS_INTERVAL:
+            self._last = now
+            self.callback(
+                Progress(
+                    self.dirs,
+                    self.dirs_queued,
+                    self.files,
+                    self.bytes,
+                    now - self._start,
+                    done=force,
+                )
+            )
+
+
+class Stats:
+    """
+    Timings and counters of comparisons, to tune workers and cache sizes.
+
+    Pass it to `compare`, `compare_trees` or the command line. The time is
+    split in phases: "open" reads the listing of '.zip' files and manifests,
+    "walk" lists and merges directories, "content" compares common files,
+    "moves" matches moved files and "report" is the time spent by the consumer
+    of the results, writing the reports for `compare`. CPU time is the one of
+    this process; hashing processes are counted in `worker_cpu_s` once they
+    end. Counters add up over the comparisons the object was passed to.
+
+    Args:
+        profile: Boolean to run cProfile, on the thread calling `compare`.
+        trace_memory: Boolean to trace the peak of Python memory with
+            tracemalloc, which slows the comparison down.
+
+    Attributes:
+        phases: Dictionary mapping the name of every phase to a dictionary with
+            its "wall_s" and "cpu_s".
+        dirs: Integer with the number of directories walked in both folders.
+        dirs_listed: Integer with the directories of the filesystem listed.
+        files: Integer with the number of results.
+        statuses: Dictionary with the number of results of every status.
+        files_listed: Integer with the files of the filesystem listed, each
+            one costs a stat call on POSIX (`os.DirEntry` caches it).
+        files_hashed: Integer with the number of files hashed or CRC'ed.
+        bytes_hashed: Integer with the bytes read to hash files.
+        bytes_compared: Integer with the bytes read to compare files byte by
+            byte, up to their first difference.
+        bytes_skipped: Integer with the bytes of both sides of the files found
+            identical without reading, hard links or clones.
+        cache_hits: Integer with the digests found in the HashCache.
+        cache_misses: Integer with the digests not found in the HashCache.
+        worker_cpu_s: Float with the CPU seconds of the hashing processes.
+        peak_memory: Integer with the peak of Python memory in bytes, None
+            without `trace_memory`.
+        profile: cProfile.Profile of the comparisons, None without `profile`.
+    """
+
+    def __init__(self, profile=False, trace_memory=False):
+        self.phases = {}
+        self.dirs = 0
+        self.dirs_listed = 0
+        self.files = 0
+        self.statuses = dict.fromkeys(STATUSES, 0)
+        self.files_listed = 0
+        self.files_hashed = 0
+        self.bytes_hashed = 0
+        self.bytes_compared = 0
+        self.bytes_skipped = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.worker_cpu_s = 0.0
+        self.peak_memory = None
+        self.profile = cProfile.Profile() if profile else None
+        self._trace_memory = trace_memory
+        self._phase = None
+        self._started = None
+
+    @property
+    def cache_hit_rate(self):
+        """Float with the part of the digests found in the cache, None if unused."""
+
+        lookups = self.cache_hits + self.cache_misses
+        return self.cache_hits / lookups if lookups else None
+
+    def start(self, cache=None):
+        """
+        Start measuring a comparison.
+
+        Args:
+            cache: Optional HashCache used by the comparison.
+
+        Returns:
+            Nothing.
+        """
+
+        children = os.times()
+        self._started = (
+            children.children_user + children.children_system,
+            (cache.hits, cache.misses) if cache is not None else (0, 0),
+            self._trace_memory and not tracemalloc.is_tracing(),
+        )
+        if self._started[2]:
+            tracemalloc.start()
+        if self.profile is not None:
+            self.profile.enable()
+        self._switch("open")
+
+    def stop(self, cache=None):
+        """
+        Stop measuring a comparison.
+
+        Args:
+            cache: Optional HashCache used by the comparison.
+
+        Returns:
+            Nothing.
+        """
+
+        self._switch(None)
+        if self.profile is not None:
+            self.profile.disable()
+
+        children_cpu, (hits, misses), own_tracing = self._started
+        children = os.times()
+        self.worker_cpu_s += children.children_user + children.children_system
+        self.worker_cpu_s -= children_cpu
+        if cache is not None:
+            self.cache_hits += cache.hits - hits
+            self.cache_misses += cache.misses - misses
+        if self._trace_memory and tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+            self.peak_memory = max(self.peak_memory or 0, peak)
+            if own_tracing:
+                tracemalloc.stop()
+
+    def as_dict(self):
+        """
+        Return the timings and counters as a dictionary for JSON.
+
+        Returns:
+            Dictionary with the phases, counters and cache hit rate.
+        """
+
+        return {
+            "phases": self.phases,
+            "dirs": self.dirs,
+            "dirs_listed": self.dirs_listed,
+            "files": self.files,
+            "statuses": self.statuses,
+            "files_listed": self.files_listed,
+            "files_hashed": self.files_hashed,
+            "bytes_hashed": self.bytes_hashed,
+            "bytes_compared": self.bytes_compared,
+            "bytes_skipped": self.bytes_skipped,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_hit_rate": self.cache_hit_rate,
+            "worker_cpu_s": self.worker_cpu_s,
+            "peak_memory": self.peak_memory,
+        }
+
+    def write_json(self, path):
+        """
+        Write the timings and counters to a JSON file.
+
+        Args:
+            path: String with the path of the file.
+
+        Returns:
+            Nothing.
+        """
+
+        with open(path, "w") as file:
+            json.dump(self.as_dict(), file, indent=2)
+            file.write("\n")
+
+    def _switch(self, phase):
+        """
+        Add the time since the last switch to the current phase and change it.
+
+        Args:
+            phase: String with the name of the phase starting, None to stop.
+
+        Returns:
+            String with the name of the phase that ended.
+        """
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        if self._phase is not None:
+            totals = self.phases.setdefault(self._phase, {"wall_s": 0.0, "cpu_s": 0.0})
+            totals["wall_s"] += wall - self._wall
+            totals["cpu_s"] += cpu - self._cpu
+        previous, self._phase = self._phase, phase
+        self._wall, self._cpu = wall, cpu
+        return previous
+
+
+class Entry:
+    """
+    A file or folder in the result of a comparison.
+
+    Sizes and mtimes are None for the side the entry is missing from and for
+    entries that are not files.
+
+    Args:
+        status: String with one of `STATUSES`.
+        reldir: String with the directory relative to both roots.
+        name: String with the name of the file or folder.
+        is_dir: Boolean, True for folders.
+        size1: Integer with the size in bytes in the left folder.
+        size2: Integer with the size in bytes in the right folder.
+        mtime1: Integer with the mtime in nanoseconds in the left folder.
+        mtime2: Integer with the mtime in nanoseconds in the right folder.
+        target: String with the path in the right folder relative to its root
+            of a "moved" file, None for the other statuses.
+        offset: Integer with the first byte that differs of a "different"
+            file, None when unknown or for the other statuses.
+    """
+
+    __slots__ = (
+        "status",
+        "reldir",
+        "name",
+        "is_dir",
+        "size1",
+        "size2",
+        "mtime1",
+        "mtime2",
+        "target",
+        "offset",
+    )
+
+    def __init__(
+        self,
+        status,
+        reldir,
+        name,
+        is_dir=False,
+        size1=None,
+        size2=None,
+        mtime1=None,
+        mtime2=None,
+        target=None,
+        offset=None,
+    ):
+        self.status = status
+        self.reldir = reldir
+        self.name = name
+        self.is_dir = is_dir
+        self.size1 = size1
+        self.size2 = size2
+        self.mtime1 = mtime1
+        self.mtime2 = mtime2
+        self.target = target
+        self.offset = offset
+
+    def __repr__(self):
+        return "Entry({!r}, {!r})".format(self.status, self.relpath)
+
+    def __eq__(self, other):
+        if not isinstance(other, Entry):
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    @property
+    def relpath(self):
+        """String with the path relative to both roots."""
+
+        return os.path.join(self.reldir, self.name)
+
+    @property
+    def size(self):
+        """Integer with the size of the left file, or the right one if missing."""
+
+        return self.size2 if self.size1 is None else self.size1
+
+    def as_dict(self):
+        """
+        Return the entry as a dictionary of JSON types.
+
+        Returns:
+            Dictionary with the status, the relative path, the type ("dir" or
+            "file") and the sizes and mtimes (in ns) of both sides, plus the
+            "target" path of moved files and the first differing "offset" of
+            different files when known.
+        """
+
+        data = {
+            "status": self.status,
+            "path": self.relpath,
+            "type": "dir" if self.is_dir else "file",
+            "size1": self.size1,
+            "size2": self.size2,
+            "mtime1": self.mtime1,
+            "mtime2": self.mtime2,
+        }
+        if self.target is not None:
+            data["target"] = self.target
+        if self.offset is not None:
+            data["offset"] = self.offset
+        return data
+
+
+class ComparisonResult:
+    """
+    Compact, in-memory result of a comparison.
+
+    Directories are stored once in an interned table and every entry is a row
+    of parallel `array` columns (directory index, status code, sizes, mtimes)
+    plus its name, so paths are never repeated. Entries are rebuilt as Entry
+    objects when iterating.
+
+    Another thread may read the first `len(result)` entries while entries
+    are appended, a row only counts once all its columns are written.
+
+    Args:
+        folder1: String with the directory or '.zip' file of left folder.
+        folder2: String with the directory or '.zip' file of right folder.
+
+    Attributes:
+        dirs: List of strings with the directories relative to both roots.
+    """
+
+    def __init__(self, folder1, folder2):
+        self.folder1 = folder1
+        self.folder2 = folder2
+        self.dirs = []
+        self._dir_index = {}
+        self._names = []
+        self._dir = array.array("L")
+        self._status = array.array("B")
+        self._is_dir = array.array("B")
+        # -1 stands for None in the size and mtime columns
+        self._size1 = array.array("q")
+        self._size2 = array.array("q")
+        self._mtime1 = array.array("q")
+        self._mtime2 = array.array("q")
+        # Moves and known offsets are rare, they are kept by row
+        self._targets = {}
+        self._offsets = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    def __iter__(self):
+        return (self._entry(index) for index in range(len(self)))
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ComparisonResult index out of range")
+        return self._entry(index)
+
+    def append(self, entry):
+        """
+        Add an entry at the end of the result.
+
+        Args:
+            entry: Entry to add.
+
+        Returns:
+            Nothing.
+        """
+
+        dir_index = self._dir_index.get(entry.reldir)
+        if dir_index is None:
+            dir_index = self._dir_index[entry.reldir] = len(self.dirs)
+            self.dirs.append(entry.reldir)
+
+        index = len(self._names)
+        self._dir.append(dir_index)
+        self._status.append(STATUSES.index(entry.status))
+        self._is_dir.append(entry.is_dir)
+        for column, value in (
+            (self._size1, entry.size1),
+            (self._size2, entry.size2),
+            (self._mtime1, entry.mtime1),
+            (self._mtime2, entry.mtime2),
+        ):
+            column.append(-1 if value is None else value)
+        if entry.target is not None:
+            self._targets[index] = entry.target
+        if entry.offset is not None:
+            self._offsets[index] = entry.offset
+        # Last, the name makes the row count
+        self._names.append(entry.name)
+
+    def filter(self, status=None, pattern=None, min_size=None, max_size=None):
+        """
+        Iterate over the entries matching all the given conditions.
+
+        Args:
+            status: String or iterable of strings with the statuses to keep.
+            pattern: String with a `fnmatch` pattern for the relative path.
+            min_size: Integer with the minimum size in bytes of either side.
+            max_size: Integer with the maximum size in bytes of either side.
+
+        Yields:
+            Entry objects in the order of the comparison.
+        """
+
+        codes = None
+        if status is not None:
+            statuses = (status,) if isinstance(status, str) else status
+            codes = {STATUSES.index(name) for name in statuses}
+
+        for index in range(len(self)):
+            if codes is not None and self._status[index] not in codes:
+                continue
+            size = self._size1[index]
+            if size < 0:
+                size = self._size2[index]
+            if min_size is not None and size < min_size:
+                continue
+            if max_size is not None and not 0 <= size <= max_size:
+                continue
+
+            entry = self._entry(index)
+            if pattern is None or fnmatch.fnmatch(entry.relpath, pattern):
+                yield entry
+
+    def counts(self):
+        """
+        Count the entries of every status.
+
+        Returns:
+            Dictionary mapping every status of `STATUSES` to its count.
+        """
+
+        counts = [0] * len(STATUSES)
+        for code in self._status:
+            counts[code] += 1
+        return dict(zip(STATUSES, counts))
+
+    def status(self, index):
+        """
+        Return the status of an entry without rebuilding it.
+
+        Args:
+            index: Integer with the row of the entry.
+
+        Returns:
+            String with one of `STATUSES`.
+        """
+
+        return STATUSES[self._status[index]]
+
+    def status_code(self, index):
+        """
+        Return the status of an entry as stored, without looking it up.
+
+        Args:
+            index: Integer with the row of the entry.
+
+        Returns:
+            Integer with the position of the status in `STATUSES`.
+        """
+
+        return self._status[index]
+
+    def directory(self, index):
+        """
+        Return the directory of an entry without rebuilding it.
+
+        Args:
+            index: Integer with the row of the entry.
+
+        Returns:
+            String with the directory relative to both roots.
+        """
+
+        return self.dirs[self._dir[index]]
+
+    def name(self, index):
+        """
+        Return the name of an entry without rebuilding it.
+
+        Args:
+            index: Integer with the row of the entry.
+
+        Returns:
+            String with the name of the file or folder.
+        """
+
+        return self._names[index]
+
+    def sizes(self, index):
+        """
+        Return the sizes of an entry without rebuilding it.
+
+        Args:
+            index: Integer with the row of the entry.
+
+        Returns:
+            Tuple with the sizes in bytes in the left and right folder, None
+            for a missing side or a folder.
+        """
+
+        size1, size2 = self._size1[index], self._size2[index]
+        return None if size1 < 0 else size1, None if size2 < 0 else size2
+
+    def paths(self, entry):
+        """
+        Return the full paths of an entry in both folders.
+
+        Args:
+            entry: Entry of this result.
+
+        Returns:
+            Tuple with the left and right paths, None for a missing side.
+        """
+
+        path1 = path2 = None
+        if entry.status != "right":
+            path1 = os.path.join(self.folder1, entry.relpath)
+        if entry.status != "left":
+            path2 = os.path.join(self.folder2, entry.target or entry.relpath)
+        return path1, path2
+
+    def _entry(self, index):
+        """
+        Rebuild the Entry stored in a row.
+
+        Args:
+            index: Integer with the row.
+
+        Returns:
+            Entry of the row.
+        """
+
+        values = [
+            None if column[index] < 0 else column[index]
+            for column in (self._size1, self._size2, self._mtime1, self._mtime2)
+        ]
+        return Entry(
+            STATUSES[self._status[index]],
+            self.dirs[self._dir[index]],
+            self._names[index],
+            bool(self._is_dir[index]),
+            *values,
+            target=self._targets.get(index),
+            offset=self._offsets.get(index),
+        )
+
+
+def compare_trees(
+    folder1,
+    folder2,
+    workers=1,
+    compare_content=False,
+    hash_workers=None,
+    cache=None,
+    progress=None,
+    cancel=None,
+    detect_moves=False,
+    prune=False,
+    filter=None,
+    stats=None,
+    archives=False,
+):
+    """
+    Compare two folders and return the result instead of writing reports.
+
+    Args:
+        folder1: String with the directory or '.zip' file of left folder.
+        folder2: String with the directory or '.zip' file of right folder.
+        workers: Integer with the number of threads listing directories.
+        compare_content: Boolean to tell identical and different files apart.
+        hash_workers: Integer with the number of processes hashing files,
+            defaults to the number of CPUs.
+        cache: Optional HashCache with the digests of previous runs.
+        progress: Optional callable receiving a Progress while comparing.
+        cancel: Optional threading.Event to stop the comparison.
+        detect_moves: Boolean to report files moved between folders.
+        prune: Boolean to skip common sub folders with the same Merkle digest.
+        filter: Optional Filter selecting the entries to compare.
+        stats: Optional Stats filled with the timings and counters.
+        archives: Boolean to look into the archives present in both folders.
+
+    Raises:
+        Cancelled: If `cancel` was set.
+
+    Returns:
+        ComparisonResult with every entry of the comparison.
+    """
+
+    folder1 = os.path.normpath(folder1)
+    folder2 = os.path.normpath(folder2)
+
+    result = ComparisonResult(folder1, folder2)
+    if stats is not None:
+        stats.start(cache)
+    try:
+        for entry in _iter_comparison(
+            folder1,
+            folder2,
+            workers,
+            compare_content,
+            hash_workers,
+            cache,
+            progress,
+            cancel,
+            detect_moves,
+            prune,
+            filter,
+            stats,
+            archives,
+        ):
+            result.append(entry)
+    finally:
+        if stats is not None:
+            stats.stop(cache)
+    return result
+
+
+async def compare_async(
+    folder1,
+    folder2,
+    workers=1,
+    compare_content=False,
+    hash_workers=None,
+    cache=None,
+    progress=None,
+    detect_moves=False,
+    prune=False,
+    filter=None,
+    stats=None,
+    archives=False,
+    executor=None,
+    max_pending=ASYNC_MAX_PENDING,
+):
+    """
+    Compare two folders from asyncio, yielding every Entry as it is found.
+
+    The comparison runs on a thread of `executor` so the event loop never
+    waits on the filesystem. Sharing one executor between comparisons bounds
+    how many run at once, the others wait for a free thread. The comparison
+    also waits while `max_pending` entries are not taken yet, so a slow
+    consumer slows it down instead of filling the memory. Cancelling the task
+    iterating, or closing the iterator, stops it at the next file.
+
+    Args:
+        folder1: String with the directory or '.zip' file of left folder.
+        folder2: String with the directory or '.zip' file of right folder.
+        workers: Integer with the number of threads listing directories.
+        compare_content: Boolean to tell identical and different files apart.
+        hash_workers: Integer with the number of processes hashing files,
+            defaults to the number of CPUs.
+        cache: Optional HashCache or string with the path of its database.
+        progress: Optional callable receiving a Progress, called from the
+            thread of the comparison.
+        detect_moves: Boolean to report files moved between folders.
+        prune: Boolean to skip common sub folders with the same Merkle digest.
+        filter: Optional Filter selecting the entries to compare.
+        stats: Optional Stats filled with the timings and counters.
+        archives: Boolean to look into the archives present in both folders.
+        executor: Optional concurrent.futures.ThreadPoolExecutor running the
+            comparison, the default executor of the loop without it.
+        max_pending: Integer with the number of entries held for the consumer.
+
+    Yields:
+        Entry of every file and folder, like `compare_trees`.
+    """
+
+    folder1 = os.path.normpath(folder1)
+    folder2 = os.path.normpath(folder2)
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    slots = threading.Semaphore(max_pending)
+    cancel = threading.Event()
+
+    def run():
+        own_cache = isinstance(cache, str)
+        hash_cache = HashCache(cache) if own_cache else cache
+        if stats is not None:
+            stats.start(hash_cache)
+        try:
+            for entry in _iter_comparison(
+                folder1,
+                folder2,
+                workers,
+                compare_content,
+                hash_workers,
+                hash_cache,
+                progress,
+                cancel,
+                detect_moves,
+                prune,
+                filter,
+                stats,
+                archives,
+            ):
+                # Wait for the consumer, as long as it is still there
+                while not slots.acquire(timeout=PROGRESS_INTERVAL):
+                    _check_cancel(cancel)
+                loop.call_soon_threadsafe(queue.put_nowait, entry)
+        finally:
+            if stats is not None:
+                stats.stop(hash_cache)
+            if own_cache:
+                hash_cache.close()
+
+    def done(future):
+        # Retrieve the error of an abandoned comparison so it is not logged
+        if not future.cancelled():
+            future.exception()
+        queue.put_nowait(None)
+
+    future = loop.run_in_executor(executor, run)
+    future.add_done_callback(done)
+    try:
+        while (entry := await queue.get()) is not None:
+            slots.release()
+            yield entry
+        await future
+    finally:
+        cancel.set()
+
+
+def compare_batch(
+    jobs,
+    output_txt=False,
+    output_csv=False,
+    parallel=4,
+    workers=1,
+    compare_content=False,
+    hash_workers=None,
+    cache=None,
+    cancel=None,
+    detect_moves=False,
+    prune=False,
+    filter=None,
+    archives=False,
+    summary=None,
+    finished=None,
+    delta=False,
+):
+    """
+    Compare many pairs of folders at once and write a report for each one.
+
+    Pairs run `parallel` at a time on threads, all of them hashing on one
+    shared process pool of `hash_workers`, so the files read at once are
+    bounded by the pool and the directories listed at once by `parallel`
+    times `workers`. Every pair opens its own connection to the HashCache
+    database and they share the digests being computed: a file present in
+    several pairs is hashed by the first one, the others wait for its digest.
+    A pair that fails is recorded in the summary and the others go on.
+
+    Args:
+        jobs: Iterable of tuples with the left folder, the right folder and the
+            `output` of the reports of every pair.
+        output_txt: Boolean to create an '.txt' file per pair.
+        output_csv: Boolean to create an '.csv' file per pair.
+        parallel: Integer with the number of pairs compared at once.
+        workers: Integer with the number of threads listing directories of
+            each pair.
+        compare_content: Boolean to tell identical and different files apart.
+        hash_workers: Integer with the number of processes hashing files for
+            all the pairs, defaults to the number of CPUs.
+        cache: Optional HashCache or string with the path of its database.
+        cancel: Optional threading.Event to stop all the comparisons.
+        detect_moves: Boolean to report files moved between folders.
+        prune: Boolean to skip common sub folders with the same Merkle digest.
+        filter: Optional Filter selecting the entries to compare.
+        archives: Boolean to look into the archives present in both folders.
+        summary: Optional string with the path of a JSON file to write the
+            combined summary to.
+        finished: Optional callable receiving the summary of every pair as it
+            ends, called from the thread of the pair.
+        delta: Boolean to write the changes since the previous run of every
+            pair too, see `compare`.
+
+    Raises:
+        Cancelled: If `cancel` was set, the partial reports are removed.
+
+    Returns:
+        Dictionary with the summary of every pair in the order of `jobs`
+        under "pairs", the number of results of every status over all pairs,
+        the number of pairs that failed and the elapsed time.
+    """
+
+    cache_args = None
+    if isinstance(cache, HashCache):
+        cache_args = (cache.path, cache.max_size)
+    elif cache is not None:
+        cache_args = (cache, DEFAULT_CACHE_SIZE)
+    pending = _PendingHashes()
+    if cancel is None:
+        cancel = threading.Event()
+
+    def run(folder1, folder2, output):
+        stats = Stats()
+        started = time.perf_counter()
+        pair = {"folder1": folder1, "folder2": folder2, "output": output}
+        try:
+            pair_cache = HashCache(*cache_args, pending) if cache_args else None
+            try:
+                compare(
+                    folder1,
+                    folder2,
+                    output,
+                    output_txt,
+                    output_csv,
+                    workers,
+                    compare_content,
+                    hash_workers,
+                    pair_cache,
+                    None,
+                    cancel,
+                    detect_moves,
+                    prune,
+                    filter,
+                    stats,
+                    archives,
+                    executor,
+                    delta,
+                )
+            finally:
+                if pair_cache is not None:
+                    pair_cache.close()
+            pair["error"] = None
+        except COMPARISON_ERRORS as error:
+            pair["error"] = "{}: {}".format(type(error).__name__, error)
+        pair.update(
+            statuses=stats.statuses,
+            files=stats.files,
+            bytes_hashed=stats.bytes_hashed,
+            cache_hit_rate=stats.cache_hit_rate,
+            elapsed_s=time.perf_counter() - started,
+        )
+        if finished is not None:
+            finished(pair)
+        return pair
+
+    started = time.perf_counter()
+    executor = None
+    if compare_content or detect_moves:
+        hash_workers = hash_workers or os.cpu_count() or 1
+        if hash_workers > 1:
+            executor = _hash_pool(hash_workers)
+    pairs = concurrent.futures.ThreadPoolExecutor(
+        max_workers=parallel, thread_name_prefix="foldercompare-batch"
+    )
+    try:
+        futures = [pairs.submit(run, *job) for job in jobs]
+        results = [future.result() for future in futures]
+    except BaseException:
+        # Stop the pairs still running, on Ctrl-C too
+        cancel.set()
+        raise
+    finally:
+        pairs.shutdown(wait=True, cancel_futures=True)
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    totals = dict.fromkeys(STATUSES, 0)
+    for pair in results:
+        for status, count in pair["statuses"].items():
+            totals[status] += count
+    document = {
+        "pairs": results,
+        "statuses": totals,
+        "errors": sum(pair["error"] is not None for pair in results),
+        "elapsed_s": time.perf_counter() - started,
+    }
+    if summary is not None:
+        with open(summary, "w") as file:
+            json.dump(document, file, indent=2)
+            file.write("\n")
+    return document
+
+
+def _read_jobs(path):
+    """
+    Read a job file of `compare_batch`, one JSON object per line.
+
+    Every line has the "folder1", "folder2" and "output" of a pair, relative
+    paths are relative to the directory of the job file. Blank lines are
+    skipped.
+
+    Args:
+        path: String with the path of the job file.
+
+    Raises:
+        ValueError: If a line is not a JSON object with the three keys.
+
+    Returns:
+        List of tuples with the left folder, the right folder and the output.
+    """
+
+    base = os.path.dirname(path)
+    jobs = []
+    with open(path) as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+                jobs.append(
+                    tuple(
+                        os.path.join(base, job[key])
+                        for key in ("folder1", "folder2", "output")
+                    )
+                )
+            except (ValueError, KeyError, TypeError) as error:
+                raise ValueError(
+                    "{}:{}: invalid job: {}".format(path, number, error)
+                ) from None
+    return jobs
+
+
+def write_manifest(
+    folder, path, digests=True, hash_workers=None, cache=None, cancel=None, filter=None
+):
+    """
+    Write a manifest of a folder, to compare against later without it.
+
+    The manifest records the path, size and mtime of every entry and, with
+    `digests`, the full digest of every file (the stored CRC-32 for members
+    of a '.zip' file), in walk order, followed by the Merkle digest of every
+    directory once its content is written. It is a gzip stream after a one
+    line magic, and can be passed to `compare` and `compare_trees` in place of
+    either folder.
+
+    Args:
+        folder: String with the directory, '.zip' file or manifest to record.
+        path: String with the path of the manifest file to write,
+            `MANIFEST_SUFFIX` is added when it does not end with it.
+        digests: Boolean to record the content fingerprints of files, needed
+            to compare content against the manifest.
+        hash_workers: Integer with the number of processes hashing files,
+            defaults to the number of CPUs.
+        cache: Optional HashCache with the digests of previous runs.
+        cancel: Optional threading.Event to stop writing.
+        filter: Optional Filter selecting the entries to record.
+
+    Raises:
+        Cancelled: If `cancel` was set, the partial manifest is removed.
+
+    Returns:
+        String with the path of the manifest written.
+    """
+
+    if not path.endswith(MANIFEST_SUFFIX):
+        path += MANIFEST_SUFFIX
+    folder = os.path.normpath(folder)
+    tree = _open_tree(folder, filter, digests=digests)
+
+    executor = None
+    chunksize = 1
+    if digests:
+        hash_workers = hash_workers or os.cpu_count() or 1
+        chunksize = max(1, CONTENT_BATCH_SIZE // (4 * hash_workers))
+        if hash_workers > 1:
+            executor = _hash_pool(hash_workers)
+
+    try:
+        with open(path, "wb") as file:
+            file.write(MANIFEST_MAGIC)
+            with gzip.open(file, "wb") as stream:
+                header = {"root": folder, "digests": digests}
+                stream.write(json.dumps(header).encode() + b"\n")
+
+                # Directory digests need the fingerprints of every file
+                merkle = _MerkleBuilder() if digests else None
+                batch = []
+                for reldir, entry, _ in _tree_files(tree, "", tree.list("")):
+                    _check_cancel(cancel)
+                    batch.append((reldir, entry))
+                    if len(batch) >= CONTENT_BATCH_SIZE:
+                        stream.write(
+                            _manifest_records(
+                                batch,
+                                digests,
+                                executor,
+                                chunksize,
+                                cancel,
+                                cache,
+                                merkle,
+                            )
+                        )
+                        batch = []
+                stream.write(
+                    _manifest_records(
+                        batch, digests, executor, chunksize, cancel, cache, merkle
+                    )
+                )
+                if merkle is not None:
+                    merkle.finish()
+                    stream.write(
+                        _merkle_records(merkle).encode("utf-8", "surrogateescape")
+                    )
+    except BaseException:
+        os.remove(path)
+        raise
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    return path
+
+
+def _manifest_records(batch, digests, executor, chunksize, cancel, cache, merkle=None):
+    """
+    Encode a batch of entries as manifest records.
+
+    Args:
+        batch: List of tuples with the directory and the entry of files and
+            folders.
+        digests: Boolean to record the content fingerprints of files.
+        executor: Optional concurrent.futures.Executor to hash on.
+        chunksize: Integer with the number of files sent to a worker at once.
+        cancel: Optional threading.Event to stop hashing.
+        cache: Optional HashCache with the digests of previous runs.
+        merkle: Optional _MerkleBuilder fed with the entries, the directories
+            it completes are recorded after them.
+
+    Returns:
+        Bytes with one NUL terminated record per entry.
+    """
+
+    files = [entry for _, entry in batch if entry.is_file()]
+    fingerprints = {}
+    if digests:
+        # Archive members keep their CRC-32, other files get a full digest
+        kinds = {"crc": [], "full": []}
+        for entry in files:
+            kind = "crc" if "crc" in _stored_fingerprints(entry) else "full"
+            kinds[kind].append(entry)
+        for kind, entries in kinds.items():
+            values = _fingerprints(entries, kind, executor, chunksize, cancel, cache)
+            fingerprints.update(zip(map(id, entries), ((kind, v) for v in values)))
+
+    records = []
+    for reldir, entry in batch:
+        relpath = os.path.join(reldir, entry.name).replace(os.sep, "/")
+        kind, value = fingerprints.get(id(entry), (None, None))
+        if merkle is not None:
+            merkle.add(reldir, entry, (kind, value))
+        if entry.is_dir():
+            records.append("d\t\t\t\t\t{}\0".format(relpath))
+            continue
+
+        entry_stat = entry.stat()
+        records.append(
+            "f\t{}\t{}\t{}\t{}\t{}\0".format(
+                entry_stat.st_size,
+                entry_stat.st_mtime_ns,
+                "{:08x}".format(value) if kind == "crc" else "",
+                value.hex() if kind == "full" else "",
+                relpath,
+            )
+        )
+    if merkle is not None:
+        records.append(_merkle_records(merkle))
+    return "".join(records).encode("utf-8", "surrogateescape")
+
+
+def _merkle_records(merkle):
+    """
+    Encode the directory digests completed by a _MerkleBuilder and drop them.
+
+    Args:
+        merkle: _MerkleBuilder fed with the entries of a manifest.
+
+    Returns:
+        String with one NUL terminated record per directory.
+    """
+
+    records = [
+        "m\t\t\t\t{}\t{}\0".format(digest.hex(), reldir.replace(os.sep, "/"))
+        for reldir, digest in merkle.digests
+    ]
+    merkle.digests = []
+    return "".join(records)
+
+
+class _MerkleBuilder:
+    """
+    Compute the Merkle digests of directories from the entries of a walk.
+
+    Entries come in the order of `_tree_files`, a directory right before its
+    content, so only the directories on the path to the current entry are open
+    and a directory is complete as soon as an entry of a parent shows up.
+
+    Attributes:
+        digests: List of tuples with the directory relative to the root and
+            its Merkle digest, in the order the directories were completed.
+    """
+
+    def __init__(self):
+        # Path, running digest and entry of the open directories
+        self._open = [("", _new_hash(), None)]
+        self.digests = []
+
+    def add(self, reldir, entry, fingerprint=None):
+        """
+        Add the next entry of the walk.
+
+        Args:
+            reldir: String with the directory of the entry relative to the root.
+            entry: os.DirEntry, _ZipEntry or _ManifestEntry.
+            fingerprint: Tuple with the kind and value of the fingerprint of a
+                file, as returned by `_fingerprints`.
+
+        Returns:
+            Nothing.
+        """
+
+        self._close(reldir)
+        if entry.is_dir():
+            self._open.append((os.path.join(reldir, entry.name), _new_hash(), entry))
+        else:
+            self._open[-1][1].update(_merkle_record(entry, fingerprint))
+
+    def finish(self):
+        """
+        Complete the open directories, down to the root.
+
+        Returns:
+            Nothing.
+        """
+
+        self._close(None)
+        self.digests.append(("", self._open.pop()[1].digest()))
+
+    def _close(self, reldir):
+        """
+        Complete the open directories that are not `reldir` or a parent of it.
+
+        Args:
+            reldir: String with the directory of the next entry, None to close
+                every directory but the root.
+
+        Returns:
+            Nothing.
+        """
+
+        while len(self._open) > 1 and self._open[-1][0] != reldir:
+            path, merkle, entry = self._open.pop()
+            digest = merkle.digest()
+            self.digests.append((path, digest))
+            self._open[-1][1].update(_merkle_record(entry, digest))
+
+
+class _DirectoryTree:
+    """
+    Tree source listing a directory of the filesystem with `os.scandir`.
+
+    Args:
+        root: String with the directory.
+        stats: Optional Stats counting the directories and files listed.
+    """
+
+    def __init__(self, root, stats=None):
+        self.root = root
+        self.stats = stats
+
+    def list(self, reldir):
+        """
+        List a directory of the tree, skipping the `filecmp` ignored names.
+
+        Args:
+            reldir: String with the directory relative to the root.
+
+        Returns:
+            List of os.DirEntry sorted by name.
+        """
+
+        entries = _list_dir(os.path.join(self.root, reldir))
+        if self.stats is not None:
+            self.stats.dirs_listed += 1
+            self.stats.files_listed += sum(not entry.is_dir() for entry in entries)
+        return entries
+
+
+class _ZipEntry:
+    """
+    A member or directory of a '.zip' file, with the os.DirEntry interface.
+
+    Args:
+        name: String with the name of the file or directory.
+        path: String with the path of the archive joined with the member name.
+        info: zipfile.ZipInfo of the member, None for directories.
+        archive: String with the path of the '.zip' file, None for a '.zip'
+            file inside another archive.
+
+    Attributes:
+        crc: Integer with the CRC-32 of the member stored in the archive.
+        member: Tuple with the path of the '.zip' file and the name of the
+            member in it, None for directories.
+    """
+
+    __slots__ = ("name", "path", "crc", "member", "_stat")
+
+    def __init__(self, name, path, info=None, archive=None):
+        self.name = name
+        self.path = path
+        self.crc = None
+        self.member = None
+        if info is None:
+            self._stat = os.stat_result((stat.S_IFDIR | 0o755,) + (0,) * 9)
+            return
+
+        self.crc = info.CRC
+        self.member = (archive, info.filename)
+        mtime = int(time.mktime(info.date_time + (0, 0, -1)))
+        self._stat = os.stat_result(
+            (stat.S_IFREG | 0o644, 0, 0, 1, 0, 0, info.file_size, mtime, mtime, mtime),
+            {"st_mtime_ns": mtime * 1_000_000_000},
+        )
+
+    def is_dir(self):
+        return self.crc is None
+
+    def is_file(self):
+        return self.crc is not None
+
+    def stat(self):
+        return self._stat
+
+
+class _ZipTree:
+    """
+    Tree source reading the listing of a '.zip' file from its central directory.
+
+    Nothing is extracted: sizes come from `ZipInfo.file_size` and the stored
+    CRC-32 of every member is used as its content fingerprint.
+
+    Args:
+        root: String with the path of the '.zip' file.
+        data: Optional bytes with the content of a '.zip' file read from
+            another archive, `root` is then only used to name its entries.
+
+    Attributes:
+        merkle: Dictionary with the Merkle digest of directories, filled in by
+            `_merkle_digest`.
+    """
+
+    def __init__(self, root, data=None):
+        self.root = root
+        self.merkle = {}
+        self._data = data
+        self._dirs = {"": {}}
+
+        with zipfile.ZipFile(self._source(), "r") as archive:
+            for info in archive.infolist():
+                # Sanitize member names the way `ZipFile.extractall` does
+                parts = [
+                    part
+                    for part in info.filename.replace("\\", "/").split("/")
+                    if part not in ("", ".", "..")
+                ]
+                if not parts:
+                    continue
+
+                reldir = ""
+                for part in parts[:-1]:
+                    self._add(reldir, part)
+                    reldir = os.path.join(reldir, part)
+                self._add(reldir, parts[-1], None if info.is_dir() else info)
+
+    def _add(self, reldir, name, info=None):
+        """
+        Add an entry to the listing of a directory of the archive.
+
+        Args:
+            reldir: String with the directory relative to the archive root.
+            name: String with the name of the entry.
+            info: zipfile.ZipInfo of a member, None for directories.
+
+        Returns:
+            Nothing.
+        """
+
+        entries = self._dirs[reldir]
+        if info is None and name in entries:
+            return
+
+        path = os.path.join(reldir, name)
+        archive = self.root if self._data is None else None
+        entries[name] = _ZipEntry(name, os.path.join(self.root, path), info, archive)
+        if info is None:
+            self._dirs.setdefault(path, {})
+
+    def _source(self):
+        """
+        Return what `zipfile.ZipFile` opens to read the archive.
+
+        Returns:
+            String with the path of the '.zip' file, or a new io.BytesIO over
+            its content so that threads do not share a position.
+        """
+
+        return self.root if self._data is None else io.BytesIO(self._data)
+
+    def read(self, relpath):
+        """
+        Decompress a member of the archive in memory.
+
+        Args:
+            relpath: String with the path of the member relative to the root.
+
+        Returns:
+            Bytes with the content of the member.
+        """
+
+        reldir, name = os.path.split(relpath)
+        with zipfile.ZipFile(self._source(), "r") as archive:
+            return archive.read(self._dirs[reldir][name].member[1])
+
+    def list(self, reldir):
+        """
+        List a directory of the archive, skipping the `filecmp` ignored names.
+
+        Args:
+            reldir: String with the directory relative to the archive root.
+
+        Returns:
+            List of _ZipEntry sorted by name.
+        """
+
+        entries = [
+            entry
+            for name, entry in self._dirs.get(reldir, {}).items()
+            if name not in IGNORED_NAMES
+        ]
+        entries.sort(key=_entry_key)
+        return entries
+
+
+class _ManifestEntry:
+    """
+    A file or directory of a manifest, with the os.DirEntry interface.
+
+    Members of '.tar' files are read into the same entries, with both their
+    fingerprints computed while listing.
+
+    Args:
+        name: String with the name of the file or directory.
+        path: String with the path of the manifest joined with the entry path.
+        is_dir: Boolean, True for directories.
+        size: Integer with the size in bytes of a file.
+        mtime_ns: Integer with the mtime in nanoseconds of a file.
+        crc: Integer with the CRC-32 of a file, None if not recorded.
+        digest: Bytes with the full digest of a file, None if not recorded.
+    """
+
+    __slots__ = ("name", "path", "crc", "digest", "st_mode", "st_size", "st_mtime_ns")
+
+    # Nothing to stat, the entry carries the fields of its own stat result
+    st_ino = 0
+
+    def __init__(self, name, path, is_dir, size=0, mtime_ns=0, crc=None, digest=None):
+        self.name = name
+        self.path = path
+        self.crc = crc
+        self.digest = digest
+        self.st_mode = stat.S_IFDIR | 0o755 if is_dir else stat.S_IFREG | 0o644
+        self.st_size = size
+        self.st_mtime_ns = mtime_ns
+
+    def is_dir(self):
+        return stat.S_ISDIR(self.st_mode)
+
+    def is_file(self):
+        return stat.S_ISREG(self.st_mode)
+
+    def stat(self):
+        return self
+
+
+class _ManifestTree:
+    """
+    Tree source reading a manifest written by `write_manifest`.
+
+    The whole manifest is loaded in memory, listing a directory never touches
+    the filesystem and the recorded fingerprints stand in for the content.
+
+    Args:
+        root: String with the path of the manifest file.
+
+    Attributes:
+        header: Dictionary with the header of the manifest.
+        merkle: Dictionary with the Merkle digest of directories, as recorded
+            in the manifest.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.merkle = {}
+        self._dirs = {"": {}}
+
+        with open(root, "rb") as file:
+            if file.readline() != MANIFEST_MAGIC:
+                raise ValueError("{} is not a manifest".format(root))
+            with gzip.open(file, "rb") as stream:
+                self.header = json.loads(stream.readline())
+                data = stream.read().decode("utf-8", "surrogateescape")
+
+        # Records come directory by directory, so the listing and path of
+        # the parent only change when the directory does
+        parent = None
+        for record in data.split("\0"):
+            if not record:
+                continue
+            kind, size, mtime_ns, crc, digest, relpath = record.split("\t", 5)
+            if kind == "m":
+                self.merkle[relpath.replace("/", os.sep)] = bytes.fromhex(digest)
+                continue
+            head, _, name = relpath.rpartition("/")
+            if head != parent:
+                parent = head
+                reldir = head.replace("/", os.sep)
+                listing = self._dirs.setdefault(reldir, {})
+                prefix = os.path.join(root, reldir, "")
+
+            if kind == "d":
+                entry = _ManifestEntry(name, prefix + name, True)
+                self._dirs.setdefault(os.path.join(reldir, name), {})
+            else:
+                entry = _ManifestEntry(
+                    name,
+                    prefix + name,
+                    False,
+                    int(size),
+                    int(mtime_ns),
+                    int(crc, 16) if crc else None,
+                    bytes.fromhex(digest) if digest else None,
+                )
+            listing[name] = entry
+
+    def list(self, reldir):
+        """
+        List a directory of the manifest.
+
+        Args:
+            reldir: String with the directory relative to the manifest root.
+
+        Returns:
+            List of _ManifestEntry sorted by name.
+        """
+
+        entries = list(self._dirs.get(reldir, {}).values())
+        entries.sort(key=_entry_key)
+        return entries
+
+
+class _TarTree:
+    """
+    Tree source reading the listing of a '.tar' file, compressed or not.
+
+    A '.tar' file stores no fingerprints and can only be read in order, so
+    with `digests` every member is read once while listing, nothing is
+    extracted: its CRC-32 and full digest are computed from the stream and
+    kept in a _ManifestEntry. Without `digests` the members are skipped,
+    only their names, sizes and mtimes are listed.
+
+    Args:
+        root: String with the path of the '.tar' file.
+        data: Optional bytes with the content of a '.tar' file read from
+            another archive, `root` is then only used to name its entries.
+        digests: Boolean to fingerprint the members, needed to compare their
+            content.
+
+    Attributes:
+        merkle: Dictionary with the Merkle digest of directories, filled in by
+            `_merkle_digest`.
+    """
+
+    def __init__(self, root, data=None, digests=True):
+        self.root = root
+        self.merkle = {}
+        self._data = data
+        self._dirs = {"": {}}
+        # Names of the members in the archive, by path relative to the root
+        self._members = {}
+
+        with self._open("r|*") as archive:
+            for info in archive:
+                # Sanitize member names the way `ZipFile.extractall` does
+                parts = [
+                    part
+                    for part in info.name.replace("\\", "/").split("/")
+                    if part not in ("", ".", "..")
+                ]
+                if not parts or not (info.isdir() or info.isfile()):
+                    continue
+
+                reldir = ""
+                for part in parts[:-1]:
+                    self._add(reldir, part)
+                    reldir = os.path.join(reldir, part)
+                if info.isdir():
+                    self._add(reldir, parts[-1])
+                    continue
+
+                crc = digest = None
+                if digests:
+                    crc, hasher = 0, _new_hash()
+                    with archive.extractfile(info) as file:
+                        while chunk := file.read(COMPARE_MIN_BLOCK_SIZE):
+                            crc = zlib.crc32(chunk, crc)
+                            hasher.update(chunk)
+                    digest = hasher.digest()
+                mtime_ns = int(info.mtime * 1_000_000_000)
+                self._add(reldir, parts[-1], info.size, mtime_ns, crc, digest)
+                self._members[os.path.join(reldir, parts[-1])] = info.name
+
+    def _add(self, reldir, name, size=None, mtime_ns=0, crc=None, digest=None):
+        """
+        Add an entry to the listing of a directory of the archive.
+
+        Args:
+            reldir: String with the directory relative to the archive root.
+            name: String with the name of the entry.
+            size: Integer with the size in bytes of a file, None for
+                directories.
+            mtime_ns: Integer with the mtime in nanoseconds of a file.
+            crc: Integer with the CRC-32 of a file.
+            digest: Bytes with the full digest of a file.
+
+        Returns:
+            Nothing.
+        """
+
+        entries = self._dirs[reldir]
+        if size is None and name in entries:
+            return
+
+        path = os.path.join(reldir, name)
+        entries[name] = _ManifestEntry(
+            name,
+            os.path.join(self.root, path),
+            size is None,
+            size or 0,
+            mtime_ns,
+            crc,
+            digest,
+        )
+        if size is None:
+            self._dirs.setdefault(path, {})
+
+    def _open(self, mode):
+        """
+        Open the archive with `tarfile`.
+
+        Args:
+            mode: String with the `tarfile.open` mode.
+
+        Returns:
+            tarfile.TarFile reading the '.tar' file or its content.
+        """
+
+        if self._data is None:
+            return tarfile.open(self.root, mode)
+        return tarfile.open(fileobj=io.BytesIO(self._data), mode=mode)
+
+    def read(self, relpath):
+        """
+        Read a member of the archive in memory.
+
+        Args:
+            relpath: String with the path of the member relative to the root.
+
+        Returns:
+            Bytes with the content of the member.
+        """
+
+        with self._open("r:*") as archive:
+            with archive.extractfile(self._members[relpath]) as file:
+                return file.read()
+
+    def list(self, reldir):
+        """
+        List a directory of the archive, skipping the `filecmp` ignored names.
+
+        Args:
+            reldir: String with the directory relative to the archive root.
+
+        Returns:
+            List of _ManifestEntry sorted by name.
+        """
+
+        entries = [
+            entry
+            for name, entry in self._dirs.get(reldir, {}).items()
+            if name not in IGNORED_NAMES
+        ]
+        entries.sort(key=_entry_key)
+        return entries
+
+
+class _ArchiveTree:
+    """
+    Tree source looking into the archives of another tree like sub folders.
+
+    An archive is mounted by `_compare_dir` when both folders have one of the
+    same name, from then on its listing comes from a _ZipTree or _TarTree.
+    Archives of the filesystem are read from their file, archives inside
+    archives are decompressed in memory, never extracted to disk.
+
+    Args:
+        tree: Tree source of the folder.
+        digests: Boolean to fingerprint the members of the '.tar' files
+            mounted.
+
+    Attributes:
+        merkle: Dictionary with the Merkle digest of directories of `tree`,
+            None if it has none.
+    """
+
+    def __init__(self, tree, digests=True):
+        self.root = tree.root
+        self.merkle = getattr(tree, "merkle", None)
+        self._tree = tree
+        self._digests = digests
+        # Tree source of every archive mounted, None if it could not be read
+        self._mounts = {}
+
+    def list(self, reldir):
+        """
+        List a directory of the tree or of the archive it is in.
+
+        Args:
+            reldir: String with the directory relative to the root.
+
+        Returns:
+            List of entries sorted by name.
+        """
+
+        tree, inner = self._tree_of(reldir)
+        return tree.list(inner)
+
+    def mount(self, relpath):
+        """
+        Open an archive of the tree to list it like a folder.
+
+        Args:
+            relpath: String with the path of the archive relative to the root.
+
+        Returns:
+            Boolean, True if the archive could be read.
+        """
+
+        if relpath not in self._mounts:
+            tree, inner = self._tree_of(relpath)
+            path = os.path.join(tree.root, inner)
+            try:
+                if isinstance(tree, _DirectoryTree):
+                    archive = _open_archive_tree(path, None, self._digests)
+                elif isinstance(tree, (_ZipTree, _TarTree)):
+                    archive = _open_archive_tree(path, tree.read(inner), self._digests)
+                else:
+                    # A manifest records no content to read
+                    archive = None
+            except (
+                OSError,
+                EOFError,
+                ValueError,
+                zipfile.BadZipFile,
+                tarfile.TarError,
+                zlib.error,
+                lzma.LZMAError,
+            ):
+                archive = None
+            self._mounts[relpath] = archive
+        return self._mounts[relpath] is not None
+
+    def _tree_of(self, relpath):
+        """
+        Find the tree source holding a path, the deepest archive mounted.
+
+        Args:
+            relpath: String with the path relative to the root.
+
+        Returns:
+            Tuple with the tree source and the path relative to its root.
+        """
+
+        head = relpath
+        while head and self._mounts:
+            archive = self._mounts.get(head)
+            if archive is not None:
+                return archive, relpath[len(head) + 1 :]
+            head = os.path.dirname(head)
+        return self._tree, relpath
+
+
+def _open_archive_tree(path, data=None, digests=True):
+    """
+    Return the tree source of a '.zip' or '.tar' file.
+
+    Args:
+        path: String with the path of the archive.
+        data: Optional bytes with the content of the archive, read from
+            another archive.
+        digests: Boolean to fingerprint the members of a '.tar' file.
+
+    Returns:
+        _ZipTree or _TarTree.
+    """
+
+    if zipfile.is_zipfile(path if data is None else io.BytesIO(data)):
+        return _ZipTree(path, data)
+    return _TarTree(path, data, digests)
+
+
+def _is_archive_name(name):
+    """
+    Tell if a file is named like an archive looked into with `archives`.
+
+    Args:
+        name: String with the name of the file.
+
+    Returns:
+        Boolean, True if it ends with one of `ARCHIVE_SUFFIXES`.
+    """
+
+    return name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _is_manifest(path):
+    """
+    Tell if a file is a manifest written by `write_manifest`.
+
+    Args:
+        path: String with the path of the file.
+
+    Returns:
+        Boolean, True if the file starts with `MANIFEST_MAGIC`.
+    """
+
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as file:
+        return file.read(len(MANIFEST_MAGIC)) == MANIFEST_MAGIC
+
+
+def _open_tree(folder, filter=None, stats=None, archives=False, digests=True):
+    """
+    Return the tree source for a directory, an archive or a manifest.
+
+    Args:
+        folder: String with the directory, '.zip' or '.tar' file or manifest.
+        filter: Optional Filter applied to every listing of the tree.
+        stats: Optional Stats counting the directories of the filesystem
+            listed.
+        archives: Boolean to look into the archives of the tree, wrapping it
+            in an _ArchiveTree.
+        digests: Boolean to fingerprint the members of '.tar' files while
+            listing them, only needed to compare content.
+
+    Returns:
+        _ZipTree for '.zip' files, _ManifestTree for manifests, _TarTree for
+        '.tar' files, _DirectoryTree otherwise, wrapped in an _ArchiveTree
+        with `archives` and in a _FilteredTree with `filter`.
+    """
+
+    if zipfile.is_zipfile(folder) or folder.endswith(".zip"):
+        tree = _ZipTree(folder)
+    elif _is_manifest(folder):
+        tree = _ManifestTree(folder)
+    elif os.path.isfile(folder) and tarfile.is_tarfile(folder):
+        tree = _TarTree(folder, None, digests)
+    else:
+        tree = _DirectoryTree(folder, stats)
+    if archives:
+        tree = _ArchiveTree(tree, digests)
+    return tree if filter is None else _FilteredTree(tree, filter)
+
+
+def _convert_bytes(num):
+    """
+    This function will convert bytes to KB, MB, GB, TB.
+
+    Args:
+        num: Integer with the number of bytes.
+
+    Returns:
+        String with values converted.
+    """
+
+    for x in ["bytes", "KB", "MB", "GB", "TB"]:
+        if num < 1024.0:
+            return "%3.2f %s" % (num, x)
+        num /= 1024.0
+    return "%3.2f %s" % (num * 1024.0, x)
+
+
+def format_size(size):
+    """
+    Return a file size converted for the reports.
+
+    Args:
+        size: Integer with the number of bytes, None for entries that are not
+            files.
+
+    Returns:
+        String with the size converted, empty for None.
+    """
+
+    return "" if size is None else _convert_bytes(size)
+
+
+def _file_size(file_path):
+    """
+    This function will return the file size if file exists on the filesystem.
+
+    Args:
+        file_path: String with the file path to chak its size.
+
+    Returns:
+        strReturn: String of the file's size converted.
+    """
+
+    if os.path.isfile(file_path):
+        file_info = os.stat(file_path)
+        strReturn = _convert_bytes(file_info.st_size)
+    else:
+        strReturn = ""
+
+    return strReturn
+
+
+def _recursive_dircmp(
+    folder1,
+    folder2,
+    prefix1=".",
+    prefix2=".",
+    workers=1,
+    compare_content=False,
+    hash_workers=None,
+    cache=None,
+):
+    """
+    Return a recursive comparison report of two directories as a dictionary.
+
+    Collects the results of `_iter_comparison` in lists of paths. Either
+    directory can also be a '.zip' file, read without extracting it. With
+    `compare_content` the report also gets the "identical" and "different"
+    lists, splitting the files in "both" by their content.
+
+    Args:
+        folder1: String with the directory of left folder.
+        folder2: String with the directory of right folder.
+        prefix1: String with the prefix of the directory 1 being searched.
+        prefix2: String with the prefix of the directory 2 being searched.
+        workers: Integer with the number of threads listing directories.
+        compare_content: Boolean to compare the content of common files.
+        hash_workers: Integer with the number of processes hashing files.
+        cache: Optional HashCache with the digests of previous runs.
+
+    Returns:
+        data: Dictionary with the file comparison.
+    """
+
+    data = {"left": [], "right": [], "both": []}
+    if compare_content:
+        data["identical"] = []
+        data["different"] = []
+
+    # The report has no sizes, the files are not stat'ed for them
+    results = _iter_comparison(
+        folder1, folder2, workers, compare_content, hash_workers, cache, sizes=False
+    )
+    reldir = ""
+    roots = prefix1 + os.sep, prefix2 + os.sep
+    dirs = roots
+    for entry in results:
+        if entry.reldir != reldir:
+            # Sub folders are reported with their full (normalized) path, the
+            # entries of a directory come one after the other
+            reldir = entry.reldir
+            dirs = roots
+            if reldir:
+                dirs = tuple(
+                    os.path.normpath(os.path.join(folder, reldir)) + os.sep
+                    for folder in (folder1, folder2)
+                )
+
+        status = entry.status
+        if status == "left":
+            data["left"].append(dirs[0] + entry.name)
+        elif status == "right":
+            data["right"].append(dirs[1] + entry.name)
+        else:
+            item = "{}{}***{}{}".format(dirs[0], entry.name, dirs[1], entry.name)
+            data["both"].append(item)
+            if status != "both":
+                data[status].append(item)
+
+    return data
+
+
+def _iter_comparison(
+    folder1,
+    folder2,
+    workers=1,
+    compare_content=False,
+    hash_workers=None,
+    cache=None,
+    progress=None,
+    cancel=None,
+    detect_moves=False,
+    prune=False,
+    filter=None,
+    stats=None,
+    archives=False,
+    executor=None,
+    sizes=True,
+):
+    """
+    Compare two directories, yielding a compact record for every result.
+
+    Records are yielded while the trees are walked. Files only in one folder
+    come out in walk order; the common files come out in walk order too, but
+    with `compare_content` they are held back until a batch of
+    `CONTENT_BATCH_SIZE` files has been compared. With `detect_moves` the
+    files only in one folder are held back until the walk ends, when the
+    moved ones are matched by `_detect_moves`.
+
+    Args:
+        folder1: String with the directory or '.zip' file of left folder.
+        folder2: String with the directory or '.zip' file of right folder.
+        workers: Integer with the number of threads listing directories.
+        compare_content: Boolean to compare the content of common files.
+        hash_workers: Integer with the number of processes hashing files,
+            defaults to the number of CPUs.
+        cache: Optional HashCache with the digests of previous runs.
+        progress: Optional callable receiving a Progress, called at most every
+            `PROGRESS_INTERVAL` seconds and once at the end.
+        cancel: Optional threading.Event, the comparison raises Cancelled as
+            soon as it is set.
+        detect_moves: Boolean to match the files only in the left folder with
+            the files only in the right folder by content.
+        prune: Boolean to yield common sub folders with the same Merkle digest
+            on both sides as one "identical" record instead of walking them.
+        filter: Optional Filter, the entries it skips are neither listed nor
+            yielded.
+        stats: Optional started Stats, the time between results is counted in
+            its "report" phase.
+        archives: Boolean to walk the archives present in both folders, their
+            members are yielded with the path of the archive as folder.
+        executor: Optional concurrent.futures.Executor to hash on instead of
+            a process pool of `hash_workers`, left running.
+        sizes: Boolean to stat the files only in one folder or compared by
+            name for their sizes and mtimes, left None without it.
+
+    Yields:
+        Entry with the status ("left", "right", "both", or "identical" and
+        "different" with `compare_content`, "moved" with `detect_moves`), the
+        path relative to the roots, and the type, sizes and mtimes taken from
+        the listing.
+    """
+
+    tracker = _ProgressTracker(progress, cancel)
+    entries = _iter_entries(
+        folder1,
+        folder2,
+        workers,
+        compare_content,
+        hash_workers,
+        cache,
+        tracker,
+        detect_moves,
+        prune,
+        filter,
+        stats,
+        archives,
+        executor,
+        sizes,
+    )
+    for entry in entries:
+        tracker.files += 1
+        tracker.bytes += entry.size or 0
+        if stats is None:
+            yield entry
+            continue
+
+        stats.statuses[entry.status] += 1
+        phase = stats._switch("report")
+        yield entry
+        stats._switch(phase)
+    tracker.update(force=True)
+    if stats is not None:
+        stats.dirs += tracker.dirs
+        stats.files += tracker.files
+
+
+def _iter_entries(
+    folder1,
+    folder2,
+    workers,
+    compare_content,
+    hash_workers,
+    cache,
+    tracker,
+    detect_moves=False,
+    prune=False,
+    filter=None,
+    stats=None,
+    archives=False,
+    executor=None,
+    sizes=True,
+):
+    """
+    Walk and compare two directories for `_iter_comparison`.
+
+    Args:
+        folder1: String with the directory or '.zip' file of left folder.
+        folder2: String with the directory or '.zip' file of right folder.
+        workers: Integer with the number of threads listing directories.
+        compare_content: Boolean to compare the content of common files.
+        hash_workers: Integer with the number of processes hashing files.
+        cache: Optional HashCache with the digests of previous runs.
+        tracker: _ProgressTracker counting the listed directories.
+        detect_moves: Boolean to match moved files once the walk ends.
+        prune: Boolean to skip common sub folders with the same Merkle digest.
+        filter: Optional Filter applied to every listing.
+        stats: Optional Stats, switched to the phase running.
+        archives: Boolean to walk the archives present in both folders.
+        executor: Optional concurrent.futures.Executor to hash on, shared with
+            other comparisons.
+        sizes: Boolean to stat the files not compared by content.
+
+    Yields:
+        Entry of every file and folder.
+    """
+
+    own_executor = None
+    chunksize = 1
+    if compare_content or detect_moves:
+        hash_workers = hash_workers or os.cpu_count() or 1
+        chunksize = max(1, CONTENT_BATCH_SIZE // (4 * hash_workers))
+        if executor is None and hash_workers > 1:
+            executor = own_executor = _hash_pool(hash_workers)
+
+    switch = stats._switch if stats is not None else lambda phase: None
+    relpaths, pairs = [], []
+    # Entries only in one folder, held back for `_detect_moves`
+    only = ([], [])
+    try:
+        switch("open")
+        # Members of '.tar' files are only read for what needs their content
+        digests = compare_content or detect_moves or prune
+        trees = (
+            _open_tree(folder1, filter, stats, archives, digests),
+            _open_tree(folder2, filter, stats, archives, digests),
+        )
+        switch("walk")
+        walk = _walk_trees(*trees, workers, prune)
+        for reldir, left_only, right_only, common_files, common_dirs, same in walk:
+            tracker.dirs += 1
+            tracker.dirs_queued += len(common_dirs) - 1
+            tracker.update()
+
+            for name in same:
+                yield Entry("identical", reldir, name, True)
+
+            if detect_moves:
+                for tree, entries, found in zip(trees, (left_only, right_only), only):
+                    found.extend(_tree_files(tree, reldir, entries))
+            else:
+                for entry in left_only:
+                    yield _result("left", reldir, entry, None, sizes)
+                for entry in right_only:
+                    yield _result("right", reldir, None, entry, sizes)
+
+            if not compare_content:
+                for entry1, entry2 in common_files:
+                    yield _result("both", reldir, entry1, entry2, sizes)
+                continue
+
+            relpaths.extend(reldir for _ in common_files)
+            pairs.extend(common_files)
+            if len(pairs) >= CONTENT_BATCH_SIZE:
+                switch("content")
+                results = _compared_results(
+                    relpaths, pairs, executor, cache, chunksize, tracker.cancel, stats
+                )
+                switch("walk")
+                yield from results
+                relpaths, pairs = [], []
+
+        if pairs:
+            switch("content")
+            yield from _compared_results(
+                relpaths, pairs, executor, cache, chunksize, tracker.cancel, stats
+            )
+
+        if detect_moves:
+            switch("moves")
+            yield from _moved_results(
+                *only, executor, cache, chunksize, tracker.cancel, stats
+            )
+    finally:
+        if own_executor is not None:
+            own_executor.shutdown(cancel_futures=True)
+
+
+def _compared_results(
+    reldirs, pairs, executor, cache, chunksize, cancel=None, stats=None
+):
+    """
+    Compare the content of a batch of common files and return their results.
+
+    Args:
+        reldirs: List of strings with the directory of every pair.
+        pairs: List of tuples with the entries of the left and right file.
+        executor: Optional concurrent.futures.Executor to hash on.
+        cache: Optional HashCache with the digests of previous runs.
+        chunksize: Integer with the number of files sent to a worker at once.
+        cancel: Optional threading.Event to stop hashing.
+        stats: Optional Stats counting the bytes read.
+
+    Returns:
+        List of Entry with status "identical" or "different".
+    """
+
+    offsets = {}
+    same = _compare_contents(pairs, executor, cache, chunksize, cancel, offsets, stats)
+    results = [
+        _result("identical" if equal else "different", reldir, entry1, entry2)
+        for reldir, (entry1, entry2), equal in zip(reldirs, pairs, same)
+    ]
+    for index, offset in offsets.items():
+        results[index].offset = offset
+    return results
+
+
+def _tree_files(tree, reldir, entries):
+    """
+    Yield the entries only in one folder along with the files they contain.
+
+    Directories only in one folder are listed down to their files, as the
+    files of a renamed directory are moved files.
+
+    Args:
+        tree: Tree source the entries come from.
+        reldir: String with the directory of the entries relative to the root.
+        entries: List of os.DirEntry or _ZipEntry only in this tree.
+
+    Yields:
+        Tuple with the directory relative to the root, the entry and a boolean,
+        True for the entries listed by the walk and False for their content.
+    """
+
+    stack = [(reldir, entry) for entry in reversed(entries)]
+    while stack:
+        parent, entry = stack.pop()
+        yield parent, entry, parent == reldir
+        if entry.is_dir():
+            subdir = os.path.join(parent, entry.name)
+            stack.extend((subdir, child) for child in reversed(tree.list(subdir)))
+
+
+def _moved_results(left, right, executor, cache, chunksize, cancel=None, stats=None):
+    """
+    Return the results of the entries only in one folder, matching moved files.
+
+    Args:
+        left: List of tuples from `_tree_files` of the left folder.
+        right: List of tuples from `_tree_files` of the right folder.
+        executor: Optional concurrent.futures.Executor to hash on.
+        cache: Optional HashCache with the digests of previous runs.
+        chunksize: Integer with the number of files sent to a worker at once.
+        cancel: Optional threading.Event to stop hashing.
+        stats: Optional Stats counting the bytes read.
+
+    Returns:
+        List of Entry with status "moved" for every match, then "left" and
+        "right" for the entries listed by the walk that were not moved, in
+        walk order.
+    """
+
+    files1 = [(reldir, entry) for reldir, entry, _ in left if entry.is_file()]
+    files2 = [(reldir, entry) for reldir, entry, _ in right if entry.is_file()]
+    moves = _detect_moves(
+        [entry for _, entry in files1],
+        [entry for _, entry in files2],
+        executor,
+        cache,
+        chunksize,
+        cancel,
+        stats,
+    )
+
+    results = []
+    moved = set()
+    for index1, index2 in moves:
+        (reldir1, entry1), (reldir2, entry2) = files1[index1], files2[index2]
+        moved.update((id(entry1), id(entry2)))
+        result = _result("moved", reldir1, entry1, entry2)
+        result.target = os.path.join(reldir2, entry2.name)
+        results.append(result)
+
+    for reldir, entry, listed in left:
+        if listed and id(entry) not in moved:
+            results.append(_result("left", reldir, entry, None))
+    for reldir, entry, listed in right:
+        if listed and id(entry) not in moved:
+            results.append(_result("right", reldir, None, entry))
+    return results
+
+
+def _detect_moves(
+    entries1, entries2, executor=None, cache=None, chunksize=1, cancel=None, stats=None
+):
+    """
+    Match files only in the left folder with files only in the right one.
+
+    This is a hash join: files are keyed by their size, then by the partial
+    hash of `_compare_contents` and by the full hash, and each tier only reads
+    the files whose key so far is found in both folders. When archives or
+    manifests are involved their stored fingerprint (CRC-32 or full digest)
+    is the only tier. Every file is read at most twice,
+    so the cost grows with the number of files, not with the number of pairs.
+    Among files of the same content one of the same name is preferred; empty
+    files are only matched by name.
+
+    Args:
+        entries1: List of os.DirEntry or _ZipEntry of files only on the left.
+        entries2: List of os.DirEntry or _ZipEntry of files only on the right.
+        executor: Optional concurrent.futures.Executor to hash on.
+        cache: Optional HashCache with the digests of previous runs.
+        chunksize: Integer with the number of files sent to a worker at once.
+        cancel: Optional threading.Event to stop hashing.
+        stats: Optional Stats counting the bytes read.
+
+    Returns:
+        List of tuples with the index of a left file and the index of the
+        right file it was moved to, sorted.
+    """
+
+    sides = (entries1, entries2)
+    keys = {
+        (side, index): (entry.stat().st_size,)
+        for side, entries in enumerate(sides)
+        for index, entry in enumerate(entries)
+    }
+
+    kind = _stored_kind(entries1 + entries2)
+    tiers = ("partial", "full") if kind is None else (kind,)
+
+    for tier in tiers:
+        keys = _joined_keys(keys)
+        # Partial hashes settle the files they fully cover
+        minimum = 2 * PARTIAL_HASH_SIZE if tier == "full" and len(tiers) > 1 else 0
+        pending = [item for item, key in keys.items() if key[0] > minimum]
+        entries = [sides[side][index] for side, index in pending]
+
+        if tier == "partial":
+            files = [(entry.path, entry.stat()) for entry in entries]
+            cached = {}
+            if cache is not None:
+                cached = {path: cache.get(path, file_stat) for path, file_stat in files}
+            digests = _hash_files(
+                files, True, executor, chunksize, cached, cancel, cache, stats
+            )
+        else:
+            digests = _fingerprints(
+                entries, tier, executor, chunksize, cancel, cache, stats
+            )
+
+        for item, digest in zip(pending, digests):
+            keys[item] += (digest,)
+
+    # Index the left files by content, then by name
+    index1 = {}
+    for (side, index), key in _joined_keys(keys).items():
+        if side == 0:
+            names = index1.setdefault(key, {})
+            names.setdefault(_entry_key(entries1[index]), []).append(index)
+    # Reversed so the first file of a name is popped first
+    for names in index1.values():
+        for indexes in names.values():
+            indexes.reverse()
+
+    # Files keeping their name are matched first, then any left with the
+    # same content, but never empty ones
+    moves = []
+    pending = [(index, _entry_key(entry)) for index, entry in enumerate(entries2)]
+    for same_name in (True, False):
+        unmatched = []
+        for index, name in pending:
+            names = index1.get(keys.get((1, index)))
+            if not names:
+                continue
+            if name not in names:
+                if same_name or not entries2[index].stat().st_size:
+                    unmatched.append((index, name))
+                    continue
+                name = next(iter(names))
+            indexes = names[name]
+            moves.append((indexes.pop(), index))
+            if not indexes:
+                del names[name]
+        pending = unmatched
+
+    moves.sort()
+    return moves
+
+
+def _joined_keys(keys):
+    """
+    Keep the files whose key is found in both folders.
+
+    Args:
+        keys: Dictionary mapping (side, index) of files to their key.
+
+    Returns:
+        Dictionary with the items of `keys` whose key is also the key of a
+        file of the other side.
+    """
+
+    found = {}
+    for (side, _), key in keys.items():
+        found[key] = found.get(key, 0) | (1 << side)
+    return {item: key for item, key in keys.items() if found[key] == 3}
+
+
+def _result(status, reldir, entry1, entry2, sizes=True):
+    """
+    Build the result record of an entry from the data of its listing.
+
+    Args:
+        status: String with the status of the entry.
+        reldir: String with the directory relative to both roots.
+        entry1: os.DirEntry or _ZipEntry of the left side, None if missing.
+        entry2: os.DirEntry or _ZipEntry of the right side, None if missing.
+        sizes: Boolean to take the sizes and mtimes from the stat of the
+            entries, one `os.stat` each on most platforms.
+
+    Returns:
+        Entry of the file or folder.
+    """
+
+    entry = entry1 if entry1 is not None else entry2
+    is_dir = entry.is_dir()
+    if not sizes:
+        return Entry(status, reldir, entry.name, is_dir)
+    size1, mtime1 = _entry_size(entry1)
+    size2, mtime2 = _entry_size(entry2)
+    return Entry(status, reldir, entry.name, is_dir, size1, size2, mtime1, mtime2)
+
+
+def _entry_size(entry):
+    """
+    Return the size and mtime of a file from its (cached) stat.
+
+    Args:
+        entry: os.DirEntry or _ZipEntry, or None.
+
+    Returns:
+        Tuple with the size and mtime in nanoseconds, (None, None) if the entry
+        is missing, is not a file or cannot be stat'ed.
+    """
+
+    if entry is None or not entry.is_file():
+        return None, None
+
+    try:
+        entry_stat = entry.stat()
+    except OSError:
+        return None, None
+    return entry_stat.st_size, entry_stat.st_mtime_ns
+
+
+def _walk_trees(tree1, tree2, workers=1, prune=False):
+    """
+    Walk two directory trees at once, listing every directory only once.
+
+    Directories are visited depth first in name order, which is the same order
+    `filecmp.dircmp` based recursion used to produce. With more than one worker
+    the listing is done by `_walk_trees_parallel` and yielded in the same order.
+    With `prune`, common directories with the same `_merkle_digest` on both
+    sides are not walked.
+
+    Args:
+        tree1: Tree source of the left folder.
+        tree2: Tree source of the right folder.
+        workers: Integer with the number of threads listing directories.
+        prune: Boolean to skip the common directories with the same digest.
+
+    Yields:
+        Tuple with the directory relative to both roots ('' for the roots), the
+        sorted entries only in the left folder, only in the right folder, the
+        entry pairs of the common files, the names of the common directories
+        (walked next) and the names of the skipped common directories of that
+        directory.
+    """
+
+    if workers > 1:
+        yield from _walk_trees_parallel(tree1, tree2, workers, prune)
+        return
+
+    stack = [""]
+    while stack:
+        comparison = _compare_dir(tree1, tree2, stack.pop(), prune)
+        reldir, common_dirs = comparison[0], comparison[4]
+
+        yield comparison
+
+        # Reversed so the first sub folder is the next one to be popped
+        stack.extend(os.path.join(reldir, name) for name in reversed(common_dirs))
+
+
+def _walk_trees_parallel(tree1, tree2, workers, prune=False):
+    """
+    Walk two directory trees listing directories concurrently on a thread pool.
+
+    The next directories in depth-first order are listed ahead of the
+    consumer, up to twice `workers` of them, which hides the latency of
+    network filesystems. More are listed only as the results are taken, so a
+    slow consumer does not get the listings of the whole tree piled up.
+
+    Args:
+        tree1: Tree source of the left folder.
+        tree2: Tree source of the right folder.
+        workers: Integer with the number of threads listing directories.
+        prune: Boolean to skip the common directories with the same digest.
+
+    Yields:
+        Same tuples as `_walk_trees`, in the same order.
+    """
+
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="foldercompare-walk"
+    )
+    limit = 2 * workers
+    # Directories to yield, the next one last, with the Future of their
+    # listing once submitted
+    stack = [["", None]]
+    submitted = 0
+
+    def submit():
+        nonlocal submitted
+        for item in reversed(stack):
+            if submitted >= limit:
+                break
+            if item[1] is None:
+                item[1] = executor.submit(_compare_dir, tree1, tree2, item[0], prune)
+                submitted += 1
+
+    try:
+        submit()
+        while stack:
+            reldir, future = stack.pop()
+            submitted -= 1
+            comparison = future.result()
+            # Reversed so the first sub folder is the next one to be popped
+            stack.extend(
+                [os.path.join(reldir, name), None] for name in reversed(comparison[4])
+            )
+            submit()
+            yield comparison
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _compare_dir(tree1, tree2, reldir, prune=False):
+    """
+    List and merge one directory of both trees.
+
+    Args:
+        tree1: Tree source of the left folder.
+        tree2: Tree source of the right folder.
+        reldir: String with the directory relative to both roots.
+        prune: Boolean to set apart the common directories with the same
+            `_merkle_digest` on both sides.
+
+    Returns:
+        Tuple with `reldir`, the entries only in the left folder, only in the
+        right folder, the entry pairs of the common files, the names of the
+        common directories and the names of the common directories set apart.
+        Common archives both trees can mount are common directories.
+    """
+
+    entries1 = tree1.list(reldir)
+    entries2 = tree2.list(reldir)
+    left_only, right_only, common_files, common_dirs = _merge_listings(
+        entries1, entries2
+    )
+
+    if hasattr(tree1, "mount") and hasattr(tree2, "mount"):
+        mounted = [
+            entry1.name
+            for entry1, _ in common_files
+            if _is_archive_name(entry1.name)
+            and tree1.mount(os.path.join(reldir, entry1.name))
+            and tree2.mount(os.path.join(reldir, entry1.name))
+        ]
+        if mounted:
+            common_files = [
+                pair for pair in common_files if pair[0].name not in mounted
+            ]
+            common_dirs = sorted(common_dirs + mounted, key=os.path.normcase)
+
+    same = []
+    if prune and common_dirs:
+        walked = []
+        for name in common_dirs:
+            subdir = os.path.join(reldir, name)
+            digest = _merkle_digest(tree1, subdir)
+            if digest is not None and digest == _merkle_digest(tree2, subdir):
+                same.append(name)
+            else:
+                walked.append(name)
+        common_dirs = walked
+    return reldir, left_only, right_only, common_files, common_dirs, same
+
+
+def _merkle_digest(tree, reldir):
+    """
+    Return the Merkle digest of a directory of a '.zip' file or a manifest.
+
+    The digest covers the name, size and fingerprint of every file and the
+    name and digest of every sub folder, so two directories with the same
+    digest have the same content. It is computed from the listing the first
+    time, unless a manifest recorded it, and kept in `tree.merkle`.
+
+    Args:
+        tree: Tree source of the folder.
+        reldir: String with the directory relative to the root.
+
+    Returns:
+        Bytes with the digest, None for folders of the filesystem, whose
+        content cannot be known without walking it, and for directories with
+        files without a fingerprint.
+    """
+
+    digests = getattr(tree, "merkle", None)
+    if digests is None:
+        return None
+    if reldir in digests:
+        return digests[reldir]
+
+    merkle = _new_hash()
+    for entry in tree.list(reldir):
+        if entry.is_dir():
+            fingerprint = _merkle_digest(tree, os.path.join(reldir, entry.name))
+        else:
+            fingerprints = getattr(entry, "digest", None), getattr(entry, "crc", None)
+            fingerprint = next(
+                (
+                    (kind, value)
+                    for kind, value in zip(("full", "crc"), fingerprints)
+                    if value is not None
+                ),
+                None,
+            )
+        if fingerprint is None:
+            digests[reldir] = None
+            return None
+        merkle.update(_merkle_record(entry, fingerprint))
+
+    digests[reldir] = merkle.digest()
+    return digests[reldir]
+
+
+def _merkle_record(entry, fingerprint):
+    """
+    Encode an entry of a directory for the Merkle digest of the directory.
+
+    Args:
+        entry: os.DirEntry, _ZipEntry or _ManifestEntry.
+        fingerprint: Bytes with the Merkle digest of a directory, or tuple with
+            the kind ("full" or "crc") and value of the fingerprint of a file.
+
+    Returns:
+        Bytes with the record.
+    """
+
+    if entry.is_dir():
+        record = "d\0{}\0{}\0".format(entry.name, fingerprint.hex())
+    else:
+        kind, value = fingerprint
+        value = value.hex() if kind == "full" else "{:08x}".format(value)
+        record = "f\0{}\0{}\0{}\0{}\0".format(
+            entry.name, entry.stat().st_size, kind, value
+        )
+    return record.encode("utf-8", "surrogateescape")
+
+
+def _entry_key(entry):
+    """
+    Return the key used to sort and match directory entries.
+
+    Args:
+        entry: os.DirEntry or _ZipEntry of the file or directory.
+
+    Returns:
+        String with the name normalized for the current OS (case-insensitive
+        on Windows, like `filecmp.dircmp`).
+    """
+
+    return os.path.normcase(entry.name)
+
+
+def _list_dir(path):
+    """
+    List a directory with `os.scandir`, skipping the `filecmp` ignored names.
+
+    Args:
+        path: String with the directory to list.
+
+    Returns:
+        List of os.DirEntry sorted by name.
+    """
+
+    with os.scandir(path) as iterator:
+        entries = [entry for entry in iterator if entry.name not in IGNORED_NAMES]
+    entries.sort(key=_entry_key)
+    return entries
+
+
+def _merge_listings(entries1, entries2):
+    """
+    Merge two sorted directory listings in a single linear pass.
+
+    The file type is taken from the entries of the listing so no extra `os.stat`
+    is needed on most platforms. Names that are a file on one side and a
+    directory on the other are left out, as `filecmp.dircmp` does.
+
+    Args:
+        entries1: Sorted list of os.DirEntry or _ZipEntry of the left directory.
+        entries2: Sorted list of os.DirEntry or _ZipEntry of the right directory.
+
+    Returns:
+        Tuple of lists with the entries only in the left directory, only in the
+        right directory, the entry pairs of the common files and the names of
+        the common directories.
+    """
+
+    left_only, right_only, common_files, common_dirs = [], [], [], []
+    index1 = index2 = 0
+    length1, length2 = len(entries1), len(entries2)
+
+    while index1 < length1 and index2 < length2:
+        entry1 = entries1[index1]
+        entry2 = entries2[index2]
+        key1 = _entry_key(entry1)
+        key2 = _entry_key(entry2)
+
+        if key1 < key2:
+            left_only.append(entry1)
+            index1 += 1
+        elif key1 > key2:
+            right_only.append(entry2)
+            index2 += 1
+        else:
+            if entry1.is_dir() and entry2.is_dir():
+                common_dirs.append(entry1.name)
+            elif entry1.is_file() and entry2.is_file():
+                common_files.append((entry1, entry2))
+            index1 += 1
+            index2 += 1
+
+    left_only.extend(entries1[index1:])
+    right_only.extend(entries2[index2:])
+
+    return left_only, right_only, common_files, common_dirs
+
+
+def _compare_contents(
+    pairs, executor=None, cache=None, chunksize=1, cancel=None, offsets=None, stats=None
+):
+    """
+    Tell which pairs of files have the same content.
+
+    Each tier only looks at the pairs the previous one could not settle: files
+    of different sizes are different without being read, then full digests
+    from the cache are compared, then a hash of the first and last
+    `PARTIAL_HASH_SIZE` bytes and only the files that still match are hashed
+    in full. Without a cache to keep full digests for later runs, those files
+    are compared byte by byte instead, which stops at the first difference.
+    Hashing runs on the given executor, a process pool.
+
+    Files of the filesystem that are hard links to the same inode are the
+    same file and are never read, nor are files whose extents are shared
+    clones (reflinks) on Linux, checked before reading them in full.
+
+    Members of '.zip' files are compared by the CRC-32 stored in the archive
+    instead, so they are never decompressed; a file of the filesystem compared
+    with a member gets its CRC-32 computed. Entries of a manifest are compared
+    the same way by the fingerprint stored in the manifest.
+
+    Args:
+        pairs: List of tuples with the entries of the left and right file.
+        executor: Optional concurrent.futures.Executor to hash on.
+        cache: Optional HashCache with the digests of previous runs.
+        chunksize: Integer with the number of files sent to a worker at once.
+        cancel: Optional threading.Event, Cancelled is raised as soon as it is
+            set.
+        offsets: Optional dictionary filled with the index of the pairs
+            compared byte by byte that differ and their first differing byte.
+        stats: Optional Stats counting the bytes read.
+
+    Returns:
+        List of booleans, True for the pairs with identical content.
+    """
+
+    same = [entry1.stat().st_size == entry2.stat().st_size for entry1, entry2 in pairs]
+    # Empty files of the same size need no reading at all
+    pending = [
+        index
+        for index, (entry1, _) in enumerate(pairs)
+        if same[index] and entry1.stat().st_size
+    ]
+
+    # Hard links to one inode are the same file, nothing to read
+    linked = {
+        index
+        for index in pending
+        if _same_inode(pairs[index][0].stat(), pairs[index][1].stat())
+    }
+    if linked:
+        pending = [index for index in pending if index not in linked]
+        if stats is not None:
+            stats.bytes_skipped += sum(
+                2 * pairs[index][0].stat().st_size for index in linked
+            )
+
+    kinds = {index: _stored_kind(pairs[index]) for index in pending}
+    pending = [index for index in pending if kinds[index] is None]
+
+    cached = {}
+    if cache is not None:
+        for index in pending:
+            for path, file_stat in _sides(pairs[index]):
+                if path not in cached:
+                    cached[path] = cache.get(path, file_stat)
+
+        still_pending = []
+        for index in pending:
+            full1, full2 = (cached[path][1] for path, _ in _sides(pairs[index]))
+            if full1 is None or full2 is None:
+                still_pending.append(index)
+            else:
+                same[index] = full1 == full2
+        pending = still_pending
+
+    for kind in ("crc", "full"):
+        stored_pending = [index for index, value in kinds.items() if value == kind]
+        if not stored_pending:
+            continue
+
+        entries = [entry for index in stored_pending for entry in pairs[index]]
+        values = _fingerprints(entries, kind, executor, chunksize, cancel, cache, stats)
+        for position, index in enumerate(stored_pending):
+            same[index] = values[2 * position] == values[2 * position + 1]
+
+    for partial in (True, False):
+        if not pending:
+            break
+
+        if not partial and sys.platform.startswith("linux"):
+            # Clones sharing their extents have the same content, unread
+            paths = [tuple(entry.path for entry in pairs[index]) for index in pending]
+            shared = _map_files(_shared_extents, paths, (), executor, chunksize, cancel)
+            if stats is not None:
+                stats.bytes_skipped += sum(
+                    2 * pairs[index][0].stat().st_size
+                    for index, cloned in zip(pending, shared)
+                    if cloned
+                )
+            pending = [index for index, cloned in zip(pending, shared) if not cloned]
+            if not pending:
+                break
+
+        if not partial and cache is None:
+            paths = [tuple(entry.path for entry in pairs[index]) for index in pending]
+            found = _map_files(_compare_files, paths, (), executor, 1, cancel)
+            for index, offset in zip(pending, found):
+                same[index] = offset is None
+                if offset is not None and offsets is not None:
+                    offsets[index] = offset
+                if stats is not None:
+                    size = pairs[index][0].stat().st_size
+                    stats.bytes_compared += 2 * (size if offset is None else offset)
+            break
+
+        files = [side for index in pending for side in _sides(pairs[index])]
+        digests = _hash_files(
+            files, partial, executor, chunksize, cached, cancel, cache, stats
+        )
+
+        still_pending = []
+        for position, index in enumerate(pending):
+            if digests[2 * position] != digests[2 * position + 1]:
+                same[index] = False
+            elif partial and pairs[index][0].stat().st_size > 2 * PARTIAL_HASH_SIZE:
+                # Partial hashes only settle files they fully cover
+                still_pending.append(index)
+        pending = still_pending
+
+    return same
+
+
+def _same_inode(stat1, stat2):
+    """
+    Tell if two files are hard links to the same inode.
+
+    Args:
+        stat1: os.stat_result, or the stat of an archive or manifest entry, of
+            the left file.
+        stat2: Likewise for the right file.
+
+    Returns:
+        Boolean, True if both have the same non-zero inode on the same device.
+        Entries of archives and manifests, and `os.DirEntry` on Windows,
+        have no inode.
+    """
+
+    return (
+        stat1.st_ino != 0
+        and stat1.st_ino == stat2.st_ino
+        and stat1.st_dev == stat2.st_dev
+    )
+
+
+def _shared_extents(paths):
+    """
+    Tell if two files are clones sharing all their extents on the disk.
+
+    Args:
+        paths: Tuple with the paths of both files.
+
+    Returns:
+        Boolean, True if the physical extents of both files are the same, False
+        if they differ or cannot be listed.
+    """
+
+    try:
+        extents1, extents2 = (_extents(path) for path in paths)
+    except OSError:
+        return False
+    if not extents1 or extents1 != extents2:
+        return False
+    # A list cut at `FIEMAP_MAX_EXTENTS` does not cover the whole file
+    return bool(extents1[-1][3] & FIEMAP_EXTENT_LAST) and not any(
+        flags & FIEMAP_EXTENT_UNSAFE for *_, flags in extents1
+    )
+
+
+def _extents(path):
+    """
+    List the physical extents of a file with the FIEMAP ioctl of Linux.
+
+    Args:
+        path: String with the path of the file.
+
+    Raises:
+        OSError: If the filesystem does not support FIEMAP.
+
+    Returns:
+        List of tuples with the logical and physical offsets, the length and
+        the flags of up to `FIEMAP_MAX_EXTENTS` extents.
+    """
+
+    import fcntl
+
+    header = struct.pack(
+        "=QQLLLL", 0, 2**64 - 1, FIEMAP_FLAG_SYNC, 0, FIEMAP_MAX_EXTENTS, 0
+    )
+    buffer = bytearray(header + bytes(56 * FIEMAP_MAX_EXTENTS))
+    with open(path, "rb") as file:
+        fcntl.ioctl(file, FS_IOC_FIEMAP, buffer)
+
+    (mapped,) = struct.unpack_from("=L", buffer, 20)
+    extents = []
+    for number in range(mapped):
+        logical, physical, length, _, _, flags = struct.unpack_from(
+            "=QQQQQL", buffer, len(header) + 56 * number
+        )
+        extents.append((logical, physical, length, flags))
+    return extents
+
+
+def _stored_kind(entries):
+    """
+    Tell which stored fingerprint settles the comparison of files, if any.
+
+    A kind every file stores or can compute from the filesystem is preferred.
+    Otherwise members of '.zip' files of the filesystem are decompressed to get
+    a full digest, the only way to compare them with a manifest of full digests.
+
+    Args:
+        entries: Sequence with the entries of the files, the left and right
+            file of a pair or all the files matched by `_detect_moves`.
+
+    Raises:
+        ValueError: If the files store fingerprints of kinds that cannot be
+            compared.
+
+    Returns:
+        String with "full" or "crc", the kind of fingerprint all the files have
+        or can compute, None if none of them stores one.
+    """
+
+    known = [_stored_fingerprints(entry) for entry in entries]
+    if not any(known):
+        return None
+
+    for kind in ("full", "crc"):
+        if all(kind in fingerprints or not fingerprints for fingerprints in known):
+            return kind
+    if all(
+        "full" in fingerprints
+        or not fingerprints
+        or (isinstance(entry, _ZipEntry) and entry.member[0] is not None)
+        for entry, fingerprints in zip(entries, known)
+    ):
+        return "full"
+
+    no_crc, no_full = (
+        next(e for e, fingerprints in zip(entries, known) if kind not in fingerprints)
+        for kind in ("crc", "full")
+    )
+    raise ValueError(
+        "Cannot compare the content of {} and {}".format(no_crc.path, no_full.path)
+    )
+
+
+def _stored_fingerprints(entry):
+    """
+    Return the fingerprints of a file stored in its archive or manifest.
+
+    Args:
+        entry: os.DirEntry, _ZipEntry or _ManifestEntry of a file.
+
+    Raises:
+        ValueError: For a manifest entry written without fingerprints.
+
+    Returns:
+        Dictionary with the "full" digest and/or the "crc" of the file, empty
+        for files of the filesystem.
+    """
+
+    fingerprints = {}
+    if getattr(entry, "digest", None) is not None:
+        fingerprints["full"] = entry.digest
+    if getattr(entry, "crc", None) is not None:
+        fingerprints["crc"] = entry.crc
+    if not fingerprints and isinstance(entry, _ManifestEntry):
+        raise ValueError(
+            "The manifest of {} has no digests to compare content".format(entry.path)
+        )
+    return fingerprints
+
+
+def _fingerprints(
+    entries, kind, executor=None, chunksize=1, cancel=None, cache=None, stats=None
+):
+    """
+    Return the CRC-32 or full digest of files, computing the ones not stored.
+
+    Members of '.zip' files only store their CRC-32, their full digest is
+    computed by decompressing them on the executor, without extracting them.
+
+    Args:
+        entries: List of os.DirEntry, _ZipEntry or _ManifestEntry of files.
+        kind: String with "crc" or "full".
+        executor: Optional concurrent.futures.Executor to hash on.
+        chunksize: Integer with the number of files sent to a worker at once.
+        cancel: Optional threading.Event to stop hashing.
+        cache: Optional HashCache with the digests of previous runs.
+        stats: Optional Stats counting the bytes read.
+
+    Raises:
+        ValueError: If an entry of a manifest lacks that kind.
+
+    Returns:
+        List of integers or bytes in the order of `entries`.
+    """
+
+    values = [_stored_fingerprints(entry).get(kind) for entry in entries]
+    missing = [entry for entry, value in zip(entries, values) if value is None]
+    for entry in missing:
+        if isinstance(entry, _ManifestEntry):
+            raise ValueError(
+                "Cannot compare the content of {} by {}".format(entry.path, kind)
+            )
+
+    if kind == "crc":
+        paths = [entry.path for entry in missing]
+        computed = _map_files(_crc_file, paths, (), executor, chunksize, cancel)
+        if stats is not None:
+            stats.files_hashed += len(missing)
+            stats.bytes_hashed += sum(entry.stat().st_size for entry in missing)
+    else:
+        members = [entry for entry in missing if isinstance(entry, _ZipEntry)]
+        files = [
+            (entry.path, entry.stat())
+            for entry in missing
+            if not isinstance(entry, _ZipEntry)
+        ]
+        cached = {}
+        if cache is not None:
+            cached = {path: cache.get(path, file_stat) for path, file_stat in files}
+        hashed = iter(
+            _hash_files(files, False, executor, chunksize, cached, cancel, cache, stats)
+        )
+
+        # Members are not cached, their stat does not tell archives apart
+        members = [entry.member for entry in members]
+        decompressed = iter(
+            _map_files(_hash_member, members, (), executor, chunksize, cancel)
+        )
+        if stats is not None:
+            stats.files_hashed += len(members)
+            stats.bytes_hashed += sum(
+                entry.stat().st_size
+                for entry in missing
+                if isinstance(entry, _ZipEntry)
+            )
+        computed = [
+            next(decompressed) if isinstance(entry, _ZipEntry) else next(hashed)
+            for entry in missing
+        ]
+
+    computed = iter(computed)
+    return [next(computed) if value is None else value for value in values]
+
+
+def _sides(pair):
+    """
+    Split a pair of files in the (path, stat) tuples of each side.
+
+    Args:
+        pair: Tuple with the entries of the left and right file.
+
+    Returns:
+        Tuple with the (path, os.stat_result) of the left and of the right file.
+    """
+
+    return tuple((entry.path, entry.stat()) for entry in pair)
+
+
+def _hash_files(
+    files,
+    partial,
+    executor=None,
+    chunksize=1,
+    cached=None,
+    cancel=None,
+    store=None,
+    stats=None,
+):
+    """
+    Hash a list of files, on the given executor when there is one.
+
+    Args:
+        files: List of tuples with the path and os.stat_result of the files.
+        partial: Boolean to hash only the start and end of the files.
+        executor: Optional concurrent.futures.Executor to hash on.
+        chunksize: Integer with the number of files sent to a worker at once.
+        cached: Optional dictionary mapping paths to the partial and full
+            digests already known, those files are not read.
+        cancel: Optional threading.Event to stop hashing.
+        store: Optional HashCache to save the digests that were computed,
+            sharing them with concurrent comparisons.
+        stats: Optional Stats counting the bytes read.
+
+    Returns:
+        List of digests in the order of `files`.
+    """
+
+    cached = cached or {}
+    position = 0 if partial else 1
+    digests = [cached.get(path, (None, None))[position] for path, _ in files]
+    missing = {
+        path: None for (path, _), digest in zip(files, digests) if digest is None
+    }
+
+    stat_of = dict(files)
+    claimed = [(path, stat_of[path]) for path in missing]
+    waiting = {}
+    if store is not None:
+        # Files a concurrent comparison hashes are not read twice
+        claimed, waiting = store.claim(claimed, partial)
+    paths = [path for path, _ in claimed]
+    hashed = [None] * len(paths)
+    try:
+        hashed = _map_files(_hash_file, paths, (partial,), executor, chunksize, cancel)
+    finally:
+        if store is not None:
+            store.release(claimed, partial, hashed)
+    missing.update(zip(paths, hashed))
+    for path, future in waiting.items():
+        missing[path] = _wait_digest(future, cancel) or _hash_file(path, partial)
+
+    if stats is not None:
+        sizes = {path: file_stat.st_size for path, file_stat in files}
+        limit = 2 * PARTIAL_HASH_SIZE if partial else None
+        stats.files_hashed += len(paths)
+        stats.bytes_hashed += sum(
+            sizes[path] if limit is None else min(sizes[path], limit) for path in paths
+        )
+
+    if store is not None:
+        store.put_many(
+            (path, file_stat, missing[path], None)
+            if partial
+            else (path, file_stat, None, missing[path])
+            for (path, file_stat), digest in zip(files, digests)
+            if digest is None
+        )
+
+    return [
+        missing[path] if digest is None else digest
+        for (path, _), digest in zip(files, digests)
+    ]
+
+
+def _hash_pool(hash_workers):
+    """
+    Start a process pool to hash files on.
+
+    Its processes ignore SIGINT, the one of a Ctrl-C in a terminal, so they do
+    not each print a traceback; the main process stops them when it is
+    interrupted.
+
+    Args:
+        hash_workers: Integer with the number of processes.
+
+    Returns:
+        concurrent.futures.ProcessPoolExecutor.
+    """
+
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=hash_workers, initializer=_ignore_interrupt
+    )
+
+
+def _ignore_interrupt():
+    """
+    Ignore SIGINT in a process of the hashing pool.
+
+    Returns:
+        Nothing.
+    """
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _map_files(function, paths, args, executor=None, chunksize=1, cancel=None):
+    """
+    Call a function on every file, on the given executor when there is one.
+
+    Args:
+        function: Callable taking a path and `args`.
+        paths: List of strings with the files.
+        args: Tuple with the other arguments of the function.
+        executor: Optional concurrent.futures.Executor to run on.
+        chunksize: Integer with the number of files sent to a worker at once.
+        cancel: Optional threading.Event, checked after every file.
+
+    Returns:
+        List of the results in the order of `paths`.
+    """
+
+    if executor is None:
+        results = (function(path, *args) for path in paths)
+    else:
+        repeated = [itertools.repeat(arg) for arg in args]
+        results = executor.map(function, paths, *repeated, chunksize=chunksize)
+
+    values = []
+    for value in results:
+        _check_cancel(cancel)
+        values.append(value)
+    return values
+
+
+def _check_cancel(cancel):
+    """
+    Stop the comparison if it was cancelled.
+
+    Args:
+        cancel: Optional threading.Event.
+
+    Raises:
+        Cancelled: If the event is set.
+
+    Returns:
+        Nothing.
+    """
+
+    if cancel is not None and cancel.is_set():
+        raise Cancelled("The comparison was cancelled")
+
+
+def _wait_digest(future, cancel=None):
+    """
+    Wait for the digest of a file hashed by another comparison.
+
+    Args:
+        future: concurrent.futures.Future of the digest.
+        cancel: Optional threading.Event, checked while waiting.
+
+    Raises:
+        Cancelled: If the event is set.
+
+    Returns:
+        Bytes with the digest, None if the other comparison could not hash it.
+    """
+
+    while True:
+        try:
+            return future.result(timeout=PROGRESS_INTERVAL)
+        except concurrent.futures.TimeoutError:
+            _check_cancel(cancel)
+
+
+def _hash_file(path, partial=False):
+    """
+    Return a digest of the content of a file.
+
+    Args:
+        path: String with the file to hash.
+        partial: Boolean to hash only the first and last `PARTIAL_HASH_SIZE`
+            bytes of the file.
+
+    Returns:
+        Bytes with the digest.
+    """
+
+    with open(path, "rb") as file:
+        if not partial:
+            return hashlib.file_digest(file, _new_hash).digest()
+
+        digest = _new_hash()
+        digest.update(file.read(PARTIAL_HASH_SIZE))
+        size = file.seek(0, os.SEEK_END)
+        if size > PARTIAL_HASH_SIZE:
+            file.seek(max(PARTIAL_HASH_SIZE, size - PARTIAL_HASH_SIZE))
+            digest.update(file.read(PARTIAL_HASH_SIZE))
+        return digest.digest()
+
+
+def _hash_member(member):
+    """
+    Return the full digest of a member of a '.zip' file, decompressing it.
+
+    Every process keeps its own handles of the last archives it read, so the
+    central directory is not parsed again for each member.
+
+    Args:
+        member: Tuple with the path of the '.zip' file and the member name.
+
+    Returns:
+        Bytes with the digest.
+    """
+
+    path, name = member
+    archive_stat = os.stat(path)
+    archive = _open_archive(path, archive_stat.st_size, archive_stat.st_mtime_ns)
+    with archive.open(name) as file:
+        return hashlib.file_digest(file, _new_hash).digest()
+
+
+@functools.lru_cache(maxsize=4)
+def _open_archive(path, size, mtime_ns):
+    """
+    Open a '.zip' file for `_hash_member`, once per process and version.
+
+    Args:
+        path: String with the path of the '.zip' file.
+        size: Integer with its size, a new handle is opened if it changes.
+        mtime_ns: Integer with its mtime in nanoseconds, likewise.
+
+    Returns:
+        zipfile.ZipFile opened for reading.
+    """
+
+    return zipfile.ZipFile(path, "r")
+
+
+def _compare_files(paths):
+    """
+    Compare the content of two files byte by byte.
+
+    Both files are read with `readinto` in blocks of the same size into two
+    reused buffers, compared with a single `memcmp` each. Blocks start at
+    `COMPARE_MIN_BLOCK_SIZE` (or the preferred I/O size of the filesystem)
+    and double up to `COMPARE_MAX_BLOCK_SIZE` as long as larger reads are
+    faster, so fast storage is read in large blocks without slowing early
+    exits on slow storage.
+
+    Args:
+        paths: Tuple with the paths of the two files.
+
+    Returns:
+        Integer with the offset of the first byte that differs, None if the
+        content is the same.
+    """
+
+    path1, path2 = paths
+    with (
+        open(path1, "rb", buffering=0) as file1,
+        open(path2, "rb", buffering=0) as file2,
+    ):
+        block = max(COMPARE_MIN_BLOCK_SIZE, os.fstat(file1.fileno()).st_blksize)
+        buffer1, buffer2 = bytearray(block), bytearray(block)
+        view1, view2 = memoryview(buffer1), memoryview(buffer2)
+        offset = 0
+        rate = 0.0
+        while True:
+            start = time.perf_counter()
+            size1 = _read_block(file1, view1)
+            size2 = _read_block(file2, view2)
+            elapsed = time.perf_counter() - start
+
+            if size1 == size2 == block:
+                if buffer1 != buffer2:
+                    return offset + _first_difference(buffer1, buffer2)
+            else:
+                size = min(size1, size2)
+                data1, data2 = buffer1[:size], buffer2[:size]
+                if data1 != data2:
+                    return offset + _first_difference(data1, data2)
+                return None if size1 == size2 else offset + size
+
+            offset += block
+            # Grow the blocks while the storage keeps up
+            current = block / max(elapsed, 1e-9)
+            if block < COMPARE_MAX_BLOCK_SIZE and current > rate:
+                rate = current
+                block *= 2
+                buffer1, buffer2 = bytearray(block), bytearray(block)
+                view1, view2 = memoryview(buffer1), memoryview(buffer2)
+
+
+def _read_block(file, view):
+    """
+    Fill a buffer from an unbuffered file, unless the end is reached first.
+
+    Args:
+        file: io.FileIO opened for reading.
+        view: memoryview of the bytearray to read into.
+
+    Returns:
+        Integer with the number of bytes read.
+    """
+
+    size = 0
+    while size < len(view):
+        # Sliced only after a short read, usually filled at once
+        read = file.readinto(view[size:] if size else view)
+        if not read:
+            break
+        size += read
+    return size
+
+
+def _first_difference(data1, data2):
+    """
+    Return the offset of the first byte that differs between two buffers.
+
+    Halves are compared with `memcmp` instead of looping over bytes.
+
+    Args:
+        data1: bytearray with the first content.
+        data2: bytearray of the same size with the second content.
+
+    Returns:
+        Integer with the offset, the size of the buffers if they are equal.
+    """
+
+    low, high = 0, len(data1)
+    while high - low > 1:
+        middle = (low + high) // 2
+        if data1[low:middle] == data2[low:middle]:
+            low = middle
+        else:
+            high = middle
+    if low < len(data1) and data1[low] == data2[low]:
+        return high
+    return low
+
+
+def _crc_file(path):
+    """
+    Return the CRC-32 of the content of a file, as stored in '.zip' files.
+
+    Args:
+        path: String with the file to read.
+
+    Returns:
+        Integer with the CRC-32.
+    """
+
+    crc = 0
+    with open(path, "rb") as file:
+        while block := file.read(1024 * 1024):
+            crc = zlib.crc32(block, crc)
+    return crc
+
+
+def _new_hash():
+    """
+    Return a new hash object for file digests.
+
+    Returns:
+        hashlib.blake2b object.
+    """
+
+    return hashlib.blake2b(digest_size=20)
+
+
+class _SpillBuffer:
+    """
+    Append-only list of report rows that spills to a temporary file.
+
+    Only the last `limit` rows are kept in memory, older ones are pickled in
+    chunks to an anonymous temporary file and read back when iterating.
+
+    Args:
+        limit: Integer with the number of rows kept in memory.
+
+    Attributes:
+        count: Integer with the number of rows appended.
+    """
+
+    def __init__(self, limit=SPILL_BUFFER_SIZE):
+        self.count = 0
+        self._limit = limit
+        self._rows = []
+        self._file = None
+        self._stack = contextlib.ExitStack()
+
+    def __iter__(self):
+        if self._file is not None:
+            self._file.seek(0)
+            while True:
+                try:
+                    yield from pickle.load(self._file)
+                except EOFError:
+                    break
+        yield from self._rows
+
+    def append(self, row):
+        """
+        Add a row at the end of the buffer.
+
+        Args:
+            row: Picklable object with the row.
+
+        Returns:
+            Nothing.
+        """
+
+        self._rows.append(row)
+        self.count += 1
+        if len(self._rows) >= self._limit:
+            if self._file is None:
+                with contextlib.ExitStack() as stack:
+                    self._file = stack.enter_context(tempfile.TemporaryFile())
+                    self._stack = stack.pop_all()
+            pickle.dump(self._rows, self._file, pickle.HIGHEST_PROTOCOL)
+            self._rows = []
+
+    def close(self):
+        """
+        Delete the temporary file of the buffer.
+
+        Returns:
+            Nothing.
+        """
+
+        self._stack.close()
+        self._file = None
+
+
+class _PlainTextWriter:
     """
-    Compare contents of two folders and write a report of the results.
+    Write the comparison report to a plain text file as results come in.
+
+    The section of files only in the left folder is written straight away,
+    the later sections are kept in `_SpillBuffer` objects until `finish`.
+    Sizes come from the result records, files are not stat'ed again.
 
     Args:
         folder1: String with the directory of left folder.
         folder2: String with the directory of right folder.
-        output: Description of parameter `output`.
-        output_txt: Boolean variable to create an '.txt' file.
-        output_csv: Boolean variable to create an '.csv' file.
-
-    Returns:
-        Nothing.
+        output: String with the directory to write the '.txt' file.
+        compare_content: Boolean to add the section of files that differ.
+        detect_moves: Boolean to add the section of moved files.
     """
 
-    bln_remove_dir = [False, False]
+    def __init__(
+        self, folder1, folder2, output, compare_content=False, detect_moves=False
+    ):
+        self.folder1 = folder1
+        self.folder2 = folder2
+        self._left = 0
+        self._right = _SpillBuffer()
+        self._both = _SpillBuffer()
+        self._different = _SpillBuffer() if compare_content else None
+        self._moved = _SpillBuffer() if detect_moves else None
 
-    if zipfile.is_zipfile(folder1) or folder1.endswith(".zip"):
-        with zipfile.ZipFile(folder1, "r") as myzip:
-            unzipped1 = os.path.join(
-                os.path.abspath(os.path.join(folder1, os.pardir)), "folder1"
+        self.path = output + ".txt"
+        with contextlib.ExitStack() as stack:
+            for buffer in (self._right, self._both, self._different, self._moved):
+                if buffer is not None:
+                    stack.callback(buffer.close)
+            self._file = stack.enter_context(open(self.path, "w"))
+            self._file.write("COMPARISON OF FILES BETWEEN FOLDERS:\n")
+            self._file.write(
+                "\tFOLDER 1: {}\t\t{}\n".format(folder1, _file_size(folder1))
             )
-            myzip.extractall(unzipped1)
-            folder1 = unzipped1
-            bln_remove_dir[0] = True
-
-    if zipfile.is_zipfile(folder2) or folder2.endswith(".zip"):
-        with zipfile.ZipFile(folder2, "r") as myzip:
-            unzipped2 = os.path.join(
-                os.path.abspath(os.path.join(folder2, os.pardir)), "folder2"
+            self._file.write(
+                "\tFOLDER 2: {}\t\t{}\n".format(folder2, _file_size(folder2))
             )
-            myzip.extractall(unzipped2)
-            folder2 = unzipped2
-            bln_remove_dir[1] = True
+            self._file.write("\n\n")
+            self._file.write("FILES ONLY IN: {}\n".format(folder1))
+            self._stack = stack.pop_all()
 
-    # Make filepath names for output OS-agnostic
-    folder1 = os.path.normpath(folder1)
-    folder2 = os.path.normpath(folder2)
+    def add(self, result):
+        """
+        Add a result of the comparison to the report.
 
-    report = _recursive_dircmp(folder1, folder2, folder1, folder2)
+        Args:
+            result: Entry of a file or folder.
 
-    if output_txt:
-        _write_to_plain_text(folder1, folder2, output, report)
+        Returns:
+            Nothing.
+        """
 
-    if output_csv:
-        _write_to_csv(folder1, folder2, output, report)
+        if result.status == "left":
+            self._write_line(self.folder1, result.relpath, result.size1)
+            self._left += 1
+        elif result.status == "right":
+            self._right.append((result.relpath, result.size2))
+        elif result.status == "moved":
+            if self._moved is not None:
+                self._moved.append(
+                    (result.relpath, result.size1, result.target, result.size2)
+                )
+        else:
+            row = (result.relpath, result.size1, result.size2)
+            self._both.append(row)
+            if result.status == "different" and self._different is not None:
+                self._different.append(row)
 
-    if bln_remove_dir[0]:
-        shutil.rmtree(unzipped1, ignore_errors=True)
+    def finish(self):
+        """
+        Write the buffered sections to the file.
 
-    if bln_remove_dir[1]:
-        shutil.rmtree(unzipped2, ignore_errors=True)
+        Returns:
+            Nothing.
+        """
 
+        if not self._left:
+            self._file.write("\tNone\n")
+        self._file.write("\n\n")
 
-def _convert_bytes(num):
+        self._file.write("FILES ONLY IN: {}\n".format(self.folder2))
+        for relpath, size in self._right:
+            self._write_line(self.folder2, relpath, size)
+        if not self._right.count:
+            self._file.write("\tNone\n")
+        self._file.write("\n\n")
+
+        self._file.write("FILES IN BOTH FOLDERS:\n")
+        self._write_pairs(self._both)
+
+        if self._different is not None:
+            self._file.write("\n\n")
+            self._file.write("FILES WITH DIFFERENT CONTENT:\n")
+            self._write_pairs(self._different)
+
+        if self._moved is not None:
+            self._file.write("\n\n")
+            self._file.write("FILES MOVED:\n")
+            for relpath1, size1, relpath2, size2 in self._moved:
+                self._write_line(self.folder1, relpath1, size1)
+                self._write_line(self.folder2, relpath2, size2)
+            if not self._moved.count:
+                self._file.write("\tNone\n")
+
+    def close(self):
+        """
+        Close the file and drop the buffers.
+
+        Returns:
+            Nothing.
+        """
+
+        self._stack.close()
+
+    def _write_pairs(self, buffer):
+        """
+        Write the left and right path of every file in a buffer.
+
+        Args:
+            buffer: _SpillBuffer with the relative path and both sizes of files.
+
+        Returns:
+            Nothing.
+        """
+
+        for relpath, size1, size2 in buffer:
+            self._write_line(self.folder1, relpath, size1)
+            self._write_line(self.folder2, relpath, size2)
+        if not buffer.count:
+            self._file.write("\tNone\n")
+
+    def _write_line(self, folder, relpath, size):
+        """
+        Write the line of a file with its size.
+
+        Args:
+            folder: String with the directory the file is in.
+            relpath: String with the path relative to the folder.
+            size: Integer with the size of the file, None if not a file.
+
+        Returns:
+            Nothing.
+        """
+
+        path = os.path.join(folder, relpath)
+        self._file.write(f"\t{path:<100}|{format_size(size):>20}\n")
+
+
+class _CsvWriter:
     """
-    This function will convert bytes to KB, MB.
+    Write the comparison report to a CSV file for use in Excel.
 
-    Args:
-        num: Integer with the number of bytes.
+    Every section is a pair of columns side by side, so all of them are kept
+    in `_SpillBuffer` objects until `finish` writes the rows. Sizes come from
+    the result records, files are not stat'ed again.
 
-    Returns:
-        String with values converted.
+    Args:
+        folder1: String with the directory of left folder.
+        folder2: String with the directory of right folder.
+        output: String with the directory to write the '.csv' file.
+        compare_content: Boolean to add the columns of files that differ.
+        detect_moves: Boolean to add the columns of moved files.
     """
 
-    for x in ["bytes", "KB", "MB"]:
-        if num < 1024.0:
-            return "%3.2f %s" % (num, x)
-        num /= 1024.0
+    def __init__(
+        self, folder1, folder2, output, compare_content=False, detect_moves=False
+    ):
+        self.folder1 = folder1
+        self.folder2 = folder2
+        self._buffers = {"left": _SpillBuffer(), "right": _SpillBuffer()}
+        self._buffers["both"] = _SpillBuffer()
+        if compare_content:
+            self._buffers["different"] = _SpillBuffer()
+        if detect_moves:
+            self._buffers["moved"] = _SpillBuffer()
+
+        # Write header data to the first row
+        headers = (
+            'Files only in folder "{}"'.format(folder1),
+            "File size",
+            'Files only in folder "{}"'.format(folder2),
+            "File size",
+            'Files in both folders present on "{}"'.format(folder1),
+            "File size",
+            'Files in both folders present on "{}"'.format(folder2),
+            "File size",
+        )
+        if compare_content:
+            headers += (
+                'Files with different content on "{}"'.format(folder1),
+                'Files with different content on "{}"'.format(folder2),
+            )
+        if detect_moves:
+            headers += (
+                'Files moved from "{}"'.format(folder1),
+                "File size",
+                'Files moved to "{}"'.format(folder2),
+                "File size",
+            )
 
+        self.path = output + ".csv"
+        with contextlib.ExitStack() as stack:
+            for buffer in self._buffers.values():
+                stack.callback(buffer.close)
+            self._file = stack.enter_context(open(self.path, "w"))
+            self._writer = csv.writer(self._file, dialect="excel", lineterminator="\r")
+            self._writer.writerow(headers)
+            self._stack = stack.pop_all()
 
-def _file_size(file_path):
+    def add(self, result):
+        """
+        Add a result of the comparison to the report.
+
+        Args:
+            result: Entry of a file or folder.
+
+        Returns:
+            Nothing.
+        """
+
+        if result.status == "left":
+            self._buffers["left"].append((result.relpath, result.size1))
+        elif result.status == "right":
+            self._buffers["right"].append((result.relpath, result.size2))
+        elif result.status == "moved":
+            if "moved" in self._buffers:
+                self._buffers["moved"].append(
+                    (result.relpath, result.size1, result.target, result.size2)
+                )
+        else:
+            row = (result.relpath, result.size1, result.size2)
+            self._buffers["both"].append(row)
+            if result.status == "different" and "different" in self._buffers:
+                self._buffers["different"].append(row)
+
+    def finish(self):
+        """
+        Write the buffered columns to the file, row by row.
+
+        Returns:
+            Nothing.
+        """
+
+        columns = [
+            self._files(self.folder1, self._buffers["left"]),
+            self._files(self.folder2, self._buffers["right"]),
+            self._pairs(self._buffers["both"], sizes=True),
+        ]
+        widths = [2, 2, 4]
+        if "different" in self._buffers:
+            columns.append(self._pairs(self._buffers["different"], sizes=False))
+            widths.append(2)
+        if "moved" in self._buffers:
+            columns.append(self._moves(self._buffers["moved"]))
+            widths.append(4)
+
+        # Pad shorter columns with None, as Excel expects a full row
+        for cells in itertools.zip_longest(*columns):
+            row = []
+            for cell, width in zip(cells, widths):
+                row.extend((None,) * width if cell is None else cell)
+            self._writer.writerow(row)
+
+    def close(self):
+        """
+        Close the file and drop the buffers.
+
+        Returns:
+            Nothing.
+        """
+
+        self._stack.close()
+
+    def _files(self, folder, buffer):
+        """
+        Yield the path and size cells of the files of one folder.
+
+        Args:
+            folder: String with the directory the files are in.
+            buffer: _SpillBuffer with the relative path and size of files.
+
+        Yields:
+            Tuple with the path and the size of a file.
+        """
+
+        for relpath, size in buffer:
+            yield os.path.join(folder, relpath), format_size(size)
+
+    def _pairs(self, buffer, sizes):
+        """
+        Yield the cells of the files present in both folders.
+
+        Args:
+            buffer: _SpillBuffer with the relative path and both sizes of files.
+            sizes: Boolean to add the size after each path.
+
+        Yields:
+            Tuple with the left and right path, with their sizes if asked.
+        """
+
+        for relpath, size1, size2 in buffer:
+            path1 = os.path.join(self.folder1, relpath)
+            path2 = os.path.join(self.folder2, relpath)
+            if sizes:
+                yield path1, format_size(size1), path2, format_size(size2)
+            else:
+                yield path1, path2
+
+    def _moves(self, buffer):
+        """
+        Yield the cells of the moved files.
+
+        Args:
+            buffer: _SpillBuffer with the relative paths and sizes of both
+                sides of moved files.
+
+        Yields:
+            Tuple with the left path and size and the right path and size.
+        """
+
+        for relpath1, size1, relpath2, size2 in buffer:
+            yield (
+                os.path.join(self.folder1, relpath1),
+                format_size(size1),
+                os.path.join(self.folder2, relpath2),
+                format_size(size2),
+            )
+
+
+class _EntryCsvWriter:
     """
-    This function will return the file size if file exists on the filesystem.
+    Write the comparison report to a CSV file with one row per entry.
 
-    Args:
-        file_path: String with the file path to chak its size.
+    Unlike `_CsvWriter` nothing is buffered, every result is written as it
+    comes in with the columns of `ENTRY_COLUMNS`, ready to load in a database
+    or a dataframe.
 
-    Returns:
-        strReturn: String of the file's size converted.
+    Args:
+        folder1: String with the directory of left folder.
+        folder2: String with the directory of right folder.
+        output: String with the directory to write the '.entries.csv' file.
     """
 
-    if os.path.isfile(file_path):
-        file_info = os.stat(file_path)
-        strReturn = _convert_bytes(file_info.st_size)
-    else:
-        strReturn = ""
+    def __init__(self, folder1, folder2, output):
+        self.path = output + ".entries.csv"
+        with contextlib.ExitStack() as stack:
+            self._file = stack.enter_context(open(self.path, "w", newline=""))
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(ENTRY_COLUMNS)
+            self._stack = stack.pop_all()
 
-    return strReturn
+    def add(self, result):
+        """
+        Add a result of the comparison to the report.
+
+        Args:
+            result: Entry of a file or folder.
+
+        Returns:
+            Nothing.
+        """
+
+        self._writer.writerow(_entry_row(result))
 
+    def finish(self):
+        """
+        Nothing to write at the end, rows are written as they come.
 
-def _recursive_dircmp(folder1, folder2, prefix1=".", prefix2="."):
+        Returns:
+            Nothing.
+        """
+
+    def close(self):
+        """
+        Close the file.
+
+        Returns:
+            Nothing.
+        """
+
+        self._stack.close()
+
+
+class _SqliteWriter:
     """
-    Return a recursive dircmp comparison report as a dictionary.
+    Write the comparison report to a SQLite database, one row per entry.
+
+    Rows are inserted in batches of `SPILL_BUFFER_SIZE` in a single
+    transaction, the indexes on the path and the status are built once in
+    `finish`, which is faster than keeping them up to date while inserting.
 
     Args:
         folder1: String with the directory of left folder.
         folder2: String with the directory of right folder.
-        prefix1: String with the prefix of the directory 1 being searched.
-        prefix2: String with the prefix of the directory 2 being searched.
-
-    Returns:
-        data: Dictionary with the file comparison.
+        output: String with the directory to write the '.sqlite' file.
     """
 
-    comparison = filecmp.dircmp(folder1, folder2)
+    def __init__(self, folder1, folder2, output):
+        self.path = output + ".sqlite"
+        self._rows = []
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        with contextlib.ExitStack() as stack:
+            self._connection = sqlite3.connect(self.path)
+            stack.callback(self._connection.close)
+            self._connection.executescript(
+                """
+                PRAGMA journal_mode = OFF;
+                PRAGMA synchronous = OFF;
+                CREATE TABLE folders (folder1 TEXT, folder2 TEXT);
+                CREATE TABLE entries (
+                    status TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    size1 INTEGER,
+                    size2 INTEGER,
+                    mtime1 INTEGER,
+                    mtime2 INTEGER,
+                    target TEXT,
+                    offset INTEGER
+                );
+                """
+            )
+            self._connection.execute(
+                "INSERT INTO folders VALUES (?, ?)", (folder1, folder2)
+            )
+            self._stack = stack.pop_all()
+
+    def add(self, result):
+        """
+        Add a result of the comparison to the report.
 
-    data = {
-        "left": ["{}{}{}".format(prefix1, os.sep, i) for i in comparison.left_only],
-        "right": ["{}{}{}".format(prefix2, os.sep, i) for i in comparison.right_only],
-        "both": [
-            "{}{}{}***{}{}{}".format(prefix1, os.sep, i, prefix2, os.sep, i)
-            for i in comparison.common_files
-        ],
-    }
+        Args:
+            result: Entry of a file or folder.
 
-    for datalist in data.values():
-        datalist.sort()
+        Returns:
+            Nothing.
+        """
 
-    if comparison.common_dirs:
-        for folder in comparison.common_dirs:
-            # Update prefix to include new sub_folder
-            prefix1 = os.path.normpath(os.path.join(folder1, folder))
-            prefix2 = os.path.normpath(os.path.join(folder2, folder))
-            # Compare common folder and add results to the report
-            sub_folder1 = os.path.join(folder1, folder)
-            sub_folder2 = os.path.join(folder2, folder)
-            sub_report = _recursive_dircmp(sub_folder1, sub_folder2, prefix1, prefix2)
+        self._rows.append(_entry_row(result))
+        if len(self._rows) >= SPILL_BUFFER_SIZE:
+            self._flush()
 
-            # Add results from sub_report to main report
-            for key, value in sub_report.items():
-                data[key] += value
+    def finish(self):
+        """
+        Insert the last rows, index them and commit.
 
-    return data
+        Returns:
+            Nothing.
+        """
+
+        self._flush()
+        self._connection.executescript(
+            """
+            CREATE INDEX entries_path ON entries (path);
+            CREATE INDEX entries_status ON entries (status);
+            """
+        )
+        self._connection.commit()
+
+    def close(self):
+        """
+        Close the database.
+
+        Returns:
+            Nothing.
+        """
+
+        self._stack.close()
+
+    def _flush(self):
+        """
+        Insert the buffered rows in the database.
+
+        Returns:
+            Nothing.
+        """
+
+        self._connection.executemany(
+            "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", self._rows
+        )
+        self._rows = []
 
 
-def _write_to_plain_text(folder1, folder2, output, report):
+class _ParquetWriter:
     """
-    Write the comparison report to a plain text file.
+    Write the comparison report to a columnar Parquet file, one row per entry.
+
+    Needs pyarrow, installed with the 'parquet' extra. Rows are gathered in
+    columns and written as a row group every `PARQUET_ROW_GROUP_SIZE` rows.
 
     Args:
         folder1: String with the directory of left folder.
         folder2: String with the directory of right folder.
-        output: String with the directory to write the '.txt' file.
-        report: Dictionary with the data to be written on the file.
+        output: String with the directory to write the '.parquet' file.
+
+    Raises:
+        ValueError: If pyarrow is not installed.
+    """
+
+    def __init__(self, folder1, folder2, output):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError(
+                "Writing '.parquet' reports needs pyarrow, install "
+                "foldercompare[parquet]"
+            ) from None
+
+        self._pyarrow = pyarrow
+        self._schema = pyarrow.schema(
+            [
+                ("status", pyarrow.string()),
+                ("path", pyarrow.string()),
+                ("type", pyarrow.string()),
+                ("size1", pyarrow.int64()),
+                ("size2", pyarrow.int64()),
+                ("mtime1", pyarrow.int64()),
+                ("mtime2", pyarrow.int64()),
+                ("target", pyarrow.string()),
+                ("offset", pyarrow.int64()),
+            ],
+            metadata={"folder1": folder1, "folder2": folder2},
+        )
+        self._columns = [[] for _ in ENTRY_COLUMNS]
+        self.path = output + ".parquet"
+        with contextlib.ExitStack() as stack:
+            self._writer = stack.enter_context(
+                pyarrow.parquet.ParquetWriter(self.path, self._schema)
+            )
+            self._stack = stack.pop_all()
+
+    def add(self, result):
+        """
+        Add a result of the comparison to the report.
+
+        Args:
+            result: Entry of a file or folder.
+
+        Returns:
+            Nothing.
+        """
+
+        for column, value in zip(self._columns, _entry_row(result)):
+            column.append(value)
+        if len(self._columns[0]) >= PARQUET_ROW_GROUP_SIZE:
+            self._flush()
+
+    def finish(self):
+        """
+        Write the last row group.
+
+        Returns:
+            Nothing.
+        """
+
+        self._flush()
+
+    def close(self):
+        """
+        Close the file, writing its footer.
+
+        Returns:
+            Nothing.
+        """
+
+        self._stack.close()
+
+    def _flush(self):
+        """
+        Write the gathered rows as a row group.
+
+        Returns:
+            Nothing.
+        """
+
+        if self._columns[0]:
+            self._writer.write_table(
+                self._pyarrow.table(self._columns, schema=self._schema)
+            )
+            self._columns = [[] for _ in ENTRY_COLUMNS]
+
+
+def _entry_row(result):
+    """
+    Return the cells of an entry for the reports with one row per entry.
+
+    Args:
+        result: Entry of a file or folder.
 
     Returns:
-        Nothing.
+        Tuple with the values of `ENTRY_COLUMNS`.
+    """
+
+    return (
+        result.status,
+        result.relpath,
+        "dir" if result.is_dir else "file",
+        result.size1,
+        result.size2,
+        result.mtime1,
+        result.mtime2,
+        result.target,
+        result.offset,
+    )
+
+
+class _DeltaWriter:
+    """
+    Write the changes since the previous comparison to the same output.
+
+    Every result is saved in a SQLite database next to the report, one row
+    per path. In `finish` it is joined with the database of the previous run
+    on their primary keys, both sorted by path, and only the entries new,
+    removed or whose status or sizes changed are written. The database then
+    replaces the previous one for the next run. A previous run of another pair
+    of folders is only reported with a warning.
+
+    Args:
+        folder1: String with the directory of left folder.
+        folder2: String with the directory of right folder.
+        output: String with the directory to write the '.delta.txt' file, the
+            results are saved in `output` + '.state'.
     """
 
-    filename = output + ".txt"
-    with open(filename, "w") as file:
-        file.write("COMPARISON OF FILES BETWEEN FOLDERS:\n")
-        file.write("\tFOLDER 1: {}\t\t{}\n".format(folder1, _file_size(folder1)))
-        file.write("\tFOLDER 2: {}\t\t{}\n".format(folder2, _file_size(folder2)))
-        file.write("\n\n")
+    def __init__(self, folder1, folder2, output):
+        self.folder1 = folder1
+        self.folder2 = folder2
+        self.path = output + ".delta.txt"
+        self._state = output + ".state"
+        self._rows = []
+
+        self._new_state = self._state + ".new"
+        if os.path.exists(self._new_state):
+            os.remove(self._new_state)
+        with contextlib.ExitStack() as stack:
+            self._file = stack.enter_context(open(self.path, "w"))
+            stack.callback(self._remove_new_state)
+            self._connection = sqlite3.connect(self._new_state)
+            stack.callback(self._connection.close)
+            self._connection.executescript(
+                """
+                PRAGMA journal_mode = OFF;
+                PRAGMA synchronous = OFF;
+                CREATE TABLE run (folder1 TEXT, folder2 TEXT, time_ns INTEGER);
+                CREATE TABLE entries (
+                    path TEXT PRIMARY KEY,
+                    status INTEGER NOT NULL,
+                    size1 INTEGER,
+                    size2 INTEGER
+                ) WITHOUT ROWID;
+                """
+            )
+            self._connection.execute(
+                "INSERT INTO run VALUES (?, ?, ?)", self._pair() + (time.time_ns(),)
+            )
+            self._stack = stack.pop_all()
+
+    def add(self, result):
+        """
+        Add a result of the comparison to the saved results.
+
+        Args:
+            result: Entry of a file or folder.
+
+        Returns:
+            Nothing.
+        """
+
+        self._rows.append(
+            (
+                result.relpath,
+                STATUSES.index(result.status),
+                result.size1,
+                result.size2,
+            )
+        )
+        if len(self._rows) >= SPILL_BUFFER_SIZE:
+            self._flush()
+
+    def finish(self):
+        """
+        Write the changes since the previous run and keep this one's results.
+
+        Returns:
+            Nothing.
+        """
 
-        file.write("FILES ONLY IN: {}\n".format(folder1))
-        for item in report["left"]:
-            if item is not None:
-                file.write(
-                    f"\t{item:<100}|{str(_file_size(os.path.join(folder1, item))):>20}\n"
+        self._flush()
+        self._connection.commit()
+        self._file.write("CHANGES SINCE THE PREVIOUS COMPARISON OF FOLDERS:\n")
+        self._file.write("\tFOLDER 1: {}\n".format(self.folder1))
+        self._file.write("\tFOLDER 2: {}\n".format(self.folder2))
+
+        previous = None
+        if os.path.exists(self._state):
+            self._connection.execute("ATTACH DATABASE ? AS previous", (self._state,))
+            previous = self._connection.execute(
+                "SELECT folder1, folder2, time_ns FROM previous.run"
+            ).fetchone()
+            if previous[:2] != self._pair():
+                self._file.write(
+                    "\tWARNING: the previous run compared {} and {}\n".format(
+                        *previous[:2]
+                    )
                 )
-        if not report["left"]:
-            file.write("\tNone\n")
-        file.write("\n\n")
-
-        file.write("FILES ONLY IN: {}\n".format(folder2))
-        for item in report["right"]:
-            if item is not None:
-                file.write(
-                    f"\t{item:<100}|{str(_file_size(os.path.join(folder2, item))):>20}\n"
+                self._connection.execute("DETACH DATABASE previous")
+                previous = None
+
+        if previous is None:
+            count = self._connection.execute("SELECT count(*) FROM entries")
+            self._file.write(
+                "\tNo previous run, {} entries saved\n".format(count.fetchone()[0])
+            )
+        else:
+            self._file.write(
+                "\tPREVIOUS RUN: {}\n".format(
+                    datetime.datetime.fromtimestamp(previous[2] / 1e9).isoformat(
+                        " ", "seconds"
+                    )
                 )
-        if not report["right"]:
-            file.write("\tNone\n")
-        file.write("\n\n")
-
-        file.write("FILES IN BOTH FOLDERS:\n")
-        for item in report["both"]:
-            item1, item2 = item.split("***")
-            file.write(
-                f"\t{item1:<100}|{str(_file_size(os.path.join(folder1, item1))):>20}\n"
             )
-            file.write(
-                f"\t{item2:<100}|{str(_file_size(os.path.join(folder2, item2))):>20}\n"
+            for title, query in (
+                (
+                    "NEW ENTRIES:",
+                    """
+                    SELECT path, NULL, status, size1, size2 FROM entries
+                    WHERE path NOT IN (SELECT path FROM previous.entries)
+                    """,
+                ),
+                (
+                    "REMOVED ENTRIES:",
+                    """
+                    SELECT path, status, NULL, size1, size2 FROM previous.entries
+                    WHERE path NOT IN (SELECT path FROM entries)
+                    """,
+                ),
+                (
+                    "CHANGED ENTRIES:",
+                    """
+                    SELECT path, old.status, new.status, new.size1, new.size2
+                    FROM entries AS new JOIN previous.entries AS old USING (path)
+                    WHERE new.status != old.status
+                    OR new.size1 IS NOT old.size1 OR new.size2 IS NOT old.size2
+                    """,
+                ),
+            ):
+                self._file.write("\n\n{}\n".format(title))
+                found = False
+                for row in self._connection.execute(query + "ORDER BY path"):
+                    self._write_line(*row)
+                    found = True
+                if not found:
+                    self._file.write("\tNone\n")
+            self._connection.execute("DETACH DATABASE previous")
+
+        self._connection.close()
+        os.replace(self._new_state, self._state)
+
+    def close(self):
+        """
+        Close the file, dropping the results of an unfinished run.
+
+        Returns:
+            Nothing.
+        """
+
+        self._stack.close()
+
+    def _remove_new_state(self):
+        """
+        Delete the database of this run if it did not replace the previous one.
+
+        Returns:
+            Nothing.
+        """
+
+        if os.path.exists(self._new_state):
+            os.remove(self._new_state)
+
+    def _pair(self):
+        """
+        Identify the compared folders, whatever the working directory.
+
+        Returns:
+            Tuple of the absolute paths of both folders.
+        """
+
+        return (os.path.abspath(self.folder1), os.path.abspath(self.folder2))
+
+    def _flush(self):
+        """
+        Insert the buffered results in the database.
+
+        Returns:
+            Nothing.
+        """
+
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", self._rows
+        )
+        self._rows = []
+
+    def _write_line(self, relpath, old, new, size1, size2):
+        """
+        Write the line of an entry with its statuses and sizes.
+
+        Args:
+            relpath: String with the path relative to both folders.
+            old: Integer with the code of the previous status, None if new.
+            new: Integer with the code of the current status, None if removed.
+            size1: Integer with the size in the left folder, None if absent.
+            size2: Integer with the size in the right folder, None if absent.
+
+        Returns:
+            Nothing.
+        """
+
+        statuses = " -> ".join(
+            STATUSES[code] for code in (old, new) if code is not None
+        )
+        sizes = "{} / {}".format(format_size(size1), format_size(size2))
+        self._file.write(f"\t{relpath:<100}|{statuses:>20}|{sizes:>30}\n")
+
+
+def main(argv=None):
+    """
+    Compare two folders from the command line, streaming JSON Lines.
+
+    Every result is written to stdout as one JSON object per line while the
+    folders are walked, so a pipeline can act on the first differences before
+    the comparison ends. The exit status is 0 when the folders are identical,
+    1 when they differ, 2 on errors, like `diff`, 130 when interrupted and
+    141, quietly, when the reader of stdout goes away. Without `--content`,
+    files present in both folders are not told apart, so 0 only means the
+    same names are on both sides. With `--write-manifest` a manifest of the
+    first folder is written instead. With `--batch` the first argument is a
+    job file of `compare_batch`, one JSON line is written per pair as it ends
+    and the status is 2 if a pair failed.
+
+    Args:
+        argv: Optional list of strings with the arguments, defaults to
+            `sys.argv[1:]`.
+
+    Returns:
+        Integer with the exit status.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog="foldercompare-cli",
+        description="Compare two folders, '.zip' files or manifests, one JSON line "
+        "per result.",
+        epilog="The exit status is 0 when the folders are identical, 1 when they "
+        "differ and 2 on errors. Without --content only names are compared, so "
+        "0 means the same files are present on both sides.",
+    )
+    parser.add_argument("folder1", help="left directory, '.zip' file or manifest")
+    parser.add_argument(
+        "folder2", nargs="?", help="right directory, '.zip' file or manifest"
+    )
+    parser.add_argument(
+        "--write-manifest",
+        metavar="PATH",
+        help="write a manifest of folder1 to PATH instead of comparing, adding "
+        "'{}' when missing".format(MANIFEST_SUFFIX),
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="PATH",
+        help="compare the pairs of the job file folder1, writing '.txt' and '.csv' "
+        "reports for each one and the combined summary to PATH",
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="with --batch, also report the changes since the previous run of "
+        "every pair",
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=4,
+        help="pairs of a batch compared at once",
+    )
+    parser.add_argument(
+        "--no-digests",
+        dest="digests",
+        action="store_false",
+        help="leave the file digests out of the manifest",
+    )
+    parser.add_argument(
+        "-c",
+        "--content",
+        action="store_true",
+        help="compare the content of the files present in both folders",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="threads listing directories, use more for network shares",
+    )
+    parser.add_argument(
+        "--hash-workers",
+        type=int,
+        default=None,
+        help="processes hashing files, defaults to the number of CPUs",
+    )
+    parser.add_argument(
+        "--cache", default=None, help="SQLite file reusing digests of previous runs"
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="drop every digest of the cache before comparing",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        help="maximum size of the cache in bytes",
+    )
+    parser.add_argument(
+        "-m",
+        "--moves",
+        action="store_true",
+        help="report files only in one folder found in the other one as moved",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="skip sub folders of '.zip' files and manifests with the same digest",
+    )
+    parser.add_argument(
+        "-a",
+        "--archives",
+        action="store_true",
+        help="compare the archives present in both folders like sub folders",
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="skip entries matching a .gitignore style pattern, can be repeated",
+    )
+    parser.add_argument(
+        "--exclude-from",
+        action="append",
+        default=[],
+        metavar="FILE",
+        help="read exclude patterns from a .gitignore style file",
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="only compare files matching a pattern, can be repeated",
+    )
+    parser.add_argument(
+        "--min-size", type=int, default=None, help="skip files smaller (bytes)"
+    )
+    parser.add_argument(
+        "--max-size", type=int, default=None, help="skip files larger (bytes)"
+    )
+    parser.add_argument(
+        "--newer-than",
+        type=_parse_time,
+        default=None,
+        metavar="DATE",
+        help="skip files modified before an ISO 8601 date",
+    )
+    parser.add_argument(
+        "--older-than",
+        type=_parse_time,
+        default=None,
+        metavar="DATE",
+        help="skip files modified after an ISO 8601 date",
+    )
+    parser.add_argument(
+        "--status",
+        action="append",
+        choices=STATUSES,
+        help="only write results with this status, can be repeated",
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        help="write nothing, only set the exit status",
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="write the progress to stderr",
+    )
+    parser.add_argument(
+        "--stats",
+        metavar="PATH",
+        help="write the timings and counters of every phase to a JSON file",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="write cProfile statistics of the comparison, for pstats",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="add the peak of Python memory to the statistics, slower",
+    )
+    args = parser.parse_args(argv)
+    if args.folder2 is None and args.write_manifest is None and args.batch is None:
+        parser.error("folder2 is required to compare")
+    if args.clear_cache and not args.cache:
+        parser.error("--clear-cache needs --cache")
+    if args.delta and not args.batch:
+        parser.error("--delta needs --batch, which writes the reports")
+    if (args.stats or args.profile) and (args.write_manifest or args.batch):
+        parser.error(
+            "--stats and --profile cannot be used with --write-manifest or --batch"
+        )
+
+    statuses = set(args.status or STATUSES)
+    progress = _print_progress if args.progress else None
+    differ = False
+    cache = None
+    stats = None
+    if args.stats or args.profile:
+        stats = Stats(profile=bool(args.profile), trace_memory=args.trace_memory)
+    try:
+        exclude = list(args.exclude)
+        for path in args.exclude_from:
+            with open(path) as file:
+                exclude.extend(file.read().splitlines())
+        bounds = (args.min_size, args.max_size, args.newer_than, args.older_than)
+        filter = None
+        if exclude or args.include or any(bound is not None for bound in bounds):
+            filter = Filter(exclude, args.include, *bounds)
+
+        if args.cache:
+            cache = HashCache(args.cache, args.cache_size)
+            if args.clear_cache:
+                cache.clear()
+        if args.write_manifest:
+            write_manifest(
+                args.folder1,
+                args.write_manifest,
+                args.digests,
+                hash_workers=args.hash_workers,
+                cache=cache,
+                filter=filter,
+            )
+            return 0
+        if args.batch:
+            document = compare_batch(
+                _read_jobs(args.folder1),
+                True,
+                True,
+                args.parallel,
+                args.workers,
+                args.content,
+                args.hash_workers,
+                cache,
+                detect_moves=args.moves,
+                prune=args.prune,
+                filter=filter,
+                archives=args.archives,
+                summary=args.batch,
+                finished=None if args.quiet else _print_pair,
+                delta=args.delta,
             )
-        if not report["both"]:
-            file.write("\tNone\n")
+            if document["errors"]:
+                return 2
+            differ = any(
+                document["statuses"][status]
+                for status in ("left", "right", "different", "moved")
+            )
+            return 1 if differ else 0
+
+        results = _iter_comparison(
+            os.path.normpath(args.folder1),
+            os.path.normpath(args.folder2),
+            args.workers,
+            compare_content=args.content,
+            hash_workers=args.hash_workers,
+            cache=cache,
+            progress=progress,
+            detect_moves=args.moves,
+            prune=args.prune,
+            filter=filter,
+            stats=stats,
+            archives=args.archives,
+        )
+
+        if stats is not None:
+            stats.start(cache)
+        last_flush = time.monotonic()
+        for result in results:
+            if result.status in ("left", "right", "different", "moved"):
+                differ = True
+            if args.quiet or result.status not in statuses:
+                continue
+            sys.stdout.write(json.dumps(result.as_dict(), separators=(",", ":")))
+            sys.stdout.write("\n")
+            # Hand results over to the reader while the walk goes on
+            now = time.monotonic()
+            if now - last_flush >= PROGRESS_INTERVAL:
+                sys.stdout.flush()
+                last_flush = now
+        sys.stdout.flush()
+
+        if stats is not None:
+            stats.stop(cache)
+            if args.stats:
+                stats.write_json(args.stats)
+            if args.profile:
+                stats.profile.dump_stats(args.profile)
+    except BrokenPipeError:
+        # The reader went away, as `| head` does: send what is left to devnull
+        # so the flush at exit does not fail again
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.close(devnull)
+        return 141
+    except COMPARISON_ERRORS as error:
+        print("{}: error: {}".format(parser.prog, error), file=sys.stderr)
+        return 2
+    except (KeyboardInterrupt, Cancelled):
+        return 130
+    finally:
+        if cache is not None:
+            cache.close()
+
+    return 1 if differ else 0
 
 
-def _write_to_csv(folder1, folder2, output, report):
+def _print_pair(pair):
     """
-    Write the comparison report to a CSV file for use in Excel.
+    Write the summary of a pair of a batch to stdout as one JSON line.
 
     Args:
-        folder1: String with the directory of left folder.
-        folder2: String with the directory of right folder.
-        output: String with the directory to write the '.csv' file.
-        report: Dictionary with the data to be written on the file.
+        pair: Dictionary with the summary of the pair.
 
     Returns:
         Nothing.
     """
 
-    filename = output + ".csv"
-    with open(filename, "w") as file:
-        csv_writer = csv.writer(file, dialect="excel", lineterminator="\r")
+    sys.stdout.write(json.dumps(pair, separators=(",", ":")) + "\n")
+    sys.stdout.flush()
+
+
+def _print_progress(progress):
+    """
+    Write a progress line to stderr for the command line.
+
+    Args:
+        progress: Progress of the comparison.
+
+    Returns:
+        Nothing.
+    """
+
+    print(
+        "{} dirs, {} files, {} in {:.1f} s".format(
+            progress.dirs,
+            progress.files,
+            _convert_bytes(progress.bytes),
+            progress.elapsed,
+        ),
+        file=sys.stderr,
+    )
+
+
+def _parse_time(text):
+    """
+    Parse a date of the command line into a timestamp.
+
+    Args:
+        text: String with an ISO 8601 date, with an optional time.
+
+    Raises:
+        argparse.ArgumentTypeError: If the date is not valid.
+
+    Returns:
+        Float with the timestamp, in local time unless a timezone is given.
+    """
+
+    try:
+        return datetime.datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid date: {!r}".format(text))
 
-        # Write header data to the first row
-        headers = (
-            'Files only in folder "{}"'.format(folder1),
-            "File size",
-            'Files only in folder "{}"'.format(folder2),
-            "File size",
-            'Files in both folders present on "{}"'.format(folder1),
-            "File size",
-            'Files in both folders present on "{}"'.format(folder2),
-            "File size",
-        )
-        csv_writer.writerow(headers)
-
-        # Order report data to match with headers
-        data = (
-            report["left"],
-            [_file_size(x) for x in report["left"]],
-            report["right"],
-            [_file_size(x) for x in report["right"]],
-            [x.split("***")[0] for x in report["both"]],
-            [_file_size(x.split("***")[0]) for x in report["both"]],
-            [x.split("***")[1] for x in report["both"]],
-            [_file_size(x.split("***")[1]) for x in report["both"]],
-        )
-
-        # Write comparison data row by row to the CSV
-        row_index = 0
-        row_max = max(len(column) for column in data)
-        while row_index < row_max:
-            values = []
-            for column in data:
-                # Use data from column if it exists, otherwise use None
-                try:
-                    values += [column[row_index]]
-                except IndexError:
-                    values += [None]
 
-            csv_writer.writerow(values)
-            row_index += 1
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,14 +2,29 @@
 Lightweight cross-platform graphic interface for folder and '.zip' folders compare program.
 """
 
+import array
+import bisect
+import multiprocessing
 import os
+import queue
+import threading
 import tkinter as tk
 from tkinter import filedialog
 from tkinter import messagebox
+from tkinter import ttk
 import sys
 
 import foldercompare
 
+# Rows of the results view inserted at once, the next ones while scrolling
+PAGE_SIZE = 200
+
+# Milliseconds without typing before the results view is filtered
+FILTER_DELAY = 200
+
+# Entries matched against the filter between two turns of the event loop
+FILTER_CHUNK = 20_000
+
 
 class FolderComparisonGUI(tk.Frame):
     """
@@ -25,7 +40,18 @@ class FolderComparisonGUI(tk.Frame):
         filename: Name of '.txt' and '.csv' files that will be created.
         output_as_txt: Boolean to create or not the '.txt' file.
         output_as_csv: Boolean to create or not the '.txt' file.
+        output_as_entries: Boolean to create or not the '.entries.csv' file.
+        output_as_sqlite: Boolean to create or not the '.sqlite' database.
         zip_work: Boolean to activate the selection of '.zip' folders as input for comparison.
+        compare_content: Boolean to tell identical and different files apart by content.
+        detect_moves: Boolean to report files found in a different folder as moved.
+        archives: Boolean to compare the archives found in both folders like folders.
+        delta: Boolean to also report the changes since the previous run.
+        exclude: String with comma separated '.gitignore' patterns of entries to skip.
+        status: String with the progress of the running comparison.
+        cancel_event: threading.Event set to cancel the running comparison.
+        results: queue.Queue with the outcome of the comparison thread.
+        browser: ResultsBrowser of the last comparison, None before the first.
         set_design_options: Function to set the widgets properties before placing them in the GUI.
         create_widgets: Create the widgets on GUI launch.
         set_dir_options: Function to set properties for selecting directories.
@@ -47,8 +73,19 @@ class FolderComparisonGUI(tk.Frame):
         self.output_as_txt.set(1)
         self.output_as_csv = tk.BooleanVar()
         self.output_as_csv.set(1)
+        self.output_as_entries = tk.BooleanVar()
+        self.output_as_sqlite = tk.BooleanVar()
         self.zip_work = tk.BooleanVar()
         self.zip_work.set(1)
+        self.compare_content = tk.BooleanVar()
+        self.detect_moves = tk.BooleanVar()
+        self.archives = tk.BooleanVar()
+        self.delta = tk.BooleanVar()
+        self.exclude = tk.StringVar()
+        self.status = tk.StringVar()
+        self.cancel_event = threading.Event()
+        self.results = queue.Queue()
+        self.browser = None
 
         self.set_design_options()
         self.create_widgets()
@@ -171,11 +208,71 @@ class FolderComparisonGUI(tk.Frame):
             variable=self.output_as_csv,
         ).pack()
 
-        tk.Button(
+        tk.Checkbutton(
+            self,
+            text=".entries.csv (one row per entry)",
+            variable=self.output_as_entries,
+        ).pack()
+
+        tk.Checkbutton(
+            self,
+            text=".sqlite",
+            variable=self.output_as_sqlite,
+        ).pack()
+
+        tk.Checkbutton(
+            self,
+            text="Compare file content",
+            variable=self.compare_content,
+        ).pack()
+
+        tk.Checkbutton(
+            self,
+            text="Detect moved files",
+            variable=self.detect_moves,
+        ).pack()
+
+        tk.Checkbutton(
+            self,
+            text="Look inside archives",
+            variable=self.archives,
+        ).pack()
+
+        tk.Checkbutton(
+            self,
+            text="Report changes since last run",
+            variable=self.delta,
+        ).pack()
+
+        tk.Label(
+            self,
+            text="Exclude (.gitignore patterns, comma separated)",
+        ).pack()
+
+        tk.Entry(self, textvariable=self.exclude).pack()
+
+        self.run_button = tk.Button(
             self,
             text="Run",
             command=self.validate_and_run,
-        ).pack(**self.button_options)
+        )
+        self.run_button.pack(**self.button_options)
+
+        self.progress_bar = ttk.Progressbar(self, mode="determinate", maximum=100)
+        self.progress_bar.pack(**self.button_options)
+
+        tk.Label(
+            self,
+            textvariable=self.status,
+        ).pack()
+
+        self.cancel_button = tk.Button(
+            self,
+            text="Cancel",
+            command=self.cancel_event.set,
+            state=tk.DISABLED,
+        )
+        self.cancel_button.pack(**self.button_options)
 
     def define_selection(self, variable):
         """
@@ -220,7 +317,11 @@ class FolderComparisonGUI(tk.Frame):
         self.file_options = {
             "initialdir": r"{}".format(os.getcwd()),
             "parent": self.root,
-            "filetypes": (("Zip files", "*.zip"), ("all files", "*.*")),
+            "filetypes": (
+                ("Zip files", "*.zip"),
+                ("Manifests", "*" + foldercompare.MANIFEST_SUFFIX),
+                ("all files", "*.*"),
+            ),
             "title": "Choose a .zip folder",
         }
 
@@ -264,7 +365,21 @@ class FolderComparisonGUI(tk.Frame):
         folder2_is_valid = os.path.exists(self.folder2.get())
         folder_output_is_valid = os.path.exists(self.folder_output.get())
         output_name_valid = self.filename.get()
-        output_type_selected = self.output_as_txt.get() or self.output_as_csv.get()
+        output_type_selected = (
+            self.output_as_txt.get()
+            or self.output_as_csv.get()
+            or self.output_as_entries.get()
+            or self.output_as_sqlite.get()
+        )
+        patterns = [
+            pattern.strip()
+            for pattern in self.exclude.get().split(",")
+            if pattern.strip()
+        ]
+        try:
+            rules = foldercompare.Filter(patterns) if patterns else None
+        except ValueError as error:
+            rules = error
 
         # Show error if validation failed
         if not folder1_is_valid:
@@ -281,30 +396,619 @@ class FolderComparisonGUI(tk.Frame):
             messagebox.showerror(
                 "Error", "Please select at least one option as output (.csv or .txt)"
             )
+        elif isinstance(rules, ValueError):
+            messagebox.showerror("Error", str(rules))
         else:
             # Determine name for output file(s)
             folder = self.folder_output.get()
             filename = self.filename.get().split(".")[0]
             output_filename = os.path.join(folder, filename)
 
-            # Run the folder compare program
+            # Run the folder compare program off the main loop
+            kwargs = {
+                "output_txt": self.output_as_txt.get(),
+                "output_csv": self.output_as_csv.get(),
+                "output_entries": self.output_as_entries.get(),
+                "output_sqlite": self.output_as_sqlite.get(),
+                "compare_content": self.compare_content.get(),
+                "detect_moves": self.detect_moves.get(),
+                "archives": self.archives.get(),
+                "delta": self.delta.get(),
+                "filter": rules,
+                "result": foldercompare.ComparisonResult(
+                    self.folder1.get(), self.folder2.get()
+                ),
+                "progress": lambda progress: self.results.put(("progress", progress)),
+                "cancel": self.cancel_event,
+            }
+            if self.browser is not None and self.browser.winfo_exists():
+                self.browser.destroy()
+            self.browser = ResultsBrowser(self.root, kwargs["result"])
+            self.cancel_event.clear()
+            self.run_button.config(state=tk.DISABLED)
+            self.cancel_button.config(state=tk.NORMAL)
+            self.progress_bar["value"] = 0
+            self.status.set("Comparing...")
+            threading.Thread(
+                target=self.run_comparison,
+                args=(self.folder1.get(), self.folder2.get(), output_filename),
+                kwargs=kwargs,
+                daemon=True,
+            ).start()
+            self.after(100, self.poll_results)
+
+    def run_comparison(self, folder1, folder2, output, **kwargs):
+        """
+        Run the comparison, in a worker thread, and queue its outcome.
+
+        Args:
+            folder1: String with the left folder or '.zip' file.
+            folder2: String with the right folder or '.zip' file.
+            output: String with the path of the output file(s) without extension.
+            **kwargs: Options passed to `foldercompare.compare`.
+
+        Returns:
+            Nothing.
+        """
+
+        try:
+            foldercompare.compare(folder1, folder2, output, **kwargs)
+        except foldercompare.Cancelled:
+            self.results.put(("cancelled", None))
+        except Exception as error:
+            self.results.put(("error", error))
+        else:
+            self.results.put(("done", None))
+
+    def poll_results(self):
+        """
+        Show the progress queued by the comparison thread, on the main loop.
+
+        Returns:
+            Nothing.
+        """
+
+        # The results view fills in while the comparison runs
+        if self.browser.winfo_exists():
+            self.browser.refresh()
+
+        while True:
             try:
-                foldercompare.compare(
-                    self.folder1.get(),
-                    self.folder2.get(),
-                    output_filename,
-                    output_txt=self.output_as_txt.get(),
-                    output_csv=self.output_as_csv.get(),
-                )
-            except Exception:
+                kind, value = self.results.get_nowait()
+            except queue.Empty:
+                self.after(100, self.poll_results)
+                return
+
+            if kind == "progress":
+                self.show_progress(value)
+                continue
+
+            if self.browser.winfo_exists():
+                self.browser.refresh()
+            self.run_button.config(state=tk.NORMAL)
+            self.cancel_button.config(state=tk.DISABLED)
+            self.status.set("")
+            self.progress_bar["value"] = 0
+            if kind == "done":
+                messagebox.showinfo("Success!", "Folder comparison complete")
+            elif kind == "cancelled":
+                messagebox.showinfo("Cancelled", "Folder comparison cancelled")
+            else:
                 messagebox.showerror(
                     "Error", "An error has occurred, please try again."
                 )
-            else:
-                messagebox.showinfo("Success!", "Folder comparison complete")
+            return
+
+    def show_progress(self, progress):
+        """
+        Update the progress bar and the rates of the running comparison.
+
+        Args:
+            progress: foldercompare.Progress of the comparison.
+
+        Returns:
+            Nothing.
+        """
+
+        self.progress_bar["value"] = 100 * progress.fraction
+        elapsed = progress.elapsed or 1e-9
+        text = "{} files ({}/s), {} ({}/s)".format(
+            progress.files,
+            int(progress.files / elapsed),
+            foldercompare.format_size(progress.bytes),
+            foldercompare.format_size(progress.bytes / elapsed),
+        )
+        if progress.eta is not None:
+            text += ", about {:.0f} s left".format(progress.eta)
+        self.status.set(text)
+
+
+class ResultIndex:
+    """
+    Index of a comparison result, updated while the comparison fills it.
+
+    The rows of the foldercompare.ComparisonResult are read by index, so no
+    Entry is built to index or filter a row, and the indexes are kept in
+    `array` objects, like the columns of the result.
+
+    Args:
+        result: foldercompare.ComparisonResult, possibly still appended to by
+            the comparison thread.
+
+    Attributes:
+        count: Integer with the number of entries indexed.
+        entries: Dictionary mapping every directory relative to the roots to
+            the array of indexes of its entries.
+        subdirs: Dictionary mapping every directory to the sorted list of the
+            names of its sub folders holding entries.
+        by_status: List with the array of indexes of every status, in the
+            order of `foldercompare.STATUSES`.
+    """
+
+    def __init__(self, result):
+        self.result = result
+        self.count = 0
+        self.entries = {"": array.array("L")}
+        self.subdirs = {"": []}
+        self.by_status = [array.array("L") for _ in foldercompare.STATUSES]
+
+    def update(self):
+        """
+        Index the entries appended since the last update.
+
+        Returns:
+            Range of the indexes of the new entries.
+        """
+
+        result = self.result
+        start, self.count = self.count, len(result)
+        for index in range(start, self.count):
+            reldir = result.directory(index)
+            if reldir not in self.entries:
+                self._add_dir(reldir)
+            self.entries[reldir].append(index)
+            self.by_status[result.status_code(index)].append(index)
+        return range(start, self.count)
+
+    def matching(self, indexes, name="", status=None, min_size=None):
+        """
+        Select the entries matching a filter.
+
+        Args:
+            indexes: Iterable of integers with the entries to look at.
+            name: String the lower case name of the entries must contain.
+            status: Optional string with the status of the entries.
+            min_size: Optional integer with the minimum size in bytes.
+
+        Returns:
+            Array of the indexes of the matching entries.
+        """
+
+        result = self.result
+        code = None if status is None else foldercompare.STATUSES.index(status)
+        matches = array.array("L")
+        for index in indexes:
+            if code is not None and result.status_code(index) != code:
+                continue
+            if min_size is not None:
+                size1, size2 = result.sizes(index)
+                size = size2 if size1 is None else size1
+                if size is None or size < min_size:
+                    continue
+            if name and name not in result.name(index).lower():
+                continue
+            matches.append(index)
+        return matches
+
+    def iter_matching(self, indexes, name="", status=None, min_size=None):
+        """
+        Select the entries matching a filter `FILTER_CHUNK` entries at a time.
+
+        After the given entries, the entries indexed since the first chunk are
+        looked at too, so the matches are complete once the iterator ends
+        even if `update` was called meanwhile.
+
+        Args:
+            indexes: Sequence of integers with the entries indexed so far to
+                look at, it may grow while iterating.
+            name: String the lower case name of the entries must contain.
+            status: Optional string with the status of the entries.
+            min_size: Optional integer with the minimum size in bytes.
+
+        Yields:
+            Array of the indexes of the matching entries of every chunk.
+        """
+
+        count, stop = self.count, len(indexes)
+        for start in range(0, stop, FILTER_CHUNK):
+            chunk = indexes[start : min(stop, start + FILTER_CHUNK)]
+            yield self.matching(chunk, name, status, min_size)
+        while count < self.count:
+            start, count = count, min(self.count, count + FILTER_CHUNK)
+            yield self.matching(range(start, count), name, status, min_size)
+
+    def _add_dir(self, reldir):
+        """
+        Add a directory and its missing parents to the tree of folders.
+
+        Args:
+            reldir: String with the directory relative to the roots.
+
+        Returns:
+            Nothing.
+        """
+
+        while reldir not in self.entries:
+            self.entries[reldir] = array.array("L")
+            self.subdirs.setdefault(reldir, [])
+            parent, name = os.path.split(reldir)
+            bisect.insort(
+                self.subdirs.setdefault(parent, []), name, key=os.path.normcase
+            )
+            reldir = parent
+
+
+class ResultsBrowser(tk.Toplevel):
+    """
+    Window browsing the result of a comparison while it runs.
+
+    The entries are shown in a ttk.Treeview as a tree of folders, a folder is
+    only filled in when opened and only `PAGE_SIZE` rows at a time: the next
+    page is added when the "more" row at its end scrolls into view. Typing a
+    name, picking a status or a minimum size shows a flat list of the matching
+    entries instead, matched `FILTER_CHUNK` entries at a time between turns
+    of the event loop; while the name only grows, the previous matches are
+    narrowed down instead of looking at every entry again.
+
+    Args:
+        master: Parent widget.
+        result: foldercompare.ComparisonResult filled by the comparison.
+
+    Attributes:
+        index: ResultIndex of the result.
+        name: String the names of the entries shown must contain.
+        status: String with the status of the entries shown, "all" for any.
+        min_size: String with the minimum size in bytes of the entries shown.
+        summary: String with the counts of the entries by status.
+    """
+
+    def __init__(self, master, result):
+        tk.Toplevel.__init__(self, master)
+        self.title("Comparison results")
+        self.index = ResultIndex(result)
+        self.name = tk.StringVar()
+        self.status = tk.StringVar(value="all")
+        self.min_size = tk.StringVar()
+        self.summary = tk.StringVar()
+        # Flat list of the matching entries, None while showing the tree
+        self._matches = None
+        self._query = None
+        self._pending = None
+        # Iterator of the chunks of matches still to find and its next turn
+        self._scan = None
+        self._scan_job = None
+
+        self.create_widgets()
+        for variable in (self.name, self.status, self.min_size):
+            variable.trace_add("write", self.schedule_filter)
+        self.show_tree()
+
+    def create_widgets(self):
+        """
+        Create the filter fields, the Treeview and the summary.
+
+        Returns:
+            Nothing.
+        """
+
+        bar = tk.Frame(self)
+        bar.pack(fill=tk.X)
+        tk.Label(bar, text="Name").pack(side=tk.LEFT)
+        tk.Entry(bar, textvariable=self.name).pack(side=tk.LEFT)
+        tk.Label(bar, text="Status").pack(side=tk.LEFT)
+        ttk.Combobox(
+            bar,
+            textvariable=self.status,
+            values=("all",) + foldercompare.STATUSES,
+            state="readonly",
+            width=10,
+        ).pack(side=tk.LEFT)
+        tk.Label(bar, text="Min size (bytes)").pack(side=tk.LEFT)
+        tk.Entry(bar, textvariable=self.min_size, width=12).pack(side=tk.LEFT)
+
+        frame = tk.Frame(self)
+        frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(frame, columns=("status", "size1", "size2"))
+        self.tree.heading("#0", text="Path")
+        self.tree.column("#0", width=500)
+        for column, text in (
+            ("status", "Status"),
+            ("size1", "Size in folder 1"),
+            ("size2", "Size in folder 2"),
+        ):
+            self.tree.heading(column, text=text)
+            self.tree.column(column, width=120, anchor=tk.E)
+        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(
+            yscrollcommand=lambda first, last: self.on_scroll(scrollbar, first, last)
+        )
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.bind("<<TreeviewOpen>>", self.open_folder)
+
+        tk.Label(self, textvariable=self.summary).pack()
+
+    def refresh(self):
+        """
+        Show the entries the comparison added since the last refresh.
+
+        Returns:
+            Nothing.
+        """
+
+        new = self.index.update()
+        if not new:
+            return
+
+        if self._matches is None:
+            for reldir in self._shown:
+                self._add_subdirs(reldir)
+                self._load(reldir)
+        else:
+            # A running scan gets to the new entries itself
+            if self._scan is None:
+                self._matches.extend(self.index.matching(new, *self._query))
+            self._load(None)
+        self.after_idle(self.load_visible)
+
+        counts = [len(indexes) for indexes in self.index.by_status]
+        self.summary.set(
+            "{} entries: ".format(self.index.count)
+            + ", ".join(
+                "{} {}".format(count, status)
+                for status, count in zip(foldercompare.STATUSES, counts)
+                if count
+            )
+        )
+
+    def show_tree(self):
+        """
+        Show the tree of folders, with the root folder filled in.
+
+        Returns:
+            Nothing.
+        """
+
+        self._clear()
+        self._fill_folder("")
+
+    def open_folder(self, event):
+        """
+        Fill a folder in the first time it is opened.
+
+        Args:
+            event: tkinter event of the Treeview.
+
+        Returns:
+            Nothing.
+        """
+
+        reldir = self._reldirs.get(self.tree.focus())
+        if reldir is not None and reldir not in self._shown:
+            self.tree.delete(*self.tree.get_children(self._items[reldir]))
+            self._fill_folder(reldir)
+            self.after_idle(self.load_visible)
+
+    def on_scroll(self, scrollbar, first, last):
+        """
+        Move the scrollbar and load the pages scrolled into view.
+
+        Args:
+            scrollbar: ttk.Scrollbar of the Treeview.
+            first: String with the fraction of the first row shown.
+            last: String with the fraction of the last row shown.
+
+        Returns:
+            Nothing.
+        """
+
+        scrollbar.set(first, last)
+        self.after_idle(self.load_visible)
+
+    def load_visible(self):
+        """
+        Replace the "more" rows in view with the next page of their entries.
+
+        Returns:
+            Nothing.
+        """
+
+        for key, item in list(self._more.items()):
+            if self.tree.exists(item) and self.tree.bbox(item):
+                self.tree.delete(item)
+                del self._more[key]
+                self._load(key)
+
+    def schedule_filter(self, *args):
+        """
+        Filter the entries once typing pauses for `FILTER_DELAY` ms.
+
+        Args:
+            *args: Arguments of the variable trace.
+
+        Returns:
+            Nothing.
+        """
+
+        if self._pending is not None:
+            self.after_cancel(self._pending)
+        self._pending = self.after(FILTER_DELAY, self.apply_filter)
+
+    def apply_filter(self):
+        """
+        Show the entries matching the filter fields, or the tree without one.
+
+        Returns:
+            Nothing.
+        """
+
+        self._pending = None
+        try:
+            min_size = int(self.min_size.get()) if self.min_size.get().strip() else None
+        except ValueError:
+            return
+        status = None if self.status.get() == "all" else self.status.get()
+        query = (self.name.get().strip().lower(), status, min_size)
+        previous, self._query = self._query, query
+        complete = self._scan is None
+        if self._scan_job is not None:
+            self.after_cancel(self._scan_job)
+        self._scan = self._scan_job = None
+        if query == ("", None, None):
+            self._matches = self._query = None
+            self.show_tree()
+            return
+
+        if (
+            self._matches is not None
+            and complete
+            and previous[1:] == query[1:]
+            and previous[0] in query[0]
+        ):
+            # A longer name only matches entries the shorter one matched
+            candidates = self._matches
+        elif status is not None:
+            candidates = self.index.by_status[foldercompare.STATUSES.index(status)]
+        else:
+            candidates = range(self.index.count)
+        self._matches = array.array("L")
+        self._scan = self.index.iter_matching(candidates, *query)
+
+        self._clear()
+        self._positions[None] = 0
+        self.scan_matches()
+
+    def scan_matches(self):
+        """
+        Match the next chunk of entries and show the first matches.
+
+        Returns:
+            Nothing.
+        """
+
+        matches = next(self._scan, None)
+        if matches is None:
+            self._scan = self._scan_job = None
+            return
+        self._matches.extend(matches)
+        self._load(None)
+        if None in self._more:
+            more = len(self._matches) - self._positions[None]
+            self.tree.item(self._more[None], text="{} more...".format(more))
+        self.after_idle(self.load_visible)
+        # Let the window handle its events before the next chunk
+        self._scan_job = self.after(1, self.scan_matches)
+
+    def _clear(self):
+        """
+        Remove every row of the Treeview.
+
+        Returns:
+            Nothing.
+        """
+
+        self.tree.delete(*self.tree.get_children())
+        # Item of every folder shown and back, "" for the root
+        self._items = {"": ""}
+        self._reldirs = {}
+        # Names of the sub folders inserted in every folder filled in
+        self._shown = {}
+        # Entries inserted and "more" row of every folder, None for the list
+        self._positions = {}
+        self._more = {}
+
+    def _fill_folder(self, reldir):
+        """
+        Insert the sub folders and the first page of entries of a folder.
+
+        Args:
+            reldir: String with the folder relative to the roots.
+
+        Returns:
+            Nothing.
+        """
+
+        self._shown[reldir] = set()
+        self._positions[reldir] = 0
+        self._add_subdirs(reldir)
+        self._load(reldir)
+
+    def _add_subdirs(self, reldir):
+        """
+        Insert the sub folders of a folder not shown yet, in name order.
+
+        Args:
+            reldir: String with the folder relative to the roots.
+
+        Returns:
+            Nothing.
+        """
+
+        shown = self._shown[reldir]
+        for position, name in enumerate(self.index.subdirs.get(reldir, ())):
+            if name in shown:
+                continue
+            subdir = os.path.join(reldir, name)
+            item = self.tree.insert(self._items[reldir], position, text=name)
+            # Placeholder so that the folder can be opened
+            self.tree.insert(item, "end", text="...")
+            self._items[subdir] = item
+            self._reldirs[item] = subdir
+            shown.add(name)
+
+    def _load(self, key):
+        """
+        Insert the next page of entries of a folder or of the matches.
+
+        Args:
+            key: String with the folder relative to the roots, None for the
+                list of matches.
+
+        Returns:
+            Nothing.
+        """
+
+        if key in self._more:
+            return
+        indexes = self._matches if key is None else self.index.entries.get(key, [])
+        parent = "" if key is None else self._items[key]
+        start = self._positions[key]
+        stop = min(len(indexes), start + PAGE_SIZE)
+        for index in indexes[start:stop]:
+            entry = self.index.result[index]
+            text = entry.relpath if key is None else entry.name
+            if entry.target is not None:
+                text += " -> " + entry.target
+            self.tree.insert(
+                parent,
+                "end",
+                text=text,
+                values=(
+                    entry.status,
+                    foldercompare.format_size(entry.size1),
+                    foldercompare.format_size(entry.size2),
+                ),
+            )
+        self._positions[key] = stop
+        if stop < len(indexes):
+            self._more[key] = self.tree.insert(
+                parent, "end", text="{} more...".format(len(indexes) - stop)
+            )
 
 
 def main():
+    # Content comparison hashes on a process pool, needed by the frozen .exe
+    multiprocessing.freeze_support()
     ROOT = tk.Tk()
     FolderComparisonGUI(ROOT).pack()
     ROOT.mainloop()
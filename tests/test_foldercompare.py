@@ -1,10 +1,23 @@
 """Test the foldercompare.py module."""
 
+import asyncio
+import concurrent.futures
+import contextlib
+import csv
 import filecmp
+import importlib.util
+import io
+import json
 import os
 import shutil
+import sqlite3
+import struct
+import tarfile
+import threading
 import time
 import unittest
+import zipfile
+from unittest import mock
 
 import foldercompare
 
@@ -93,12 +106,1083 @@ class TestRecursiveDircmpReport(unittest.TestCase):
         report = foldercompare._recursive_dircmp(self.folder1, self.folder2)
         self.assertIn(os.path.join("subdir", "hello_world.txt"), report["left"][0])
 
+    def test_ignored_names_skipped(self):
+        """Names ignored by filecmp.dircmp are not walked nor reported."""
+
+        for folder in [self.folder1, self.folder2]:
+            os.makedirs(os.path.join(folder, "__pycache__"), exist_ok=True)
+        os.makedirs(os.path.join(self.folder1, ".git"), exist_ok=True)
+
+        report = foldercompare._recursive_dircmp(self.folder1, self.folder2)
+        self.assertEqual(report, {"left": [], "right": [], "both": []})
+
+    def test_file_and_directory_with_same_name(self):
+        """A name that is a file on one side and a folder on the other is skipped."""
+
+        os.makedirs(os.path.join(self.folder1, "name"), exist_ok=True)
+        with open(os.path.join(self.folder2, "name"), "w+") as file:
+            file.write("hello world")
+
+        report = foldercompare._recursive_dircmp(self.folder1, self.folder2)
+        self.assertEqual(report, {"left": [], "right": [], "both": []})
+
+    def test_filter_rules(self):
+        """Filtered out entries are not reported, excluded folders not listed."""
+
+        for folder in [self.folder1, self.folder2]:
+            for relpath, data in [
+                ("keep.txt", "kept"),
+                ("debug.log", "log"),
+                ("important.log", "log"),
+                ("big.txt", "x" * 100),
+                (os.path.join("node_modules", "lib.js"), "js"),
+                (os.path.join("src", "main.py"), "py"),
+            ]:
+                path = os.path.join(folder, relpath)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w") as file:
+                    file.write(data)
+
+        rules = foldercompare.Filter(
+            ["# build output", "node_modules/", "*.log", "!important.log"],
+            max_size=10,
+        )
+        with mock.patch.object(
+            foldercompare, "_list_dir", wraps=foldercompare._list_dir
+        ) as list_dir:
+            result = foldercompare.compare_trees(
+                self.folder1, self.folder2, filter=rules
+            )
+        self.assertEqual(
+            [entry.relpath for entry in result],
+            ["important.log", "keep.txt", os.path.join("src", "main.py")],
+        )
+        listed = [os.path.basename(call.args[0]) for call in list_dir.call_args_list]
+        self.assertNotIn("node_modules", listed)
+
+        rules = foldercompare.Filter(include=["src/*.py"])
+        result = foldercompare.compare_trees(self.folder1, self.folder2, filter=rules)
+        self.assertEqual(
+            [entry.relpath for entry in result], [os.path.join("src", "main.py")]
+        )
+
+    def test_matches_dircmp_order(self):
+        """Report on the control data keeps the depth-first dircmp order."""
+
+        report = foldercompare._recursive_dircmp(FOLDER1, FOLDER2, FOLDER1, FOLDER2)
+        self.assertEqual(
+            report["left"],
+            [
+                os.path.join(FOLDER1, "test_text.txt"),
+                os.path.join(FOLDER1, "test_word.docx"),
+                os.path.join(FOLDER1, "test_folder", "test_image.bmp"),
+            ],
+        )
+        self.assertEqual(report["right"], [])
+        self.assertEqual(len(report["both"]), 4)
+
+    def test_parallel_walk_same_report(self):
+        """Listing directories on a thread pool gives the same ordered report."""
+
+        for index, folder in enumerate([self.folder1, self.folder2]):
+            for name in ["a", "b", os.path.join("b", "c"), "d"]:
+                subdir = os.path.join(folder, name)
+                os.makedirs(subdir, exist_ok=True)
+                for number in range(index, 4):
+                    with open(os.path.join(subdir, f"{number}.txt"), "w+") as file:
+                        file.write("hello world")
+
+        report = foldercompare._recursive_dircmp(self.folder1, self.folder2)
+        parallel = foldercompare._recursive_dircmp(
+            self.folder1, self.folder2, workers=4
+        )
+        self.assertEqual(report, parallel)
+        self.assertEqual(len(report["left"]), 4)
+
+    def test_parallel_walk_bounded(self):
+        """The parallel walk lists at most twice the workers ahead of the reader."""
+
+        for folder in [self.folder1, self.folder2]:
+            for number in range(40):
+                os.makedirs(os.path.join(folder, "d{}".format(number)), exist_ok=True)
+
+        trees = [
+            foldercompare._open_tree(self.folder1),
+            foldercompare._open_tree(self.folder2),
+        ]
+        with mock.patch.object(
+            foldercompare, "_compare_dir", wraps=foldercompare._compare_dir
+        ) as compare_dir:
+            for taken, _ in enumerate(foldercompare._walk_trees(*trees, workers=2), 1):
+                # A slow reader lets the pool run ahead
+                time.sleep(0.01)
+                self.assertLessEqual(compare_dir.call_count, taken + 4)
+        self.assertEqual(compare_dir.call_count, 41)
+
+    def test_report_without_stat(self):
+        """The report has no sizes, so files are not stat'ed for it."""
+
+        with mock.patch.object(foldercompare, "_entry_size") as entry_size:
+            report = foldercompare._recursive_dircmp(FOLDER1, FOLDER2, FOLDER1, FOLDER2)
+        entry_size.assert_not_called()
+        self.assertEqual(len(report["both"]), 4)
+
+    def test_compare_content(self):
+        """Common files are split into identical and different by content."""
+
+        size = 3 * foldercompare.PARTIAL_HASH_SIZE
+        middle = bytearray(b"a" * size)
+        middle[size // 2] = ord("b")
+        contents = {
+            "same.bin": (b"a" * size, b"a" * size),
+            "empty.txt": (b"", b""),
+            "size.txt": (b"foo", b"foobar"),
+            "small.txt": (b"foo", b"bar"),
+            "middle.bin": (b"a" * size, middle),
+        }
+        for name, (content1, content2) in contents.items():
+            for folder, content in [(self.folder1, content1), (self.folder2, content2)]:
+                with open(os.path.join(folder, name), "wb") as file:
+                    file.write(content)
+
+        for hash_workers in [1, 2]:
+            report = foldercompare._recursive_dircmp(
+                self.folder1,
+                self.folder2,
+                compare_content=True,
+                hash_workers=hash_workers,
+            )
+            different = [
+                os.path.basename(i.split("***")[1]) for i in report["different"]
+            ]
+            identical = [
+                os.path.basename(i.split("***")[1]) for i in report["identical"]
+            ]
+            self.assertEqual(different, ["middle.bin", "size.txt", "small.txt"])
+            self.assertEqual(identical, ["empty.txt", "same.bin"])
+
+    def test_first_differing_offset(self):
+        """Large files are compared byte by byte, reporting the first change."""
+
+        size = 10 * 1024 + 7
+        content = bytes(range(256)) * (size // 256) + b"x" * (size % 256)
+        for offset in [0, 4096, size - 1, 5000]:
+            changed = bytearray(content)
+            changed[offset] ^= 0xFF
+            for folder, data in [(self.folder1, content), (self.folder2, changed)]:
+                with open(os.path.join(folder, "file.bin"), "wb") as file:
+                    file.write(data)
+
+            with mock.patch.multiple(
+                foldercompare, COMPARE_MIN_BLOCK_SIZE=1024, COMPARE_MAX_BLOCK_SIZE=4096
+            ):
+                paths = (
+                    os.path.join(self.folder1, "file.bin"),
+                    os.path.join(self.folder2, "file.bin"),
+                )
+                self.assertEqual(foldercompare._compare_files(paths), offset)
+                self.assertIsNone(foldercompare._compare_files(paths[:1] * 2))
+
+        with mock.patch.object(foldercompare, "PARTIAL_HASH_SIZE", 1024):
+            result = foldercompare.compare_trees(
+                self.folder1, self.folder2, compare_content=True, hash_workers=1
+            )
+        self.assertEqual([entry.offset for entry in result], [5000])
+
+    def test_detect_moves(self):
+        """Files of a renamed folder are reported as moved, confirmed by hash."""
+
+        size = 3 * foldercompare.PARTIAL_HASH_SIZE
+        middle = bytearray(b"a" * size)
+        middle[size // 2] = ord("b")
+        contents = {
+            os.path.join("old", "big.bin"): (b"a" * size, None),
+            os.path.join("new", "big.bin"): (None, b"a" * size),
+            os.path.join("old", "hello.txt"): (b"hello", None),
+            os.path.join("new", "hello.txt"): (None, b"hello"),
+            "copy.txt": (None, b"hello"),
+            "middle1.bin": (b"a" * size, None),
+            "middle2.bin": (None, middle),
+            "empty1.txt": (b"", None),
+            "empty2.txt": (None, b""),
+        }
+        for name, sides in contents.items():
+            for folder, content in zip([self.folder1, self.folder2], sides):
+                if content is not None:
+                    path = os.path.join(folder, name)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path, "wb") as file:
+                        file.write(content)
+
+        for hash_workers in [1, 2]:
+            result = foldercompare.compare_trees(
+                self.folder1,
+                self.folder2,
+                hash_workers=hash_workers,
+                detect_moves=True,
+            )
+            moved = [(e.relpath, e.target) for e in result.filter(status="moved")]
+            self.assertEqual(
+                moved,
+                [
+                    (os.path.join("old", "big.bin"), os.path.join("new", "big.bin")),
+                    (
+                        os.path.join("old", "hello.txt"),
+                        os.path.join("new", "hello.txt"),
+                    ),
+                ],
+            )
+            left = [entry.relpath for entry in result.filter(status="left")]
+            right = [entry.relpath for entry in result.filter(status="right")]
+            self.assertEqual(left, ["empty1.txt", "middle1.bin", "old"])
+            self.assertEqual(right, ["copy.txt", "empty2.txt", "middle2.bin", "new"])
+
+    def test_hash_cache_reused(self):
+        """Digests of unchanged files are taken from the cache on later runs."""
+
+        content = b"a" * 3 * foldercompare.PARTIAL_HASH_SIZE
+        for name in ["one.bin", "two.bin"]:
+            for folder in [self.folder1, self.folder2]:
+                with open(os.path.join(folder, name), "wb") as file:
+                    file.write(content)
+
+        database = os.path.join(os.path.dirname(self.folder1), "cache.sqlite")
+        self.addCleanup(os.remove, database)
+
+        def run():
+            with foldercompare.HashCache(database) as cache:
+                with mock.patch.object(
+                    foldercompare, "_hash_file", wraps=foldercompare._hash_file
+                ) as hash_file:
+                    report = foldercompare._recursive_dircmp(
+                        self.folder1,
+                        self.folder2,
+                        compare_content=True,
+                        hash_workers=1,
+                        cache=cache,
+                    )
+            return report, [call.args[0] for call in hash_file.call_args_list]
+
+        report, hashed = run()
+        self.assertEqual(len(report["identical"]), 2)
+        self.assertEqual(len(hashed), 8)
+
+        report, hashed = run()
+        self.assertEqual(len(report["identical"]), 2)
+        self.assertEqual(hashed, [])
+
+        changed = os.path.join(self.folder2, "two.bin")
+        with open(changed, "wb") as file:
+            file.write(content[:-1] + b"b")
+        report, hashed = run()
+        self.assertEqual(len(report["different"]), 1)
+        # The partial hash of the changed tail settles it
+        self.assertEqual(hashed, [changed])
+
+        with foldercompare.HashCache(database) as cache:
+            cache.invalidate(self.folder1)
+        report, hashed = run()
+        self.assertTrue(all(path.startswith(self.folder1) for path in hashed))
+
+    def test_hash_cache_eviction(self):
+        """The cache drops the least recently used rows beyond its size."""
+
+        database = os.path.join(self.folder1, "cache.sqlite")
+        stat = os.stat(self.folder1)
+        with foldercompare.HashCache(database, max_size=64 * 1024) as cache:
+            cache.put_many(
+                (f"file{number:05}", stat, b"p" * 20, b"f" * 20)
+                for number in range(5000)
+            )
+        with foldercompare.HashCache(database) as cache:
+            self.assertLessEqual(cache._size(), 64 * 1024)
+            self.assertEqual(cache.get("file04999", stat), (b"p" * 20, b"f" * 20))
+            cache.clear()
+            self.assertEqual(cache.get("file04999", stat), (None, None))
+
+    def test_hash_cache_flushes_hits(self):
+        """The last use of cached digests is written while the cache is open."""
+
+        database = os.path.join(self.folder1, "cache.sqlite")
+        stat = os.stat(self.folder1)
+        with foldercompare.HashCache(database) as cache:
+            cache.put_many((f"file{number}", stat, b"p", b"f") for number in range(3))
+        with (
+            mock.patch.object(foldercompare, "CACHE_FLUSH_SIZE", 2),
+            foldercompare.HashCache(database) as cache,
+        ):
+            for number in range(3):
+                cache.get(f"file{number}", stat)
+            self.assertEqual(len(cache._used), 1)
+            used = cache._connection.execute(
+                "SELECT count(*) FROM digests WHERE used = ?", (cache._run,)
+            ).fetchone()[0]
+            self.assertEqual(used, 2)
+
     def tearDown(self):
         """Delete test folders after each run."""
         shutil.rmtree(self.folder1)
         shutil.rmtree(self.folder2)
 
 
+class TestStreaming(unittest.TestCase):
+    """Test the result stream and the buffers of the report writers."""
+
+    def test_spill_buffer_order(self):
+        """Rows spilled to disk come back first and in order."""
+
+        buffer = foldercompare._SpillBuffer(limit=3)
+        self.addCleanup(buffer.close)
+        for number in range(10):
+            buffer.append(f"row{number}")
+
+        self.assertEqual(buffer.count, 10)
+        self.assertEqual(len(buffer._rows), 1)
+        self.assertEqual(list(buffer), [f"row{number}" for number in range(10)])
+
+    def test_iter_comparison_records(self):
+        """Results are yielded as records with the data of the listing."""
+
+        results = foldercompare._iter_comparison(FOLDER1, FOLDER2)
+        first = next(results)
+        self.assertEqual((first.status, first.relpath), ("left", "test_text.txt"))
+        self.assertEqual((first.size1, first.size2, first.mtime2), (0, None, None))
+        relpaths = [result.relpath for result in results]
+        self.assertIn(os.path.join("test_folder", "test_image.bmp"), relpaths)
+
+    def test_writers_use_record_sizes(self):
+        """Writers format sizes from the records without reading the disk."""
+
+        output = os.path.join(TEST_DIR, "results_records")
+        self.addCleanup(os.remove, output + ".txt")
+        self.addCleanup(os.remove, output + ".csv")
+        result = foldercompare.Entry("both", "", "missing.bin", False, 2048, 1024)
+        for writer_class in [foldercompare._PlainTextWriter, foldercompare._CsvWriter]:
+            writer = writer_class("left", "right", output)
+            writer.add(result)
+            writer.finish()
+            writer.close()
+
+        with open(output + ".txt") as file:
+            self.assertIn("2.00 KB\n", file.read())
+        with open(output + ".csv") as file:
+            self.assertIn("missing.bin,2.00 KB,", file.read())
+
+    def test_entry_reports(self):
+        """Reports with one row per entry can be queried."""
+
+        output = os.path.join(TEST_DIR, "results_entries")
+        self.addCleanup(os.remove, output + ".entries.csv")
+        self.addCleanup(os.remove, output + ".sqlite")
+        foldercompare.compare(
+            FOLDER1,
+            FOLDER2,
+            output,
+            compare_content=True,
+            hash_workers=1,
+            output_entries=True,
+            output_sqlite=True,
+        )
+        expected = foldercompare.compare_trees(
+            FOLDER1, FOLDER2, compare_content=True, hash_workers=1
+        )
+
+        with open(output + ".entries.csv", newline="") as file:
+            rows = list(csv.DictReader(file))
+        self.assertEqual(len(rows), len(expected))
+        self.assertEqual(
+            [(row["status"], row["path"]) for row in rows],
+            [(entry.status, entry.relpath) for entry in expected],
+        )
+
+        connection = sqlite3.connect(output + ".sqlite")
+        self.addCleanup(connection.close)
+        counts = dict(
+            connection.execute("SELECT status, count(*) FROM entries GROUP BY status")
+        )
+        self.assertEqual(
+            counts, {status: n for status, n in expected.counts().items() if n}
+        )
+        plan = connection.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM entries WHERE path = ?", ("x",)
+        ).fetchall()
+        self.assertIn("entries_path", str(plan))
+
+    def test_compare_fills_result(self):
+        """A viewer gets the entries of `compare` in a ComparisonResult."""
+
+        output = os.path.join(TEST_DIR, "results_viewer")
+        self.addCleanup(os.remove, output + ".txt")
+        result = foldercompare.ComparisonResult(FOLDER1, FOLDER2)
+        foldercompare.compare(FOLDER1, FOLDER2, output, True, result=result)
+        self.assertEqual(
+            list(result), list(foldercompare.compare_trees(FOLDER1, FOLDER2))
+        )
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "needs pyarrow")
+    def test_parquet_report(self):
+        """The '.parquet' report has the rows of the other entry reports."""
+
+        import pyarrow.parquet
+
+        output = os.path.join(TEST_DIR, "results_parquet")
+        self.addCleanup(os.remove, output + ".parquet")
+        foldercompare.compare(FOLDER1, FOLDER2, output, output_parquet=True)
+        table = pyarrow.parquet.read_table(output + ".parquet")
+        self.assertEqual(table.column_names, list(foldercompare.ENTRY_COLUMNS))
+        self.assertEqual(
+            table.column("path").to_pylist(),
+            [entry.relpath for entry in foldercompare.compare_trees(FOLDER1, FOLDER2)],
+        )
+
+    def test_progress_reported(self):
+        """The progress callback ends with the totals of the comparison."""
+
+        snapshots = []
+        result = foldercompare.compare_trees(
+            FOLDER1, FOLDER2, progress=snapshots.append
+        )
+
+        last = snapshots[-1]
+        self.assertTrue(last.done)
+        self.assertEqual((last.files, last.dirs_queued), (len(result), 0))
+        self.assertEqual((last.fraction, last.eta), (1.0, 0.0))
+        self.assertEqual(last.bytes, sum(entry.size or 0 for entry in result))
+
+    def test_cancel_removes_reports(self):
+        """A cancelled comparison raises and leaves no partial report."""
+
+        output = os.path.join(TEST_DIR, "results_cancelled")
+        cancel = threading.Event()
+        cancel.set()
+        with self.assertRaises(foldercompare.Cancelled):
+            foldercompare.compare(FOLDER1, FOLDER2, output, True, True, cancel=cancel)
+        self.assertFalse(os.path.exists(output + ".txt"))
+        self.assertFalse(os.path.exists(output + ".csv"))
+
+    def test_stats_collected(self):
+        """Stats time every phase and count listings, reads and cache hits."""
+
+        output = os.path.join(TEST_DIR, "results_stats")
+        path = os.path.join(TEST_DIR, "results_stats.sqlite")
+        self.addCleanup(os.remove, output + ".txt")
+        self.addCleanup(os.remove, path)
+        with foldercompare.HashCache(path) as cache:
+            first = foldercompare.compare_trees(
+                FOLDER1, FOLDER2, True, True, hash_workers=1, cache=cache
+            )
+            stats = foldercompare.Stats()
+            returned = foldercompare.compare(
+                FOLDER1,
+                FOLDER2,
+                output,
+                output_txt=True,
+                compare_content=True,
+                hash_workers=1,
+                cache=cache,
+                stats=stats,
+            )
+
+        self.assertIs(returned, stats)
+        self.assertEqual(set(stats.phases), {"open", "walk", "content", "report"})
+        self.assertEqual((stats.dirs, stats.dirs_listed), (2, 4))
+        self.assertEqual(stats.files, len(first))
+        self.assertEqual(stats.files_listed, 11)
+        # Digests of the first run are reused, nothing is read again
+        self.assertEqual((stats.files_hashed, stats.bytes_hashed), (0, 0))
+        self.assertEqual(stats.cache_hit_rate, 1.0)
+        self.assertEqual(json.loads(json.dumps(stats.as_dict()))["dirs"], 2)
+
+    def test_hard_links_not_read(self):
+        """Hard links to the same file are identical without reading them."""
+
+        folder = os.path.join(TEST_DIR, "results_links")
+        self.addCleanup(shutil.rmtree, folder)
+        left, right = os.path.join(folder, "left"), os.path.join(folder, "right")
+        os.makedirs(left)
+        os.makedirs(right)
+        with open(os.path.join(left, "linked.bin"), "wb") as file:
+            file.write(os.urandom(4096))
+        os.link(os.path.join(left, "linked.bin"), os.path.join(right, "linked.bin"))
+
+        stats = foldercompare.Stats()
+        result = foldercompare.compare_trees(
+            left, right, compare_content=True, hash_workers=1, stats=stats
+        )
+        self.assertEqual([entry.status for entry in result], ["identical"])
+        self.assertEqual(stats.bytes_skipped, 2 * 4096)
+        self.assertEqual((stats.files_hashed, stats.bytes_compared), (0, 0))
+
+    @unittest.skipUnless(importlib.util.find_spec("fcntl"), "needs fcntl")
+    def test_shared_extents_trusted(self):
+        """Extents are synced first and encoded ones never make clones."""
+
+        def fiemap(flags):
+            def ioctl(file, request, buffer):
+                requests.append(struct.unpack_from("=L", buffer, 16)[0])
+                struct.pack_into("=L", buffer, 20, 1)
+                struct.pack_into("=QQQQQL", buffer, 32, 0, 8192, 4096, 0, 0, flags)
+
+            return ioctl
+
+        paths = (os.path.join(FOLDER1, "test_text.txt"),) * 2
+        for flags, shared in (
+            (foldercompare.FIEMAP_EXTENT_LAST, True),
+            (foldercompare.FIEMAP_EXTENT_LAST | 0x8, False),
+        ):
+            requests = []
+            with mock.patch("fcntl.ioctl", fiemap(flags)):
+                self.assertEqual(foldercompare._shared_extents(paths), shared)
+            self.assertEqual(requests, [foldercompare.FIEMAP_FLAG_SYNC] * 2)
+
+    def test_batch_hashes_shared_files_once(self):
+        """A file of several pairs of a batch is hashed by one of them."""
+
+        folder = os.path.join(TEST_DIR, "results_shared")
+        self.addCleanup(shutil.rmtree, folder)
+        contents = {"f{}.bin".format(number): os.urandom(1000) for number in range(3)}
+        jobs = []
+        for side in ["left", "right0", "right1", "right2", "right3"]:
+            os.makedirs(os.path.join(folder, side))
+            for name, data in contents.items():
+                with open(os.path.join(folder, side, name), "wb") as file:
+                    file.write(data)
+            if side != "left":
+                jobs.append(
+                    (
+                        os.path.join(folder, "left"),
+                        os.path.join(folder, side),
+                        os.path.join(folder, side + "_report"),
+                    )
+                )
+
+        document = foldercompare.compare_batch(
+            jobs,
+            parallel=4,
+            compare_content=True,
+            hash_workers=1,
+            cache=os.path.join(folder, "cache.sqlite"),
+        )
+        self.assertEqual(document["statuses"]["identical"], 12)
+        # Each right folder once and the left folder once, not once per pair
+        self.assertEqual(
+            sum(pair["bytes_hashed"] for pair in document["pairs"]), 5 * 3000
+        )
+
+    def test_batch_corrupt_archive(self):
+        """A corrupt archive fails its pair only, the other pairs are kept."""
+
+        folder = os.path.join(TEST_DIR, "results_corrupt")
+        os.makedirs(folder)
+        self.addCleanup(shutil.rmtree, folder)
+        archive = os.path.join(folder, "archive.tar.gz")
+        with tarfile.open(archive, "w:gz") as tar:
+            tar.add(FOLDER1, "folder1")
+        with open(archive, "rb") as file:
+            data = file.read()
+        with open(archive, "wb") as file:
+            file.write(data[: len(data) // 2])
+
+        document = foldercompare.compare_batch(
+            [
+                (FOLDER1, FOLDER2, os.path.join(folder, "good")),
+                (FOLDER1, archive, os.path.join(folder, "corrupt")),
+            ],
+            output_txt=True,
+        )
+        good, corrupt = document["pairs"]
+        self.assertIsNone(good["error"])
+        self.assertEqual(
+            good["statuses"], foldercompare.compare_trees(FOLDER1, FOLDER2).counts()
+        )
+        self.assertTrue(corrupt["error"].startswith("ReadError: "))
+        self.assertEqual(document["errors"], 1)
+
+    def test_delta_report(self):
+        """Only the entries that changed since the previous run are reported."""
+
+        folder = os.path.join(TEST_DIR, "results_delta")
+        self.addCleanup(shutil.rmtree, folder)
+        left, right = os.path.join(folder, "left"), os.path.join(folder, "right")
+        output = os.path.join(folder, "report")
+        for path, data in (
+            (os.path.join(left, "kept.txt"), b"kept"),
+            (os.path.join(right, "kept.txt"), b"kept"),
+            (os.path.join(left, "removed.txt"), b"removed"),
+            (os.path.join(left, "changed.txt"), b"changed"),
+        ):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(data)
+
+        foldercompare.compare(left, right, output, delta=True)
+        with open(output + ".delta.txt") as file:
+            self.assertIn("No previous run, 3 entries saved", file.read())
+
+        os.remove(os.path.join(left, "removed.txt"))
+        shutil.copy(os.path.join(left, "changed.txt"), right)
+        with open(os.path.join(right, "new.txt"), "wb") as file:
+            file.write(b"new")
+        foldercompare.compare(left, right, output, delta=True)
+
+        with open(output + ".delta.txt") as file:
+            lines = file.read().split("\n\n\n")[1:]
+        sections = [
+            [line.split("|")[0].strip() for line in section.splitlines()]
+            for section in lines
+        ]
+        self.assertEqual(
+            sections,
+            [
+                ["NEW ENTRIES:", "new.txt"],
+                ["REMOVED ENTRIES:", "removed.txt"],
+                ["CHANGED ENTRIES:", "changed.txt"],
+            ],
+        )
+        self.assertFalse(os.path.exists(output + ".state.new"))
+
+        foldercompare.compare(right, left, output, delta=True)
+        with open(output + ".delta.txt") as file:
+            report = file.read()
+        self.assertIn("WARNING: the previous run compared", report)
+        self.assertIn("No previous run, 3 entries saved", report)
+        self.assertNotIn("NEW ENTRIES:", report)
+
+    def test_writer_closed_on_failed_init(self):
+        """A writer that fails to start closes what it already opened."""
+
+        files = []
+
+        def record(*args, **kwargs):
+            files.append(open(*args, **kwargs))
+            return files[-1]
+
+        output = os.path.join(TEST_DIR, "results_failed")
+        self.addCleanup(os.remove, output + ".delta.txt")
+        with (
+            mock.patch.object(foldercompare, "open", record, create=True),
+            mock.patch.object(
+                foldercompare.sqlite3, "connect", side_effect=sqlite3.Error
+            ),
+            self.assertRaises(sqlite3.Error),
+        ):
+            foldercompare.compare(FOLDER1, FOLDER2, output, delta=True)
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].closed)
+
+    def test_compare_async(self):
+        """The async iterator yields the entries and stops when left early."""
+
+        expected = list(foldercompare.compare_trees(FOLDER1, FOLDER2))
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+
+        async def collect(limit=None):
+            entries = []
+            results = foldercompare.compare_async(
+                FOLDER1, FOLDER2, executor=executor, max_pending=1
+            )
+            async with contextlib.aclosing(results):
+                async for entry in results:
+                    entries.append(entry)
+                    if len(entries) == limit:
+                        break
+            return entries
+
+        self.assertEqual(asyncio.run(collect()), expected)
+        self.assertEqual(asyncio.run(collect(limit=1)), expected[:1])
+        # The abandoned comparison gave its thread back
+        self.assertEqual(executor.submit(len, "done").result(timeout=5), 4)
+
+
+class TestComparisonResult(unittest.TestCase):
+    """Test the ComparisonResult model."""
+
+    def setUp(self):
+        self.result = foldercompare.compare_trees(
+            FOLDER1, FOLDER2, compare_content=True, hash_workers=1
+        )
+
+    def test_directory_table(self):
+        """Directories are stored once and entries rebuilt from the columns."""
+
+        self.assertEqual(self.result.dirs, ["", "test_folder"])
+        self.assertEqual(len(self.result), 7)
+        self.assertEqual(
+            list(self.result),
+            list(
+                foldercompare._iter_comparison(
+                    FOLDER1, FOLDER2, compare_content=True, hash_workers=1
+                )
+            ),
+        )
+        self.assertEqual(
+            self.result[-1].relpath, os.path.join("test_folder", "test_folder_text.txt")
+        )
+
+    def test_filter_and_counts(self):
+        """Entries can be filtered by status, pattern and size."""
+
+        self.assertEqual(
+            self.result.counts(),
+            {
+                "left": 3,
+                "right": 0,
+                "both": 0,
+                "identical": 3,
+                "different": 1,
+                "moved": 0,
+            },
+        )
+        different = list(self.result.filter(status="different"))
+        self.assertEqual([entry.name for entry in different], ["test_zip.zip"])
+        self.assertEqual(
+            self.result.paths(different[0]),
+            (
+                os.path.join(FOLDER1, "test_zip.zip"),
+                os.path.join(FOLDER2, "test_zip.zip"),
+            ),
+        )
+        names = [
+            entry.name for entry in self.result.filter(pattern="*.txt", max_size=0)
+        ]
+        self.assertEqual(names, ["test_text.txt", "test_folder_text.txt"])
+        big = self.result.filter(status=["left", "identical"], min_size=10_000)
+        self.assertEqual([entry.name for entry in big], ["test_powerpoint.pptx"])
+
+
+class TestManifest(unittest.TestCase):
+    """Test writing manifests and comparing against them."""
+
+    def setUp(self):
+        self.manifest1 = os.path.join(TEST_DIR, "results1.fcm")
+        self.manifest2 = os.path.join(TEST_DIR, "results2.fcm")
+        foldercompare.write_manifest(FOLDER1, self.manifest1, hash_workers=1)
+        foldercompare.write_manifest(FOLDER2, self.manifest2, hash_workers=1)
+        self.addCleanup(os.remove, self.manifest1)
+        self.addCleanup(os.remove, self.manifest2)
+
+    def test_manifest_as_either_side(self):
+        """A manifest gives the same result as the folder it was written from."""
+
+        expected = list(
+            foldercompare.compare_trees(FOLDER1, FOLDER2, compare_content=True)
+        )
+        for folder1, folder2 in [
+            (self.manifest1, FOLDER2),
+            (FOLDER1, self.manifest2),
+            (self.manifest1, self.manifest2),
+        ]:
+            result = foldercompare.compare_trees(
+                folder1, folder2, compare_content=True, hash_workers=1
+            )
+            self.assertEqual(list(result), expected)
+
+    def test_manifest_against_zip(self):
+        """Members are decompressed to compare them with full digests."""
+
+        archive = os.path.join(FOLDER2, "test_zip.zip")
+        folder = os.path.join("tests", "results_zip")
+        self.addCleanup(shutil.rmtree, folder)
+        with zipfile.ZipFile(archive) as zip_file:
+            zip_file.extractall(folder)
+        with open(os.path.join(folder, "test_zip", "test_image.bmp"), "r+b") as file:
+            file.write(b"XX")
+        foldercompare.write_manifest(folder, self.manifest2, hash_workers=1)
+
+        for hash_workers in (1, 2):
+            result = foldercompare.compare_trees(
+                archive, self.manifest2, compare_content=True, hash_workers=hash_workers
+            )
+            self.assertEqual(
+                [(entry.status, entry.name) for entry in result],
+                [
+                    ("different", "test_image.bmp"),
+                    ("identical", "test_zip_excel.xlsx"),
+                    ("identical", "test_zip_word.docx"),
+                ],
+            )
+
+    def test_manifest_without_digests(self):
+        """Content cannot be compared against a manifest without digests."""
+
+        foldercompare.write_manifest(FOLDER2, self.manifest2, digests=False)
+        result = foldercompare.compare_trees(FOLDER1, self.manifest2)
+        self.assertEqual(result.counts()["both"], 4)
+        with self.assertRaises(ValueError):
+            foldercompare.compare_trees(
+                FOLDER1, self.manifest2, compare_content=True, hash_workers=1
+            )
+
+
+class TestCommandLine(unittest.TestCase):
+    """Test the JSON Lines command line."""
+
+    def run_main(self, *argv):
+        """Run the command line and return its exit status and output lines."""
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            status = foldercompare.main(list(argv))
+        return status, stdout.getvalue().splitlines()
+
+    def test_json_lines(self):
+        """Every result is a JSON line and differences exit with 1."""
+
+        status, lines = self.run_main(FOLDER1, FOLDER2)
+        records = [json.loads(line) for line in lines]
+        expected = list(foldercompare._iter_comparison(FOLDER1, FOLDER2))
+        self.assertEqual(status, 1)
+        self.assertEqual(records, [entry.as_dict() for entry in expected])
+
+    def test_exit_status(self):
+        """Identical folders exit with 0, errors with 2."""
+
+        self.assertEqual(self.run_main("-q", "--content", FOLDER1, FOLDER1), (0, []))
+        status, lines = self.run_main(FOLDER1, os.path.join(TEST_DIR, "missing"))
+        self.assertEqual((status, lines), (2, []))
+
+        archive = os.path.join(TEST_DIR, "results_truncated.tar.gz")
+        self.addCleanup(os.remove, archive)
+        with tarfile.open(archive, "w:gz") as tar:
+            tar.add(FOLDER1, "folder1")
+        with open(archive, "r+b") as file:
+            file.truncate(os.path.getsize(archive) // 2)
+        self.assertEqual(self.run_main(FOLDER1, archive), (2, []))
+
+    def test_broken_pipe(self):
+        """A reader closing the output early, like `head`, exits quietly."""
+
+        read, write = os.pipe()
+        os.close(read)
+        stderr = io.StringIO()
+        with (
+            open(write, "w") as stdout,
+            contextlib.redirect_stdout(stdout),
+            contextlib.redirect_stderr(stderr),
+        ):
+            status = foldercompare.main([FOLDER1, FOLDER2])
+        self.assertEqual((status, stderr.getvalue()), (141, ""))
+
+    def test_clear_cache(self):
+        """The cache is emptied before comparing with --clear-cache."""
+
+        database = os.path.join(TEST_DIR, "results_clear.sqlite")
+        self.addCleanup(os.remove, database)
+        with foldercompare.HashCache(database) as cache:
+            cache.put_many([("stale", os.stat(FOLDER1), b"p", b"f")])
+
+        self.run_main("-q", "--cache", database, "--clear-cache", FOLDER1, FOLDER2)
+        with foldercompare.HashCache(database) as cache:
+            self.assertEqual(cache.get("stale", os.stat(FOLDER1)), (None, None))
+        with self.assertRaises(SystemExit):
+            self.run_main("--clear-cache", FOLDER1, FOLDER2)
+
+    def test_options_of_comparisons_only(self):
+        """Statistics need a single pair and a delta needs a batch."""
+
+        for option in ("--batch", "--write-manifest"):
+            with self.assertRaises(SystemExit) as raised:
+                self.run_main(FOLDER1, option, "out", "--stats", "stats.json")
+            self.assertEqual(raised.exception.code, 2)
+        with self.assertRaises(SystemExit) as raised:
+            self.run_main(FOLDER1, FOLDER2, "--delta")
+        self.assertEqual(raised.exception.code, 2)
+
+    def test_status_filter(self):
+        """Only the asked statuses are written."""
+
+        _, lines = self.run_main("--status", "left", FOLDER1, FOLDER2)
+        self.assertTrue(lines)
+        self.assertEqual({json.loads(line)["status"] for line in lines}, {"left"})
+
+    def test_batch(self):
+        """Pairs of a job file get their reports and a combined summary."""
+
+        folder = os.path.join(TEST_DIR, "results_batch")
+        os.makedirs(folder)
+        self.addCleanup(shutil.rmtree, folder)
+        jobs = os.path.join(folder, "jobs.jsonl")
+        with open(jobs, "w") as file:
+            for folder1, folder2, output in (
+                (FOLDER1, FOLDER2, "differ"),
+                (FOLDER1, FOLDER1, "same"),
+                (FOLDER1, os.path.join(TEST_DIR, "missing"), "missing"),
+            ):
+                job = {"folder1": folder1, "folder2": folder2, "output": output}
+                file.write(json.dumps(job) + "\n\n")
+        summary = os.path.join(folder, "summary.json")
+
+        status, lines = self.run_main(
+            "--batch", summary, "--content", "--hash-workers", "2", jobs
+        )
+        self.assertEqual(status, 2)
+        self.assertEqual(len(lines), 3)
+        with open(summary) as file:
+            document = json.load(file)
+        differ, same, missing = document["pairs"]
+        expected = foldercompare.compare_trees(FOLDER1, FOLDER2, compare_content=True)
+        self.assertEqual(differ["statuses"], expected.counts())
+        self.assertEqual(same["statuses"]["identical"], same["files"])
+        self.assertIsNotNone(missing["error"])
+        self.assertEqual(document["errors"], 1)
+        self.assertEqual(
+            sorted(os.listdir(folder)),
+            [
+                "differ.csv",
+                "differ.txt",
+                "jobs.jsonl",
+                "same.csv",
+                "same.txt",
+                "summary.json",
+            ],
+        )
+
+
+class TestZipTree(unittest.TestCase):
+    """Test comparing '.zip' files without extracting them."""
+
+    zip1 = os.path.join(FOLDER1, "test_zip.zip")
+    zip2 = os.path.join(FOLDER2, "test_zip.zip")
+
+    def test_zip_listing(self):
+        """Members are classified straight from the archive listing."""
+
+        report = foldercompare._recursive_dircmp(
+            self.zip1, self.zip2, self.zip1, self.zip2, compare_content=True
+        )
+        self.assertEqual(report["left"], [])
+        self.assertEqual(
+            report["right"], [os.path.join(self.zip2, "test_zip", "test_image.bmp")]
+        )
+        self.assertEqual(len(report["both"]), 2)
+        self.assertEqual(report["identical"], report["both"])
+        self.assertFalse(os.path.exists(os.path.join(FOLDER1, "folder1")))
+
+    def test_zip_against_directory(self):
+        """Members are compared by CRC-32 with files of a directory."""
+
+        folder = os.path.join("tests", "results_zip")
+        self.addCleanup(shutil.rmtree, folder)
+        with zipfile.ZipFile(self.zip2) as archive:
+            archive.extractall(folder)
+        # Same size, different content: only the CRC-32 tells them apart
+        with open(
+            os.path.join(folder, "test_zip", "test_zip_word.docx"), "r+b"
+        ) as file:
+            file.seek(-1, os.SEEK_END)
+            last = file.read(1)[0]
+            file.seek(-1, os.SEEK_END)
+            file.write(bytes([last ^ 0xFF]))
+
+        report = foldercompare._recursive_dircmp(
+            self.zip2, folder, compare_content=True, hash_workers=1
+        )
+        self.assertEqual(report["left"] + report["right"], [])
+        self.assertEqual(len(report["identical"]), 2)
+        self.assertIn("test_zip_word.docx", report["different"][0])
+
+    def test_prune_identical_subtrees(self):
+        """Sub folders with the same Merkle digest are not walked."""
+
+        folder = os.path.join("tests", "results_prune")
+        os.makedirs(folder)
+        self.addCleanup(shutil.rmtree, folder)
+        paths = []
+        for number, changed in enumerate((b"old", b"new")):
+            path = os.path.join(folder, "{}.zip".format(number))
+            with zipfile.ZipFile(path, "w") as archive:
+                archive.writestr("same/a.txt", b"a")
+                archive.writestr("same/sub/b.txt", b"b")
+                archive.writestr("changed/c.txt", changed)
+            paths.append(path)
+
+        expected = [
+            ("identical", "same", True),
+            ("different", os.path.join("changed", "c.txt"), False),
+        ]
+        result = foldercompare.compare_trees(*paths, compare_content=True, prune=True)
+        self.assertEqual(
+            [(entry.status, entry.relpath, entry.is_dir) for entry in result],
+            expected,
+        )
+
+        # Manifests record the digests of the archive they were written from
+        manifest = foldercompare.write_manifest(paths[0], os.path.join(folder, "0"))
+        self.assertEqual(manifest, os.path.join(folder, "0.fcm"))
+        tree = foldercompare._ManifestTree(manifest)
+        computed = foldercompare._ZipTree(paths[0])
+        self.assertEqual(
+            tree.merkle,
+            {
+                reldir: foldercompare._merkle_digest(computed, reldir)
+                for reldir in tree.merkle
+            },
+        )
+        self.assertEqual(len(tree.merkle), 4)
+        result = foldercompare.compare_trees(
+            manifest, paths[1], compare_content=True, prune=True
+        )
+        self.assertEqual(
+            [(entry.status, entry.relpath, entry.is_dir) for entry in result],
+            expected,
+        )
+
+    def test_nested_archives(self):
+        """Archives in both folders are walked in memory, nested ones too."""
+
+        folder = os.path.join("tests", "results_archives")
+        self.addCleanup(shutil.rmtree, folder)
+        folders = []
+        for side, changed in (("left", b"old"), ("right", b"new")):
+            path = os.path.join(folder, side)
+            os.makedirs(path)
+            tar_data = io.BytesIO()
+            with tarfile.open(fileobj=tar_data, mode="w:gz") as archive:
+                for name, data in (("a.txt", b"a"), ("sub/b.txt", changed)):
+                    info = tarfile.TarInfo(name)
+                    info.size = len(data)
+                    archive.addfile(info, io.BytesIO(data))
+            zip_data = io.BytesIO()
+            with zipfile.ZipFile(zip_data, "w") as archive:
+                archive.writestr("c.txt", changed)
+            with zipfile.ZipFile(os.path.join(path, "outer.zip"), "w") as archive:
+                archive.writestr("inner.tar.gz", tar_data.getvalue())
+                archive.writestr("nested.zip", zip_data.getvalue())
+            folders.append(path)
+
+        result = foldercompare.compare_trees(*folders, compare_content=True)
+        self.assertEqual(
+            [(entry.status, entry.relpath) for entry in result],
+            [("different", "outer.zip")],
+        )
+        for workers in (1, 2):
+            result = foldercompare.compare_trees(
+                *folders,
+                workers=workers,
+                compare_content=True,
+                hash_workers=1,
+                archives=True,
+            )
+            self.assertEqual(
+                [(entry.status, entry.relpath) for entry in result],
+                [
+                    ("identical", os.path.join("outer.zip", "inner.tar.gz", "a.txt")),
+                    (
+                        "different",
+                        os.path.join("outer.zip", "inner.tar.gz", "sub", "b.txt"),
+                    ),
+                    ("different", os.path.join("outer.zip", "nested.zip", "c.txt")),
+                ],
+            )
+
+        # Comparing names and sizes does not fingerprint the '.tar' members
+        with mock.patch.object(foldercompare, "_new_hash") as new_hash:
+            result = foldercompare.compare_trees(*folders, archives=True)
+        new_hash.assert_not_called()
+        self.assertEqual(result.counts()["both"], 3)
+
+
 def test_create_txt(txt_file_content):
     """Can create a single TXT file, identical to the control."""
 
@@ -152,5 +1236,25 @@ def test_create_both(csv_file_content, txt_file_content):
             os.remove(path)
 
 
+def test_create_txt_with_content():
+    """Files whose content differs get their own TXT section."""
+
+    foldercompare.compare(
+        FOLDER1, FOLDER2, RESULTS_FILE, output_txt=True, compare_content=True
+    )
+
+    with open(f"{RESULTS_FILE}.txt") as result:
+        data = result.read()
+
+    section = data.split("FILES WITH DIFFERENT CONTENT:\n")[1]
+    assert section.splitlines()[0].split("|")[0].strip() == os.path.join(
+        FOLDER1, "test_zip.zip"
+    )
+    assert len(section.strip().splitlines()) == 2
+
+    if os.path.exists(f"{RESULTS_FILE}.txt"):
+        os.remove(f"{RESULTS_FILE}.txt")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,72 @@
+"""Test the gui.py module, without a display."""
+
+import os
+import unittest
+from unittest import mock
+
+import foldercompare
+
+try:
+    import gui
+except ImportError:
+    gui = None
+
+
+@unittest.skipIf(gui is None, "needs tkinter")
+class TestResultIndex(unittest.TestCase):
+    """Test indexing and filtering a result while it is filled."""
+
+    def setUp(self):
+        self.result = foldercompare.ComparisonResult("left", "right")
+        for entry in [
+            foldercompare.Entry("left", "", "notes.txt", size1=10),
+            foldercompare.Entry("both", "src", "Main.py", size1=300, size2=200),
+            foldercompare.Entry(
+                "right", os.path.join("src", "lib"), "util.py", size2=5
+            ),
+        ]:
+            self.result.append(entry)
+
+    def test_update_counts_new_entries(self):
+        """Only the entries appended since the last update are indexed."""
+
+        index = gui.ResultIndex(self.result)
+        self.assertEqual(index.update(), range(0, 3))
+        self.result.append(foldercompare.Entry("identical", "src", "main.c", size1=1))
+        self.assertEqual(index.update(), range(3, 4))
+
+        self.assertEqual(index.count, 4)
+        self.assertEqual(index.entries["src"].tolist(), [1, 3])
+        self.assertEqual(index.subdirs[""], ["src"])
+        self.assertEqual(index.subdirs["src"], ["lib"])
+        counts = dict(zip(foldercompare.STATUSES, map(len, index.by_status)))
+        self.assertEqual(counts, self.result.counts())
+
+    def test_matching(self):
+        """Entries are matched by name, status and size of either side."""
+
+        index = gui.ResultIndex(self.result)
+        everything = index.update()
+        for query, expected in (
+            ({"name": "main"}, [1]),
+            ({"name": ".py", "status": "right"}, [2]),
+            ({"min_size": 10}, [0, 1]),
+            ({"status": "moved"}, []),
+        ):
+            self.assertEqual(index.matching(everything, **query).tolist(), expected)
+
+    def test_iter_matching_in_chunks(self):
+        """Matches come a chunk at a time, with the entries indexed meanwhile."""
+
+        index = gui.ResultIndex(self.result)
+        index.update()
+        with mock.patch.object(gui, "FILTER_CHUNK", 2):
+            chunks = index.iter_matching(range(index.count), name=".py")
+            self.assertEqual(next(chunks).tolist(), [1])
+            self.result.append(foldercompare.Entry("left", "", "new.py", size1=1))
+            index.update()
+            self.assertEqual([chunk.tolist() for chunk in chunks], [[2], [3]])
+
+
+if __name__ == "__main__":
+    unittest.main()